@@ -0,0 +1,240 @@
+"""
+ベンチマーク用の軽量な Discord オブジェクト。
+Cog が参照する属性とメソッドだけを持ち、API には一切接続しません。
+"""
+import time
+import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+class FakeRole:
+    def __init__(self, id: int, name: str, guild: "FakeGuild"):
+        self.id = id
+        self.name = name
+        self.guild = guild
+        self.members: List["FakeMember"] = []
+
+    @property
+    def mention(self) -> str:
+        return f"<@&{self.id}>"
+
+    def __eq__(self, other):
+        return isinstance(other, FakeRole) and other.id == self.id
+
+    def __hash__(self):
+        return hash(self.id)
+
+class FakeMember:
+    def __init__(self, id: int, name: str, guild: "FakeGuild", roles: Iterable[FakeRole] = (), bot: bool = False):
+        self.id = id
+        self.name = name
+        self.display_name = name
+        self.guild = guild
+        self.roles = list(roles)
+        self.bot = bot
+        for r in self.roles:
+            r.members.append(self)
+
+    @property
+    def mention(self) -> str:
+        return f"<@{self.id}>"
+
+    def __eq__(self, other):
+        return isinstance(other, FakeMember) and other.id == self.id
+
+    def __hash__(self):
+        return hash(self.id)
+
+class FakeMessage:
+    def __init__(self, id: int, channel, author, content: str = "", embeds: Optional[list] = None):
+        self.id = id
+        self.channel = channel
+        self.author = author
+        self.content = content
+        self.embeds = embeds or []
+        self.created_at = datetime.datetime.now(datetime.timezone.utc)
+
+    async def edit(self, **kwargs):
+        return self
+
+class FakeTextChannel:
+    def __init__(self, id: int, name: str, guild: "FakeGuild", category=None):
+        self.id = id
+        self.name = name
+        self.guild = guild
+        self.category = category
+        self.overwrites: Dict[Any, Any] = {}
+        self.sent: List[FakeMessage] = []
+
+    @property
+    def mention(self) -> str:
+        return f"<#{self.id}>"
+
+    async def send(self, content=None, **kwargs):
+        msg = FakeMessage(time.time_ns(), self, self.guild.me, content or "", [kwargs["embed"]] if kwargs.get("embed") else None)
+        self.sent.append(msg)
+        return msg
+
+    async def fetch_message(self, msg_id: int):
+        return FakeMessage(msg_id, self, self.guild.me)
+
+    def get_partial_message(self, msg_id: int):
+        return FakeMessage(msg_id, self, self.guild.me)
+
+class FakeThread(FakeTextChannel):
+    def __init__(self, id: int, name: str, guild: "FakeGuild", parent: "FakeForumChannel"):
+        super().__init__(id, name, guild)
+        self.parent = parent
+        self.parent_id = parent.id
+        self.archived = False
+
+    async def edit(self, **kwargs):
+        for k, v in kwargs.items():
+            setattr(self, k, v)
+        return self
+
+class FakeForumChannel:
+    def __init__(self, id: int, name: str, guild: "FakeGuild"):
+        self.id = id
+        self.name = name
+        self.guild = guild
+        self.threads: List[FakeThread] = []
+
+    @property
+    def mention(self) -> str:
+        return f"<#{self.id}>"
+
+    def archived_threads(self, limit=None):
+        async def gen():
+            return
+            yield
+        return gen()
+
+class FakeCategory:
+    def __init__(self, id: int, name: str, guild: "FakeGuild"):
+        self.id = id
+        self.name = name
+        self.guild = guild
+        self.text_channels: List[FakeTextChannel] = []
+
+class FakeGuild:
+    """ギルド1件分。チャンネルとスレッドは ID で引けるように辞書で持ちます。"""
+    filesize_limit = 25 * 1024 * 1024
+
+    def __init__(self, id: int, name: str = ""):
+        self.id = id
+        self.name = name or f"guild-{id}"
+        self.roles: Dict[int, FakeRole] = {}
+        self.members: Dict[int, FakeMember] = {}
+        self.channels: Dict[int, Any] = {}
+        self.threads: Dict[int, FakeThread] = {}
+        self.me = FakeMember(1, "bot", self, bot=True)
+        self.default_role = self.add_role(id, "@everyone")
+
+    # --- 構築用 ---
+    def add_role(self, id: int, name: str) -> FakeRole:
+        role = self.roles[id] = FakeRole(id, name, self)
+        return role
+
+    def add_member(self, id: int, name: str, roles: Iterable[FakeRole] = ()) -> FakeMember:
+        member = self.members[id] = FakeMember(id, name, self, roles)
+        return member
+
+    def add_channel(self, channel):
+        self.channels[channel.id] = channel
+        if isinstance(channel, FakeThread):
+            self.threads[channel.id] = channel
+            channel.parent.threads.append(channel)
+        return channel
+
+    # --- discord.Guild 互換 ---
+    @property
+    def categories(self) -> List[FakeCategory]:
+        return [c for c in self.channels.values() if isinstance(c, FakeCategory)]
+
+    def get_role(self, id: int) -> Optional[FakeRole]:
+        return self.roles.get(id)
+
+    def get_member(self, id: int) -> Optional[FakeMember]:
+        return self.members.get(id)
+
+    def get_channel(self, id: int):
+        ch = self.channels.get(id)
+        return None if isinstance(ch, FakeThread) else ch
+
+    def get_thread(self, id: int) -> Optional[FakeThread]:
+        return self.threads.get(id)
+
+    def get_channel_or_thread(self, id: int):
+        return self.channels.get(id)
+
+    async def fetch_channel(self, id: int):
+        ch = self.channels.get(id)
+        if ch is None:
+            import discord
+            raise discord.NotFound(_FakeResponse(404), "Unknown Channel")
+        return ch
+
+    async def fetch_member(self, id: int) -> Optional[FakeMember]:
+        return self.members.get(id)
+
+class _FakeResponse:
+    def __init__(self, status: int):
+        self.status = status
+        self.reason = "Not Found"
+
+class FakeInteractionResponse:
+    def __init__(self):
+        self.calls: List[tuple] = []
+
+    async def defer(self, **kwargs):
+        self.calls.append(("defer", kwargs))
+
+    async def send_message(self, *args, **kwargs):
+        self.calls.append(("send_message", kwargs))
+
+    async def edit_message(self, **kwargs):
+        self.calls.append(("edit_message", kwargs))
+
+class FakeFollowup:
+    def __init__(self):
+        self.sent: List[dict] = []
+
+    async def send(self, content=None, **kwargs):
+        kwargs["content"] = content
+        self.sent.append(kwargs)
+
+class FakeInteraction:
+    def __init__(self, client, guild: FakeGuild, channel, user: Optional[FakeMember] = None):
+        self.client = client
+        self.guild = guild
+        self.guild_id = guild.id
+        self.channel = channel
+        self.channel_id = channel.id
+        self.user = user or guild.me
+        self.response = FakeInteractionResponse()
+        self.followup = FakeFollowup()
+
+class FakeBot:
+    """Cog の構築に必要な属性 (persistence 等) だけを持つ bot。"""
+    def __init__(self, persistence):
+        self.persistence = persistence
+        self.cached_messages: List[FakeMessage] = []
+        self.guilds: Dict[int, FakeGuild] = {}
+        self.cogs: Dict[str, Any] = {}
+        self.user = None
+
+    def get_cog(self, name: str):
+        return self.cogs.get(name)
+
+    def get_guild(self, id: int) -> Optional[FakeGuild]:
+        return self.guilds.get(id)
+
+    def get_channel(self, id: int):
+        for g in self.guilds.values():
+            ch = g.get_channel(id)
+            if ch is not None:
+                return ch
+        return None
+
+    async def wait_until_ready(self):
+        return
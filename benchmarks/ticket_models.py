@@ -0,0 +1,157 @@
+"""
+チケットタイマーの保持形式 (dict / TicketTimer) の比較ベンチマーク。
+
+    python -m benchmarks.ticket_models [チケット数] [ギルド数]
+
+Discord には接続せず、tickets_timer.json と同じ形のデータを生成して計測します。
+"""
+import sys
+import time
+import random
+import datetime
+import tracemalloc
+from typing import Any, Callable, Dict, Tuple
+from utils.ticket_models import decode_timers
+
+def generate(n_tickets: int, n_guilds: int, seed: int = 1) -> Dict[str, Dict[str, Any]]:
+    rnd = random.Random(seed)
+    now = datetime.datetime.now()
+    data: Dict[str, Dict[str, Any]] = {str(10**17 + g): {} for g in range(n_guilds)}
+    gids = list(data)
+    for i in range(n_tickets):
+        msg_id = 10**18 + i
+        last = now - datetime.timedelta(hours=rnd.uniform(0, 24 * 90))
+        data[gids[i % n_guilds]][str(2 * 10**18 + i)] = {
+            "last_message_at": last.isoformat(),
+            "enabled": rnd.random() > 0.1,
+            "timeout_hours": 48,
+            "assignee_id": 3 * 10**17 + rnd.randrange(200),
+            "creator_id": 4 * 10**17 + rnd.randrange(5000),
+            "active_tickets": [msg_id] if rnd.random() > 0.3 else [],
+            "auto_close_enabled": True,
+            "auto_close_days": 60,
+            "mirror_thread_id": 5 * 10**18 + i,
+            "last_log_at": last.isoformat(),
+            "tasks": {str(msg_id): [{"name": f"task{k}", "completed": k < 2} for k in range(4)]},
+            "reminded": rnd.random() > 0.5,
+        }
+    return data
+
+def measure_memory(build: Callable[[], Any]) -> Tuple[Any, int]:
+    tracemalloc.start()
+    obj = build()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return obj, size
+
+def bench(fn: Callable[[], Any], repeat: int = 5) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+# --- 旧実装 (dict) の処理 ---
+def scan_dict(timers):
+    now = datetime.datetime.now()
+    due = 0
+    for guild_timers in timers.values():
+        for info in guild_timers.values():
+            if not info.get("enabled", True) or not info.get("active_tickets") or not info.get("last_message_at"):
+                continue
+            delta = now - datetime.datetime.fromisoformat(info["last_message_at"])
+            if info.get("auto_close_enabled", True) and not info.get("close_confirming", False):
+                if delta > datetime.timedelta(days=info.get("auto_close_days", 60)):
+                    due += 1
+                    continue
+            if not info.get("reminded", False) and delta > datetime.timedelta(hours=info.get("timeout_hours", 48)):
+                due += 1
+    return due
+
+def count_dict(guild_timers, assignee_id, creator_id):
+    n = 0
+    for t in guild_timers.values():
+        if t.get("assignee_id") == assignee_id and t.get("creator_id") == creator_id and t.get("active_tickets"):
+            n += len(t.get("active_tickets", []))
+    return n
+
+def dashboard_dict(guild_timers, members):
+    out = {}
+    for m in members:
+        active = 0
+        for t in guild_timers.values():
+            if int(t.get("assignee_id", 0)) == m and t.get("active_tickets"):
+                active += len(t.get("active_tickets", []))
+        out[m] = active
+    return out
+
+# --- TicketTimer の処理 (cogs/tickets.py と同じ書き方) ---
+def scan_model(timers):
+    now = time.time()
+    due = 0
+    for guild_timers in timers.values():
+        for info in guild_timers.values():
+            if not info.enabled or not info.active_tickets or not info.last_message_at:
+                continue
+            delta = now - info.last_message_at
+            if info.auto_close_enabled and not info.close_confirming:
+                if delta > (info.auto_close_days if info.auto_close_days is not None else 60) * 86400:
+                    due += 1
+                    continue
+            if not info.reminded and delta > (info.timeout_hours if info.timeout_hours is not None else 48) * 3600:
+                due += 1
+    return due
+
+def count_model(guild_timers, assignee_id, creator_id):
+    n = 0
+    for t in guild_timers.values():
+        if t.assignee_id == assignee_id and t.creator_id == creator_id and t.active_tickets:
+            n += len(t.active_tickets)
+    return n
+
+def dashboard_model(guild_timers, members):
+    active_by_assignee: Dict[int, int] = {}
+    for t in guild_timers.values():
+        if t.active_tickets:
+            active_by_assignee[t.assignee_id] = active_by_assignee.get(t.assignee_id, 0) + len(t.active_tickets)
+    return {m: active_by_assignee.get(m, 0) for m in members}
+
+def main(argv):
+    n_tickets = int(argv[1]) if len(argv) > 1 else 50000
+    n_guilds = int(argv[2]) if len(argv) > 2 else 10
+    raw = generate(n_tickets, n_guilds)
+
+    import json
+    payload = json.dumps(raw)
+    dict_timers, dict_mem = measure_memory(lambda: json.loads(payload))
+    model_timers, model_mem = measure_memory(lambda: {gid: decode_timers(g) for gid, g in json.loads(payload).items()})
+
+    # 変換が可逆であることを確認する
+    for gid, g in model_timers.items():
+        for cid, t in g.items():
+            assert t.to_dict() == dict_timers[gid][cid], (gid, cid)
+
+    gid = next(iter(dict_timers))
+    members = [3 * 10**17 + i for i in range(200)]
+    some = next(iter(model_timers[gid].values()))
+    a, c = some.assignee_id, some.creator_id
+    assert scan_dict(dict_timers) == scan_model(model_timers)
+    assert dashboard_dict(dict_timers[gid], members) == dashboard_model(model_timers[gid], members)
+
+    rows = [
+        ("memory (MB)", dict_mem / 2**20, model_mem / 2**20),
+        ("load+decode (ms)", bench(lambda: json.loads(payload), 3),
+         bench(lambda: {g: decode_timers(d) for g, d in json.loads(payload).items()}, 3)),
+        ("check_inactivity scan (ms)", bench(lambda: scan_dict(dict_timers)), bench(lambda: scan_model(model_timers))),
+        ("check_accept_status (ms)", bench(lambda: count_dict(dict_timers[gid], a, c)), bench(lambda: count_model(model_timers[gid], a, c))),
+        ("admin dashboard (ms)", bench(lambda: dashboard_dict(dict_timers[gid], members), 1),
+         bench(lambda: dashboard_model(model_timers[gid], members))),
+    ]
+    print(f"{n_tickets} tickets / {n_guilds} guilds / {len(members)} assignees")
+    print(f"{'':28} {'dict':>10} {'TicketTimer':>12} {'ratio':>7}")
+    for name, old, new in rows:
+        print(f"{name:28} {old:10.1f} {new:12.1f} {old / new if new else 0:6.1f}x")
+
+if __name__ == "__main__":
+    main(sys.argv)
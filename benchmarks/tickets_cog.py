@@ -0,0 +1,265 @@
+"""
+Tickets Cog のスケール計測。Discord には接続せず、benchmarks.fakes の偽オブジェクトで呼び出します。
+
+    python -m benchmarks.tickets_cog [--guilds N] [--assignees N] [--tickets N] [--sample N] [--out results.json]
+
+一時ディレクトリに tickets_profiles.json / tickets_timer.json と同じ形のデータを生成し、
+Cog を読み込んでから各処理の所要時間 (ms) を JSON で出力します。
+STORAGE_BACKEND 等の環境変数は本番と同じく utils.config から読みます。
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import platform
+import tempfile
+import statistics
+from typing import Any, Awaitable, Callable, Dict, List
+import cogs.tickets as T
+from utils.migrations import fill_defaults
+from utils.persistence import WriteBehindManager
+from utils.storage import open_store
+from utils.ticket_models import TicketTimer, TaskItem
+from benchmarks.fakes import (
+    FakeBot, FakeCategory, FakeForumChannel, FakeGuild, FakeInteraction, FakeTextChannel, FakeThread,
+)
+
+ATTRIBUTES = ("skill", "speed")
+
+def guild_id(g: int) -> int:
+    return 10**17 + g
+
+def assignee_id(g: int, a: int) -> int:
+    return 3 * 10**17 + g * 1000 + a
+
+def creator_id(g: int, c: int) -> int:
+    return 4 * 10**17 + g * 10000 + c
+
+def channel_id(g: int, i: int) -> int:
+    return 2 * 10**18 + g * 100000 + i
+
+def thread_id(g: int, i: int) -> int:
+    return 5 * 10**18 + g * 100000 + i
+
+def role_ids(g: int):
+    """(担当ロール, 資格ロール, 通知ロール, カテゴリ, ログ用フォーラム)"""
+    base = 6 * 10**17 + g * 10
+    return base + 1, base + 2, base + 3, base + 4, base + 5
+
+def generate(n_guilds: int, n_assignees: int, n_tickets: int, seed: int = 1):
+    """(profiles, timers) をディスク上の形式 (dict) で返します。"""
+    rnd = random.Random(seed)
+    now = time.time()
+    profiles: Dict[str, Dict[str, Any]] = {}
+    timers: Dict[str, Dict[str, Any]] = {}
+    for g in range(n_guilds):
+        rid, qid, mid, cat_id, forum_id = role_ids(g)
+        gdoc = T.PROFILES_SCHEMA.new()
+        gdoc.update(assignee_role_id=rid, assignee_qual_role_id=qid, category_id=cat_id,
+                    transcript_id=forum_id, mention_roles=[mid],
+                    attributes={"skill": {"order": "desc"}, "speed": {"order": "asc"}})
+        for a in range(n_assignees):
+            p = {"attributes": {k: rnd.randrange(0, 10) for k in ATTRIBUTES}}
+            if rnd.random() < 0.3:
+                p["max_slots"] = rnd.randrange(1, 6)
+            if rnd.random() < 0.1:
+                p["blacklist"] = [creator_id(g, rnd.randrange(n_tickets))]
+            gdoc["profiles"][str(assignee_id(g, a))] = fill_defaults(p, T.PROFILE_DEFAULTS)
+        profiles[str(guild_id(g))] = gdoc
+
+        guild_timers = timers[str(guild_id(g))] = {}
+        for i in range(n_tickets):
+            msg_id = 10**18 + g * 100000 + i
+            active = rnd.random() > 0.3
+            t = TicketTimer(assignee_id(g, rnd.randrange(n_assignees)), creator_id(g, rnd.randrange(n_tickets // 2 + 1)),
+                            last_message_at=now - rnd.uniform(0, 86400 * 90),
+                            active_tickets=[msg_id] if active else [],
+                            auto_close_days=60, timeout_hours=48, mirror_thread_id=thread_id(g, i),
+                            tasks={msg_id: [TaskItem(f"task{k}", k < rnd.randrange(5)) for k in range(4)]},
+                            reminded=rnd.random() > 0.5)
+            t.last_log_at = t.last_message_at
+            guild_timers[str(channel_id(g, i))] = t.to_dict()
+    return profiles, timers
+
+def build_guild(g: int, n_assignees: int, n_tickets: int, seed: int = 1) -> FakeGuild:
+    """generate() と同じ ID 体系で、計測対象のギルド1件分の偽オブジェクトを作ります。"""
+    rnd = random.Random(seed * 100003 + g)
+    rid, qid, mid, cat_id, forum_id = role_ids(g)
+    guild = FakeGuild(guild_id(g))
+    role, qual = guild.add_role(rid, "担当"), guild.add_role(qid, "資格")
+    guild.add_role(mid, "通知")
+    for a in range(n_assignees):
+        # 7割が受付中 (担当ロールあり)。資格ロールは全員
+        roles = [qual, role] if rnd.random() < 0.7 else [qual]
+        guild.add_member(assignee_id(g, a), f"assignee{a}", roles)
+    category = guild.add_channel(FakeCategory(cat_id, "tickets", guild))
+    forum = guild.add_channel(FakeForumChannel(forum_id, "logs", guild))
+    for i in range(n_tickets):
+        ch = guild.add_channel(FakeTextChannel(channel_id(g, i), f"ticket-{i}", guild, category))
+        category.text_channels.append(ch)
+        guild.add_channel(FakeThread(thread_id(g, i), f"ticket-{i}", guild, forum))
+    return guild
+
+def summarize(samples: List[float]) -> Dict[str, Any]:
+    ms = sorted(s * 1000 for s in samples)
+    return {
+        "n": len(ms),
+        "total_ms": round(sum(ms), 3),
+        "mean_ms": round(statistics.fmean(ms), 4),
+        "p50_ms": round(ms[len(ms) // 2], 4),
+        "p95_ms": round(ms[min(len(ms) - 1, int(len(ms) * 0.95))], 4),
+        "max_ms": round(ms[-1], 4),
+    }
+
+def timeit(fn: Callable[[], Any], repeat: int) -> Dict[str, Any]:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+async def timeit_async(fn: Callable[[], Awaitable[Any]], repeat: int) -> Dict[str, Any]:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await fn()
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+async def bench(args) -> Dict[str, Any]:
+    profiles, timers = generate(args.guilds, args.assignees, args.tickets, args.seed)
+    os.makedirs("data", exist_ok=True)
+    open_store(T.DATA_FILE).save(profiles)
+    open_store(T.TIMER_DATA_FILE).save(timers)
+    n_tickets = sum(len(g) for g in timers.values())
+    del profiles, timers
+
+    results: Dict[str, Any] = {}
+    start = time.perf_counter()
+    bot = FakeBot(WriteBehindManager())
+    cog = bot.cogs["Tickets"] = T.Tickets(bot)
+    results["load"] = summarize([time.perf_counter() - start])
+
+    results["demote_inactive"] = timeit(cog.db.demote_inactive, 1)
+    # check_inactivity_loop は期限スケジューラに置き換わったので、起動時の全件スケジュールと期限の取り出しを測る
+    results["check_inactivity.reschedule_all"] = timeit(cog._reschedule, args.repeat)
+    results["check_inactivity.next_deadline"] = timeit(cog.deadlines.next_deadline, args.repeat)
+
+    rnd = random.Random(args.seed)
+    sample = rnd.sample(range(args.guilds), min(args.sample, args.guilds))
+    guilds = {}
+    for g in sample:
+        guild = bot.guilds[guild_id(g)] = build_guild(g, args.assignees, args.tickets, args.seed)
+        guilds[g] = guild
+
+    # 依頼者は担当者ロールを持たない普通のメンバー
+    pairs = []
+    for g, guild in guilds.items():
+        members = list(guild.members.values())
+        pool = [guild.add_member(creator_id(g, c), f"creator{c}") for c in range(min(args.tickets // 2 + 1, 64))]
+        pairs.extend((guild, rnd.choice(members), rnd.choice(pool)) for _ in range(args.repeat))
+    it = iter(pairs)
+    results["check_accept_status"] = timeit(lambda: cog.check_accept_status(*next(it)), len(pairs))
+
+    # 初回は担当者一覧 (roster) の構築を含む
+    results["get_assignee_options.cold"] = summarize([
+        _elapsed(lambda: cog.get_assignee_options(guild)) for guild in guilds.values()])
+    for key in (None,) + ATTRIBUTES:
+        order = list(guilds.values()) * args.repeat
+        it = iter(order)
+        results[f"get_assignee_options.{key or 'default'}"] = timeit(lambda: cog.get_assignee_options(next(it), key, 25), len(order))
+
+    order = list(guilds.values()) * args.repeat
+    it = iter(order)
+    results["create_admin_dashboard_embed"] = await timeit_async(lambda: cog.create_admin_dashboard_embed(next(it)), len(order))
+
+    view = T.ForumTaskLogView()
+    itxs = []
+    for g, guild in guilds.items():
+        for _ in range(args.repeat):
+            th = guild.get_thread(thread_id(g, rnd.randrange(args.tickets)))
+            itxs.append(FakeInteraction(bot, guild, th))
+    it = iter(itxs)
+    results["ForumTaskLogView.open_panel"] = await timeit_async(lambda: T.ForumTaskLogView.open_panel(view, next(it), None), len(itxs))
+
+    # 1件ずつの保存 (ジャーナル追記) と、溜まった変更のスナップショット反映 (flush)。
+    # イベントループ上ではジャーナルが大きいとバックグラウンドのコンパクションに回るので、
+    # 終了時と同じく同期で書き切る経路を測るためにループの外 (別スレッド) で実行する
+    keys = [(gid, cid) for gid, g in cog.db.timers.items() for cid in g]
+    batch = rnd.sample(keys, min(args.flush_batch, len(keys)))
+    results.update(await asyncio.to_thread(_bench_flush, cog.db, batch, args.repeat))
+
+    await cog.cog_unload()
+    return {
+        "benchmark": "tickets_cog",
+        "params": {k: v for k, v in vars(args).items() if k != "out"},
+        "tickets": n_tickets,
+        "hot_tickets": sum(len(g) for g in cog.db.timers.values()),
+        "storage_backend": _backend(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": int(time.time()),
+        "results": results,
+    }
+
+def _bench_flush(db, batch, repeat: int) -> Dict[str, Any]:
+    def touch():
+        for gid, cid in batch:
+            db.timers[gid][cid].reminded = not db.timers[gid][cid].reminded
+            db.save_timers(gid, cid)
+    # 読み込み時・退避時の分を先に書き出しておく
+    db.flush()
+    out = {"save_timers": summarize([_elapsed(touch) / len(batch) for _ in range(repeat)])}
+    samples = []
+    for _ in range(repeat):
+        touch()
+        samples.append(_elapsed(db.flush))
+    out["TicketDataManager.flush"] = summarize(samples)
+    samples = []
+    for _ in range(max(1, repeat // 5)):
+        db.save_timers()
+        samples.append(_elapsed(db.flush))
+    out["TicketDataManager.flush.full"] = summarize(samples)
+    return out
+
+def _elapsed(fn: Callable[[], Any]) -> float:
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+def _backend() -> str:
+    from utils.config import STORAGE_BACKEND
+    return STORAGE_BACKEND
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.tickets_cog")
+    parser.add_argument("--guilds", type=int, default=1000)
+    parser.add_argument("--assignees", type=int, default=20, help="ギルドあたりの担当者数")
+    parser.add_argument("--tickets", type=int, default=50, help="ギルドあたりのチケット数")
+    parser.add_argument("--sample", type=int, default=20, help="Discord オブジェクトを作って計測するギルド数")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--flush-batch", type=int, default=100, help="flush 1回あたりの変更チケット数")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", help="結果の JSON を書き出すファイル (省略時は標準出力のみ)")
+    args = parser.parse_args(argv[1:])
+    out = os.path.abspath(args.out) if args.out else None
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="tickets_bench_") as tmp:
+        os.chdir(tmp)
+        try:
+            report = asyncio.run(bench(args))
+        finally:
+            os.chdir(cwd)
+    payload = json.dumps(report, ensure_ascii=False, indent=2)
+    print(payload)
+    if out:
+        with open(out, "w", encoding="utf-8") as f:
+            f.write(payload + "\n")
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -7,6 +7,8 @@ import discord
 from discord.ext import commands
 from dotenv import load_dotenv
 from typing import Literal, Optional
+from utils.persistence import WriteBehindManager
+from utils.attachment_relay import AttachmentRelay
 
 # --- Logging Setup ---
 LOG_FILE = "bot.log"
@@ -37,8 +39,14 @@ intents.reactions = True
 class MyBot(commands.Bot):
     def __init__(self):
         super().__init__(command_prefix="!", intents=intents, help_command=None)
+        # 各Cogのデータ保存をまとめて遅延書き込みする
+        self.persistence = WriteBehindManager()
+        # ログ転送などで添付ファイルを再アップロードする時の取得・キャッシュ
+        self.attachment_relay = AttachmentRelay()
 
     async def setup_hook(self):
+        self.persistence.start()
+
         initial_extensions = [
             "cogs.logger",
             "cogs.roles",
@@ -78,6 +86,12 @@ class MyBot(commands.Bot):
     async def on_ready(self):
         logger.info(f"Logged in as {self.user} (ID: {self.user.id})")
 
+    async def close(self):
+        # 終了前に未保存のデータを書き出す
+        await self.persistence.shutdown()
+        await self.attachment_relay.close()
+        await super().close()
+
 if __name__ == "__main__":
     if not TOKEN:
         logger.critical("DISCORD_TOKEN is not set in .env")
@@ -116,6 +130,20 @@ if __name__ == "__main__":
             await ctx.send(f"🔄 Synced {len(synced)} commands to this guild.")
             logger.info(f"Synced {len(synced)} commands to guild {ctx.guild.id}.")
 
+    @bot.command()
+    @commands.has_permissions(administrator=True)
+    async def storage(ctx):
+        """
+        書き込みキューの状況確認用
+        """
+        r = bot.persistence.report()
+        stores = ", ".join(f"{k}: {v}" for k, v in r["stores"].items()) or "なし"
+        await ctx.send(
+            f"💾 Queue: **{r['queue_depth']}** ({stores})\n"
+            f"Flushes: {r['flushes']} / Failures: {r['failures']}\n"
+            f"Last: {r['last_batch']}件 {r['last_flush_ms']:.1f}ms / Max: {r['max_flush_ms']:.1f}ms"
+        )
+
     try:
         bot.run(TOKEN)
     except Exception as e:
@@ -5,41 +5,46 @@ import os
 import logging
 import time
 from typing import Optional, Dict, Any
-from utils.storage import JsonHandler
+from utils.storage import open_store
+from utils.migrations import Schema
 
 logger = logging.getLogger("discord_bot.cogs.logger")
 DATA_FILE = os.path.join("data", "log_settings.json")
 
+def _migrate_reception_roles(g: Dict[str, Any]):
+    # 単一ロール (reception_role_id) から複数ロールへ
+    if "reception_role_id" in g:
+        rid = g.pop("reception_role_id")
+        if rid:
+            g["reception_role_ids"] = [rid]
+
+SCHEMA = Schema("log_settings", 1, {
+    "reception_role_ids": [],
+    "ignore": {"roles": [], "categories": [], "channels": []},
+    "routes": {"channels": {}, "categories": {}},
+    "cooldown_seconds": 0
+}, migrations={1: _migrate_reception_roles})
+
 class Logger(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
-        self.db = JsonHandler(DATA_FILE)
-        self.settings = self.db.load()
+        self.db = open_store(DATA_FILE)
+        self.store = bot.persistence.register("logger", self.db, schema=SCHEMA)
+        self.settings = self.store.data
         self.channel_cooldowns: Dict[int, float] = {}
 
-    def save_settings(self):
-        self.db.save(self.settings)
+    def cog_unload(self):
+        self.bot.persistence.unregister(self.store)
+
+    def save_settings(self, guild_id: int):
+        self.store.mark_dirty(guild_id)
 
     def get_guild_settings(self, guild_id: int) -> Dict[str, Any]:
+        # 既定値の補完と移行は読み込み時に済んでいる (SCHEMA)
         gid = str(guild_id)
-        if gid not in self.settings: self.settings[gid] = {}
-        defaults = {
-            "reception_role_ids": [],
-            "ignore": {"roles": [], "categories": [], "channels": []},
-            "routes": {"channels": {}, "categories": {}},
-            "cooldown_seconds": 0
-        }
-        guild_settings = self.settings[gid]
-        for key, value in defaults.items():
-            if key not in guild_settings: guild_settings[key] = value
-        
-        # Migration logic
-        if "reception_role_id" in guild_settings:
-            if guild_settings["reception_role_id"]:
-                guild_settings["reception_role_ids"] = [guild_settings["reception_role_id"]]
-            del guild_settings["reception_role_id"]
-            self.save_settings()
-
+        guild_settings = self.settings.get(gid)
+        if guild_settings is None:
+            guild_settings = self.settings[gid] = SCHEMA.new()
         return guild_settings
 
     # --- Logic ---
@@ -137,7 +142,7 @@ class Logger(commands.Cog):
         if category:
             routes["categories"][str(category.id)] = destination.id
             msg.append(f"監視追加: カテゴリ[{category.name}] -> {destination.mention}")
-        self.save_settings()
+        self.save_settings(itx.guild_id)
         await itx.response.send_message("\n".join(msg), ephemeral=True)
 
     @route_group.command(name="remove", description="監視設定を削除")
@@ -147,7 +152,7 @@ class Logger(commands.Cog):
             del routes["channels"][str(source_channel.id)]; msg.append(f"監視削除: {source_channel.mention}")
         if category and str(category.id) in routes["categories"]:
             del routes["categories"][str(category.id)]; msg.append(f"監視削除: カテゴリ[{category.name}]")
-        self.save_settings()
+        self.save_settings(itx.guild_id)
         await itx.response.send_message("\n".join(msg) or "設定が見つかりませんでした。", ephemeral=True)
 
     ignore_group = app_commands.Group(name="ignore", description="ログ監視から除外する設定", parent=log_group)
@@ -158,7 +163,7 @@ class Logger(commands.Cog):
         if role and role.id not in ignore["roles"]: ignore["roles"].append(role.id); msg.append(f"ロール無視: {role.mention}")
         if category and category.id not in ignore["categories"]: ignore["categories"].append(category.id); msg.append(f"カテゴリ無視: {category.name}")
         if channel and channel.id not in ignore["channels"]: ignore["channels"].append(channel.id); msg.append(f"チャンネル無視: {channel.mention}")
-        self.save_settings()
+        self.save_settings(itx.guild_id)
         await itx.response.send_message("\n".join(msg) or "既に追加されています。", ephemeral=True)
 
     @ignore_group.command(name="remove", description="無視設定を解除")
@@ -167,7 +172,7 @@ class Logger(commands.Cog):
         if role and role.id in ignore["roles"]: ignore["roles"].remove(role.id); msg.append(f"解除: {role.mention}")
         if category and category.id in ignore["categories"]: ignore["categories"].remove(category.id); msg.append(f"解除: {category.name}")
         if channel and channel.id in ignore["channels"]: ignore["channels"].remove(channel.id); msg.append(f"解除: {channel.mention}")
-        self.save_settings()
+        self.save_settings(itx.guild_id)
         await itx.response.send_message("\n".join(msg) or "設定が見つかりませんでした。", ephemeral=True)
 
     notify_group = app_commands.Group(name="notify", description="ログ発生時のメンション先設定", parent=log_group)
@@ -178,7 +183,7 @@ class Logger(commands.Cog):
         current = settings.get("reception_role_ids", [])
         if role.id not in current:
             current.append(role.id); settings["reception_role_ids"] = current
-            self.save_settings()
+            self.save_settings(itx.guild_id)
             await itx.response.send_message(f"✅ 通知先に {role.mention} を追加しました。", ephemeral=True)
         else: await itx.response.send_message(f"⚠️ {role.mention} は既に追加されています。", ephemeral=True)
 
@@ -188,7 +193,7 @@ class Logger(commands.Cog):
         current = settings.get("reception_role_ids", [])
         if role.id in current:
             current.remove(role.id); settings["reception_role_ids"] = current
-            self.save_settings()
+            self.save_settings(itx.guild_id)
             await itx.response.send_message(f"🗑️ 通知先から {role.mention} を削除しました。", ephemeral=True)
         else: await itx.response.send_message(f"⚠️ {role.mention} は設定されていません。", ephemeral=True)
 
@@ -209,7 +214,7 @@ class Logger(commands.Cog):
     async def config_cooldown(self, itx: discord.Interaction, seconds: int):
         if seconds < 0: await itx.response.send_message("⚠️ 秒数は0以上にしてください。", ephemeral=True); return
         settings = self.get_guild_settings(itx.guild_id)
-        settings["cooldown_seconds"] = seconds; self.save_settings()
+        settings["cooldown_seconds"] = seconds; self.save_settings(itx.guild_id)
         msg = "✅ クールダウンを無効化しました。" if seconds == 0 else f"✅ クールダウンを **{seconds}秒** に設定しました。"
         await itx.response.send_message(msg, ephemeral=True)
 
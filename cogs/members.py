@@ -5,7 +5,7 @@ import logging
 import os
 import datetime
 from typing import Dict, Any
-from utils.storage import JsonHandler
+from utils.storage import open_store
 
 logger = logging.getLogger("discord_bot.cogs.members")
 DATA_FILE = os.path.join("data", "members_settings.json")
@@ -13,11 +13,15 @@ DATA_FILE = os.path.join("data", "members_settings.json")
 class Apply(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
-        self.db = JsonHandler(DATA_FILE)
+        self.db = open_store(DATA_FILE)
         self.settings = self.db.load()
+        self.store = bot.persistence.register("members", self.db, self.settings)
 
-    def save_settings(self):
-        self.db.save(self.settings)
+    def cog_unload(self):
+        self.bot.persistence.unregister(self.store)
+
+    def save_settings(self, guild_id: int):
+        self.store.mark_dirty(guild_id)
 
     def get_guild_settings(self, guild_id: int) -> Dict[str, Any]:
         gid = str(guild_id)
@@ -37,7 +41,7 @@ class Apply(commands.Cog):
         settings = self.get_guild_settings(interaction.guild_id)
         settings["archive_forum_id"] = forum.id
         settings["member_role_id"] = role.id
-        self.save_settings()
+        self.save_settings(interaction.guild_id)
         
         await interaction.response.send_message(
             f"設定完了しました。\n保存先: {forum.mention}\n付与ロール: {role.mention}", 
@@ -4,7 +4,7 @@ from discord.ext import commands
 import logging
 import os
 from typing import Dict, Any, Optional
-from utils.storage import JsonHandler
+from utils.storage import open_store
 
 logger = logging.getLogger("discord_bot.cogs.roles")
 DATA_FILE = os.path.join("data", "roles.json")
@@ -12,11 +12,15 @@ DATA_FILE = os.path.join("data", "roles.json")
 class Roles(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
-        self.db = JsonHandler(DATA_FILE)
+        self.db = open_store(DATA_FILE)
         self.config = self.db.load()
+        self.store = bot.persistence.register("roles", self.db, self.config)
 
-    def save_config(self):
-        self.db.save(self.config)
+    def cog_unload(self):
+        self.bot.persistence.unregister(self.store)
+
+    def save_config(self, guild_id: int):
+        self.store.mark_dirty(guild_id)
 
     def get_guild_config(self, guild_id: int) -> Dict[str, Any]:
         gid = str(guild_id)
@@ -99,7 +103,7 @@ class Roles(commands.Cog):
         conf = self.get_guild_config(interaction.guild_id)
         conf["qualified_role_id"] = role.id
         conf["info_channel_id"] = info_channel.id
-        self.save_config()
+        self.save_config(interaction.guild_id)
         await interaction.response.send_message(f"設定を保存しました。\nロール: {role.mention}\n案内チャンネル: {info_channel.mention}", ephemeral=True)
 
     @role_group.command(name="panel", description="資格取得ボタンのパネルを設置します")
@@ -1,19 +1,40 @@
 import discord
 from discord import app_commands, ui
-from discord.ext import commands, tasks
+from discord.ext import commands
 import os
+import re
 import logging
+import time
 import datetime
 import asyncio
-import re
-from typing import Dict, Any, Optional, List, Union
-from utils.storage import JsonHandler
+from collections.abc import Mapping
+from typing import Dict, Any, Optional, List, Union, Callable, Tuple
+from utils.storage import open_store, mark_dirty, set_summarizer, guild_summary
+from utils.journal import Journal
+from utils.persistence import Flushable
+from utils.ticket_models import TicketTimer, TaskItem, TicketCard, ActiveTicketIndex, EffectiveProfile, ActivityTable, ColdTimers, decode_timers
+from utils.migrations import Schema, fill_defaults
+from utils.scheduler import DeadlineScheduler
+from utils.thread_cache import ThreadCache
+from utils.name_index import ChannelNameIndex, ForumThreadIndex
+from utils.templates import compile_template, render
+from utils.roster import AssigneeRoster, UNSET_ASC
+from utils.transcripts import export_transcript
+from utils.analytics import TicketAnalytics, format_duration
+from utils.config import ACTIVITY_PERSIST_SECONDS
 from utils.persistent_views import persistent_view
 
 logger = logging.getLogger("discord_bot.cogs.tickets")
 
 DATA_FILE = os.path.join("data", "tickets_profiles.json")
 TIMER_DATA_FILE = os.path.join("data", "tickets_timer.json")
+# 稼働中のメッセージが無くなったチケット (コールド層)
+TIMER_ARCHIVE_FILE = os.path.join("data", "tickets_timer_archive.json")
+JOURNAL_FILE = os.path.join("data", "tickets.journal")
+FORUM_INDEX_FILE = os.path.join("data", "tickets_forum_threads.json")
+RECOVER_FILE = os.path.join("data", "tickets_recover.json")
+ANALYTICS_FILE = os.path.join("data", "tickets_analytics.json")
+JOURNAL_COMPACT_BYTES = 1024 * 1024
 
 DEFAULT_TIMEOUT_HOURS = 48
 DEFAULT_AUTO_CLOSE_DAYS = 60
@@ -22,75 +43,517 @@ DEFAULT_REUSE_CHANNEL = False
 DEFAULT_NOTIFY_ENABLED = True
 DEFAULT_AUTO_CLOSE_ENABLED = True
 DEFAULT_LOG_COOLDOWN = 300
+# 期限処理で何も進まなかった (送信失敗等) 場合に再試行するまでの秒数
+DEADLINE_RETRY_SECONDS = 600
+# ログのまとめ送り: 1投稿に載せる Embed の件数と合計文字数の上限 (Discord の制限)
+MIRROR_MAX_EMBEDS = 10
+MIRROR_MAX_CHARS = 6000
+# Embed の description / 投稿本文の文字数上限 (Discord の制限)
+EMBED_DESCRIPTION_LIMIT = 4096
+MESSAGE_CONTENT_LIMIT = 2000
+# まとめ送りに失敗したログを溜め直して再送するまでの秒数 / 諦めるまでの失敗回数
+MIRROR_RETRY_SECONDS = 60
+MIRROR_MAX_RETRIES = 3
+# チケット完了時に同時に編集するメッセージ数
+CLOSE_CONCURRENCY = 4
+# 復旧スキャン: 同時に走査するカテゴリ数 / 1チャンネル (とログスレッド) で読む履歴の件数 /
+# ステータスメッセージを編集する最短間隔 (秒) / ステータスに残すログの行数
+RECOVER_CONCURRENCY = 3
+RECOVER_HISTORY_LIMIT = 200
+RECOVER_STATUS_INTERVAL = 3
+RECOVER_LOG_LINES = 10
+# bot が送るチケット Embed のタイトル (create_ticket_entry / admin_link / 完了時)
+TICKET_TITLE_PREFIXES = ("案件: ", "✅ 登録: ")
+CLOSED_TITLE_PREFIX = "✅ [完了] "
+TASK_LIST_HEADER = "**📋 タスクリスト**"
+_MENTION_RE = re.compile(r"<@!?(\d+)>")
+
+GUILD_DEFAULTS = {
+    "assignee_role_id": None, "assignee_qual_role_id": None,
+    "profiles": {}, "attributes": {}, "category_id": None, "name_format": None,
+    "mention_roles": [], "log_roles": [], "ignore_roles": [], "template": None, "transcript_id": None,
+    "cooldown": DEFAULT_LOG_COOLDOWN, "reuse_channel": DEFAULT_REUSE_CHANNEL,
+    "max_slots": DEFAULT_MAX_SLOTS, "notify_enabled": DEFAULT_NOTIFY_ENABLED,
+    "timeout_hours": DEFAULT_TIMEOUT_HOURS, "auto_close_days": DEFAULT_AUTO_CLOSE_DAYS,
+    "auto_close_enabled": DEFAULT_AUTO_CLOSE_ENABLED,
+    # 1メッセージずつのログ転送 / 完了・削除時の履歴アーカイブ (gzip JSONL + HTML)
+    "mirror_messages": True, "archive_transcripts": True
+}
+PROFILE_DEFAULTS = {
+    "category_id": None, "template": None, "name_format": None,
+    "mention_roles": None, "log_roles": None, "ignore_roles": None, "blacklist": [], "attributes": {},
+    "reuse_channel": None, "max_slots": None, "notify_enabled": None,
+    "timeout_hours": None, "auto_close_enabled": None, "auto_close_days": None,
+    "transcript_id": None, "cooldown": None
+}
+
+def _normalize_profiles(g: Dict[str, Any]):
+    for p in g["profiles"].values():
+        fill_defaults(p, PROFILE_DEFAULTS)
+
+# 既定値を変えたら version を上げること
+PROFILES_SCHEMA = Schema("tickets_profiles", 2, GUILD_DEFAULTS, normalize=_normalize_profiles)
 
 # ====================================================
 # Data Management
 # ====================================================
-class TicketDataManager:
+class TicketDataManager(Flushable):
+    name = "tickets"
+
     def __init__(self):
-        self.profiles_handler = JsonHandler(DATA_FILE)
-        self.timers_handler = JsonHandler(TIMER_DATA_FILE)
-        
-        self.profiles = self.profiles_handler.load()
-        self.timers = self.timers_handler.load()
+        self.profiles_handler = open_store(DATA_FILE)
+        self.timers_handler = open_store(TIMER_DATA_FILE)
         
         self._profiles_dirty = False
         self._timers_dirty = False
-
-    def save_profiles(self):
+        # 変更のあったキー (None は全体書き込み)。行単位で書けるバックエンド向け
+        self._profile_keys: Optional[set] = set()
+        self._timer_keys: Optional[set] = set()
+
+        self.profiles = None
+        self.profiles = self.profiles_handler.load(decode=self._upgrade_profiles)
+        # guild_id -> {user_id (担当者なしは None): EffectiveProfile}。save_profiles で破棄する
+        self._effective: Dict[str, Dict[Optional[str], EffectiveProfile]] = {}
+        # 発言ごとの last_message_at はこの表で受け、ジャーナルには "activity" として間引いて書く
+        self.activity = ActivityTable(ACTIVITY_PERSIST_SECONDS)
+        # 前回のコンパクション以降に activity を書いたチケット。次のスナップショットに含める
+        self._activity_keys: set = set()
+        self._activity_timer: Optional[asyncio.TimerHandle] = None
+        # timers は {guild_id: {channel_id: TicketTimer}}。完了済みのチケットは cold に移し、巡回対象から外す
+        self.cold = ColdTimers(open_store(TIMER_ARCHIVE_FILE))
+        self.timers = self.timers_handler.load(decode=lambda gid, gdoc: self.activity.overlay(gid, decode_timers(gdoc)))
+        # mirror_thread_id -> channel_id の逆引き。ギルドごとに初回参照時に構築し、以降は差分で更新する
+        self._thread_index: Dict[str, Dict[int, str]] = {}
+        # 稼働チケット数の集計。save_timers(gid, cid) のたびにそのチャンネル分だけ更新する
+        self._active: Dict[str, ActiveTicketIndex] = {}
+        if isinstance(self.timers, dict):
+            for gid in self.timers:
+                self.active_index(gid)
+        # save_timers(gid, cid) / save_profiles(gid, uid) のたびに呼ばれるコールバック (期限スケジューラ等)
+        self.timer_listeners: List[Callable[..., None]] = []
+        self.profile_listeners: List[Callable[..., None]] = []
+        # touch_activity(gid, cid) で最終発言時刻だけが進んだ時に呼ばれるコールバック
+        self.activity_listeners: List[Callable[[str, str], None]] = []
+
+        # 変更はジャーナルに即時追記し、スナップショットへの反映はコンパクション時に行う
+        self.journal = Journal(JOURNAL_FILE)
+        self._compaction: Optional[asyncio.Task] = None
+        self._unsynced = 0
+        replayed = self.journal.replay({"profiles": self.profiles, "timers": self.timers, "activity": self.activity.latest, "cold": self.cold.staged})
+        if replayed:
+            logger.info(f"Replayed {len(replayed)} journal records")
+            for store, *path in replayed:
+                # パス [gid, "profiles", uid] / [gid, cid] をハンドラのキーに変換する
+                key = (path[:1] + path[2:3]) if store == "profiles" else path
+                if store == "profiles":
+                    self._profiles_dirty = True
+                    self._profile_keys = self._mark(self._profile_keys, *(key or [None]))
+                else:
+                    self._timers_dirty = True
+                    self._timer_keys = self._mark(self._timer_keys, *(key or [None]))
+            # ジャーナルの値はそのまま入るので、触れたギルドを変換し直す
+            for store, docs in (("profiles", self.profiles), ("timers", self.timers)):
+                touched = [path for s, *path in replayed if s == store]
+                gids = list(docs) if any(not path for path in touched) else {path[0] for path in touched}
+                for gid in gids:
+                    if gid not in docs:
+                        continue
+                    if store == "profiles":
+                        self._upgrade_profiles(gid, docs[gid])
+                    else:
+                        decode_timers(docs[gid])
+                if store == "timers":
+                    for path in touched:
+                        self._reindex(*path[:2])
+            for gid in list(self.activity.latest):
+                guild_timers = self.timers.get(gid)
+                if guild_timers:
+                    self.activity.overlay(gid, guild_timers)
+            # 退避後に戻したチケットは両方に残りうる。稼働側を優先する
+            for gid, chans in list(self.cold.staged.items()):
+                for cid in list(chans):
+                    if cid in self.timers.get(gid, {}):
+                        self.cold.discard(gid, cid)
+            self.compact()
+        # 差分更新した集計を、作り直したものと突き合わせる
+        self.verify_indexes()
+
+    def _upgrade_profiles(self, gid: str, gdoc: Dict[str, Any]) -> Dict[str, Any]:
+        # 移行したギルドは次のスナップショットで書き戻す (ジャーナルには残さない)
+        if PROFILES_SCHEMA.upgrade(gdoc):
+            self._profiles_dirty = True
+            self._profile_keys = self._mark(self._profile_keys, gid)
+            if self.profiles is not None:
+                mark_dirty(self.profiles, gid)
+        return gdoc
+
+    @staticmethod
+    def _mark(keys: Optional[set], *path) -> Optional[set]:
+        if keys is None or path[0] is None:
+            return None
+        keys.add(tuple(str(p) for p in path if p is not None))
+        return keys
+
+    @staticmethod
+    def _journal_path(doc: Dict[str, Any], path: List[str]):
+        node = doc
+        for key in path:
+            # timers はシャード形式だと GuildShardMap になる
+            if not isinstance(node, Mapping) or key not in node:
+                return None, False
+            node = node[key]
+        return node, True
+
+    def _record(self, store: str, doc: Dict[str, Any], path: List[str]):
+        value, exists = self._journal_path(doc, path)
+        if exists:
+            self.journal.append(store, path, value)
+        else:
+            self.journal.delete(store, path)
+        self._unsynced += 1
+        self._notify()
+        self._maybe_compact()
+
+    def save_profiles(self, guild_id=None, user_id=None):
+        self._invalidate_effective(guild_id, user_id)
+        for fn in self.profile_listeners:
+            fn(guild_id, user_id)
         self._profiles_dirty = True
+        if guild_id is not None:
+            mark_dirty(self.profiles, guild_id)
+        self._profile_keys = self._mark(self._profile_keys, guild_id, user_id)
+        if guild_id is None:
+            path = []
+        elif user_id is None:
+            path = [str(guild_id)]
+        else:
+            path = [str(guild_id), "profiles", str(user_id)]
+        self._record("profiles", self.profiles, path)
 
-    def save_timers(self):
+    def save_timers(self, guild_id=None, channel_id=None):
         self._timers_dirty = True
-        
+        if guild_id is not None:
+            mark_dirty(self.timers, guild_id)
+        self._timer_keys = self._mark(self._timer_keys, guild_id, channel_id)
+        path = [str(p) for p in (guild_id, channel_id) if p is not None] if guild_id is not None else []
+        self._reindex(*path)
+        for fn in self.timer_listeners:
+            fn(*path)
+        self._record("timers", self.timers, path)
+
+    def _maybe_compact(self):
+        if self.journal.size < JOURNAL_COMPACT_BYTES or (self._compaction and not self._compaction.done()):
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._compaction = loop.create_task(self.compact_async())
+
+    def _take_dirty(self):
+        if self._activity_keys:
+            # activity だけのチケットも、ジャーナルを捨てる前にスナップショットへ書く
+            self._timers_dirty = True
+            for key in self._activity_keys:
+                self._timer_keys = self._mark(self._timer_keys, *key)
+            self._activity_keys = set()
+        state = (self._profiles_dirty, self._profile_keys, self._timers_dirty, self._timer_keys)
+        self._profiles_dirty, self._profile_keys = False, set()
+        self._timers_dirty, self._timer_keys = False, set()
+        return state
+
+    def _restore_dirty(self, profiles: bool, timers: bool):
+        # 失敗時は全体を書き直す
+        if profiles:
+            self._profiles_dirty, self._profile_keys = True, None
+        if timers:
+            self._timers_dirty, self._timer_keys = True, None
+
+    def compact(self):
+        """ジャーナルをスナップショットに畳み込みます (同期版)。"""
+        seq = self.journal.rotate()
+        p_dirty, p_keys, t_dirty, t_keys = self._take_dirty()
+        ok_p = self.profiles_handler.save(self.profiles, keys=p_keys) if p_dirty else True
+        ok_t = self.timers_handler.save(self.timers, keys=t_keys) if t_dirty else True
+        ok_c = self.cold.save()
+        if ok_p and ok_t and ok_c:
+            self.journal.drop_through(seq)
+        else:
+            self._restore_dirty(p_dirty, t_dirty)
+
+    async def compact_async(self):
+        # rotate とスナップショット取得の間に await を挟まないこと
+        seq = self.journal.rotate()
+        p_dirty, p_keys, t_dirty, t_keys = self._take_dirty()
+        ok_p = await self.profiles_handler.save_async(self.profiles, keys=p_keys) if p_dirty else True
+        ok_t = await self.timers_handler.save_async(self.timers, keys=t_keys) if t_dirty else True
+        ok_c = await self.cold.save_async()
+        if ok_p and ok_t and ok_c:
+            self.journal.drop_through(seq)
+            logger.debug(f"Compacted journal through segment {seq}")
+        else:
+            self._restore_dirty(p_dirty, t_dirty)
+
     def flush(self):
-        if self._profiles_dirty:
-            self.profiles_handler.save(self.profiles)
-            self._profiles_dirty = False
-        if self._timers_dirty:
-            self.timers_handler.save(self.timers)
-            self._timers_dirty = False
+        if self._activity_timer is not None:
+            self._activity_timer.cancel()
+            self._activity_timer = None
+        self._write_activity(self.activity.due(time.time(), everything=True))
+        self._unsynced = 0
+        self.journal.sync()
+        if self._compaction and not self._compaction.done():
+            # 書き込み中のスナップショットと競合させない (残りは次回起動時に再生される)
+            self.journal.close()
+            return
+        self.compact()
+        self.journal.close()
+
+    def pending(self) -> int:
+        return self._unsynced
+
+    async def flush_async(self):
+        self._unsynced = 0
+        await self.journal.sync_async()
+        self._maybe_compact()
+
+    # --- Activity ---
+    def touch_activity(self, guild_id, channel_id, now: Optional[float] = None) -> Optional[TicketTimer]:
+        """
+        チケットでの発言を記録します。最終発言時刻は activity 表で受けてまとめて保存し、
+        通知済み・確認中などの状態が戻る場合だけ save_timers で全体を保存します。
+        """
+        gid, cid = str(guild_id), str(channel_id)
+        t = self.timers.get(gid, {}).get(cid)
+        if t is None:
+            # 完了済み (コールド層) のチャンネルでの発言も従来どおり記録・転送するので稼働側へ戻す
+            t = self.promote(gid, cid)
+            if t is None:
+                return None
+        now = time.time() if now is None else now
+        prev = t.last_message_at
+        t.touch(now)
+        if t.reminded or t.close_confirming or not t.enabled:
+            t.reminded, t.close_confirming, t.enabled = False, False, True
+            self.activity.saved(gid, cid, now)
+            self.save_timers(gid, cid)
+            return t
+        if self.activity.bump(gid, cid, now, prev):
+            self._write_activity([(gid, cid, now)])
+        else:
+            self._arm_activity()
+        for fn in self.activity_listeners:
+            fn(gid, cid)
+        return t
+
+    def _write_activity(self, items: List[tuple]):
+        if not items:
+            return
+        for gid, cid, ts in items:
+            self.journal.append("activity", [gid, cid], ts)
+            self._activity_keys.add((gid, cid))
+        self._unsynced += len(items)
+        self._notify()
+        self._maybe_compact()
+
+    def _arm_activity(self):
+        if self._activity_timer is not None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._activity_timer = loop.call_later(self.activity.interval, self._write_activity_due)
+
+    def _write_activity_due(self):
+        self._activity_timer = None
+        self._write_activity(self.activity.due(time.time()))
+        if self.activity.pending:
+            self._arm_activity()
+
+    # --- Timers ---
+    def _guild_thread_index(self, gid: str) -> Dict[int, str]:
+        idx = self._thread_index.get(gid)
+        if idx is None:
+            idx = {t.mirror_thread_id: cid for cid, t in self.timers.get(gid, {}).items() if t.mirror_thread_id}
+            self._thread_index[gid] = idx
+        return idx
+
+    def active_index(self, guild_id) -> ActiveTicketIndex:
+        gid = str(guild_id)
+        idx = self._active.get(gid)
+        if idx is None:
+            idx = self._active[gid] = ActiveTicketIndex.build(self.timers.get(gid, {}))
+        return idx
+
+    def _reindex(self, gid: Optional[str] = None, cid: Optional[str] = None):
+        if gid is None:
+            self._active.clear()
+        elif cid is None:
+            self._active.pop(gid, None)
+        elif gid in self._active:
+            self._active[gid].update(cid, self.timers.get(gid, {}).get(cid))
+
+    def verify_indexes(self) -> int:
+        """構築済みの集計をタイマーから作り直して比較し、食い違ったギルド数を返します。"""
+        broken = 0
+        for gid, idx in list(self._active.items()):
+            fresh = ActiveTicketIndex.build(self.timers.get(gid, {}))
+            if fresh != idx:
+                broken += 1
+                logger.warning(f"Active ticket index mismatch in guild {gid}; rebuilt")
+                self._active[gid] = fresh
+        return broken
+
+    def find_by_thread(self, guild_id, thread_id: int) -> Optional[str]:
+        """フォーラムのログスレッドに紐付いたチケットのチャンネルIDを返します。"""
+        gid = str(guild_id)
+        cid = self._guild_thread_index(gid).get(thread_id)
+        if cid is not None:
+            t = self.timers.get(gid, {}).get(cid)
+            if t is None or t.mirror_thread_id != thread_id:
+                # 索引を経由せずに書き換えられていた場合は作り直す
+                self._thread_index.pop(gid, None)
+                cid = self._guild_thread_index(gid).get(thread_id)
+        if cid is None:
+            # 完了済みのチケットはコールド層の索引から引く
+            return self.cold.find_by_thread(gid, thread_id)
+        return cid
+
+    def set_mirror_thread(self, guild_id, channel_id, thread_id: Optional[int]):
+        gid, cid = str(guild_id), str(channel_id)
+        t = self.timers[gid][cid]
+        idx = self._guild_thread_index(gid)
+        if t.mirror_thread_id and idx.get(t.mirror_thread_id) == cid:
+            del idx[t.mirror_thread_id]
+        t.mirror_thread_id = thread_id
+        if thread_id:
+            idx[thread_id] = cid
+        self.save_timers(gid, cid)
+
+    def _drop_hot(self, gid: str, cid: str) -> Optional[TicketTimer]:
+        t = self.timers.get(gid, {}).pop(cid, None)
+        if t is None:
+            return None
+        self.activity.forget(gid, cid)
+        idx = self._thread_index.get(gid)
+        if idx and t.mirror_thread_id and idx.get(t.mirror_thread_id) == cid:
+            del idx[t.mirror_thread_id]
+        self.save_timers(gid, cid)
+        return t
+
+    def delete_timer(self, guild_id, channel_id) -> bool:
+        gid, cid = str(guild_id), str(channel_id)
+        if self._drop_hot(gid, cid) is not None:
+            return True
+        # コールド層はファイルを読まずに消しておく (次の保存で反映)
+        self.cold.discard(gid, cid)
+        return False
+
+    # --- Cold tier ---
+    def find_timer(self, guild_id, channel_id) -> Optional[TicketTimer]:
+        """稼働中のチケットか、無ければコールド層のチケットを返します (戻しはしません)。"""
+        gid, cid = str(guild_id), str(channel_id)
+        t = self.timers.get(gid, {}).get(cid)
+        return t if t is not None else self.cold.get(gid, cid)
+
+    def demote(self, guild_id, channel_id) -> bool:
+        """稼働中のメッセージが無いチケットをコールド層へ移します。"""
+        gid, cid = str(guild_id), str(channel_id)
+        t = self.timers.get(gid, {}).get(cid)
+        if t is None or t.active_tickets:
+            return False
+        # コールド側の記録を先に書く (再生時はこの後の削除と合わせて移動になる)
+        self.cold.put(gid, cid, t)
+        self._record("cold", self.cold.staged, [gid, cid])
+        self._drop_hot(gid, cid)
+        return True
+
+    def demote_inactive(self, guild_id=None) -> int:
+        """起動時用。稼働中のメッセージが無いチケットをまとめてコールド層へ移します (guild_id 省略時は全ギルド)。"""
+        moved = 0
+        for gid in (list(self.timers) if guild_id is None else [str(guild_id)]):
+            for cid, t in list(self.timers.get(gid, {}).items()):
+                if not t.active_tickets and self.demote(gid, cid):
+                    moved += 1
+        return moved
+
+    def promote(self, guild_id, channel_id) -> Optional[TicketTimer]:
+        """チケットを返します。コールド層にあれば稼働側へ戻します。"""
+        gid, cid = str(guild_id), str(channel_id)
+        t = self.timers.get(gid, {}).get(cid)
+        if t is not None:
+            return t
+        t = self.cold.pop(gid, cid)
+        if t is None:
+            return None
+        if gid not in self.timers:
+            self.timers[gid] = {}
+        self.timers[gid][cid] = t
+        if t.mirror_thread_id:
+            self._guild_thread_index(gid)[t.mirror_thread_id] = cid
+        self.save_timers(gid, cid)
+        return t
+
+    def reusable_channels(self, guild_id, assignee_id: int, creator_id: int) -> List[str]:
+        """reuse_channel 用。同じ担当者・依頼者のチャンネル (稼働中 → 完了済みの順)。"""
+        gid = str(guild_id)
+        hot = self.active_index(gid).channels_for(assignee_id, creator_id)
+        return hot + [c for c in self.cold.channels_for(gid, assignee_id, creator_id) if c not in hot]
 
     def get_guild_config(self, guild_id: int) -> Dict[str, Any]:
+        # 既定値の補完は読み込み時に済んでいる (PROFILES_SCHEMA)
         gid = str(guild_id)
-        if gid not in self.profiles:
-            self.profiles[gid] = {}
+        g = self.profiles.get(gid)
+        if g is None:
+            g = self.profiles[gid] = PROFILES_SCHEMA.new()
         if gid not in self.timers:
             self.timers[gid] = {}
-        
-        g = self.profiles[gid]
-        defaults = {
-            "assignee_role_id": None, "assignee_qual_role_id": None,
-            "profiles": {}, "attributes": {}, "category_id": None, "name_format": None,
-            "mention_roles": [], "log_roles": [], "ignore_roles": [], "template": None, "transcript_id": None,
-            "cooldown": DEFAULT_LOG_COOLDOWN, "reuse_channel": DEFAULT_REUSE_CHANNEL,
-            "max_slots": DEFAULT_MAX_SLOTS, "notify_enabled": DEFAULT_NOTIFY_ENABLED,
-            "timeout_hours": DEFAULT_TIMEOUT_HOURS, "auto_close_days": DEFAULT_AUTO_CLOSE_DAYS,
-            "auto_close_enabled": DEFAULT_AUTO_CLOSE_ENABLED
-        }
-        for k, v in defaults.items():
-            if k not in g:
-                g[k] = v
         return g
 
     def get_user_profile(self, guild_id: int, user_id: int) -> Dict[str, Any]:
-        g = self.get_guild_config(guild_id)
+        profiles = self.get_guild_config(guild_id)["profiles"]
         uid = str(user_id)
-        if uid not in g["profiles"]:
-            g["profiles"][uid] = {}
-        p = g["profiles"][uid]
-        defaults = {
-            "category_id": None, "template": None, "name_format": None,
-            "mention_roles": None, "log_roles": None, "ignore_roles": None, "blacklist": [], "attributes": {},
-            "reuse_channel": None, "max_slots": None, "notify_enabled": None,
-            "timeout_hours": None, "auto_close_enabled": None, "auto_close_days": None,
-            "transcript_id": None, "cooldown": None
-        }
-        for k, v in defaults.items():
-            if k not in p:
-                p[k] = v
+        p = profiles.get(uid)
+        if p is None:
+            p = profiles[uid] = fill_defaults({}, PROFILE_DEFAULTS)
         return p
 
+    def effective(self, guild_id, user_id=None) -> EffectiveProfile:
+        """担当者 user_id (None なら担当者なし) の実効設定を返します。"""
+        gid = str(guild_id)
+        uid = str(user_id) if user_id else None
+        cache = self._effective.setdefault(gid, {})
+        e = cache.get(uid)
+        if e is None:
+            p = self.get_user_profile(guild_id, user_id) if uid else {}
+            e = cache[uid] = EffectiveProfile(p, self.get_guild_config(guild_id), GUILD_DEFAULTS)
+        return e
+
+    def _invalidate_effective(self, guild_id=None, user_id=None):
+        if guild_id is None:
+            self._effective.clear()
+        elif user_id is None:
+            self._effective.pop(str(guild_id), None)
+        else:
+            self._effective.get(str(guild_id), {}).pop(str(user_id), None)
+
+def card_from_embed(embed: discord.Embed) -> TicketCard:
+    """チケットメッセージの Embed を TicketCard に変換します (作成時と、導入前のチケットの初回編集時)。"""
+    return TicketCard(
+        embed.title, embed.description, embed.color.value if embed.color is not None else None,
+        embed.timestamp.timestamp() if embed.timestamp else None,
+        [[f.name, f.value, f.inline] for f in embed.fields],
+    )
+
+def render_card(card: TicketCard) -> discord.Embed:
+    embed = discord.Embed(
+        title=card.title, description=card.description, color=card.color,
+        timestamp=datetime.datetime.fromtimestamp(card.timestamp, datetime.timezone.utc) if card.timestamp is not None else None,
+    )
+    for name, value, inline in card.fields:
+        embed.add_field(name=name, value=value, inline=inline)
+    return embed
+
 # ====================================================
 # UI Classes
 # ====================================================
@@ -169,7 +632,7 @@ class AssigneeSelectView(discord.ui.View):
         if has_qual_role and not custom_category_id:
             tmpl = p.get("template")
             if tmpl:
-                msg_content = tmpl.replace("{creator}", itx.user.mention).replace("{user}", itx.user.mention).replace("{assignee}", target.mention).replace("\\n", "\n")
+                msg_content = render(compile_template(tmpl), {"creator": itx.user.mention, "user": itx.user.mention, "assignee": target.mention})
             else:
                 msg_content = f"{target.display_name} は本サーバー内での依頼対応を行っておりません。個別にお問い合わせください。"
             await itx.response.send_message(msg_content, ephemeral=True)
@@ -221,23 +684,21 @@ class TechModal(discord.ui.Modal, title="依頼内容 (2/2: 技術情報)"):
             self.add_item(i)
 
     async def on_submit(self, itx: discord.Interaction):
-        if not itx.message.embeds:
-            return
-        embed = itx.message.embeds[0]
-        embed.color = discord.Color.green()
-        data_map = [("📂 データ", self.t_data.value), ("🎧 リファレンス", self.t_ref.value), ("BPM", self.t_bpm.value), ("Key", self.t_key.value), ("📝 備考", self.t_rem.value)]
-        new_fields = [f for f in embed.fields if "次のステップ" not in f.name]
-        embed.clear_fields()
-        for f in new_fields:
-            embed.add_field(name=f.name, value=f.value, inline=f.inline)
-        embed.add_field(name="──────────────", value="**🎵 技術詳細**", inline=False)
-        for name, val in data_map:
-            if val:
-                embed.add_field(name=name, value=val, inline=(name!="📂 データ" and name!="📝 備考"))
-        await itx.message.edit(embed=embed, view=TicketControlView())
         cog = itx.client.get_cog("Tickets")
-        if cog:
-            await cog.log_to_forum(itx.channel, embed=embed, is_update=True, target_msg_id=itx.message.id)
+        data_map = [("📂 データ", self.t_data.value), ("🎧 リファレンス", self.t_ref.value), ("BPM", self.t_bpm.value), ("Key", self.t_key.value), ("📝 備考", self.t_rem.value)]
+        def update(card: TicketCard):
+            card.color = discord.Color.green().value
+            card.remove_fields("次のステップ")
+            card.add_field("──────────────", "**🎵 技術詳細**", False)
+            for name, val in data_map:
+                if val:
+                    card.add_field(name, val, name != "📂 データ" and name != "📝 備考")
+        card, changed = await cog.edit_ticket_card(itx.channel, itx.message.id, update, view=TicketControlView(), message=itx.message)
+        if card is None:
+            await itx.response.send_message("⚠️ チケットのEmbedが見つからないため、詳細を保存できませんでした。", ephemeral=True)
+            return
+        if changed:
+            await cog.log_to_forum(itx.channel, embed=render_card(card), is_update=True, target_msg_id=itx.message.id)
         await itx.response.send_message("✅ 詳細を保存しました！", ephemeral=False)
 
 @persistent_view
@@ -255,12 +716,15 @@ class TicketControlView(discord.ui.View):
     @discord.ui.button(label="⚙️ 管理", style=discord.ButtonStyle.secondary, custom_id="btn_manage", row=1)
     async def btn_manage(self, itx: discord.Interaction, button: discord.ui.Button):
         cog = itx.client.get_cog("Tickets")
-        t_data = cog.db.timers.get(str(itx.guild_id), {}).get(str(itx.channel.id), {})
-        is_assignee = t_data.get("assignee_id") == itx.user.id
+        t_data = cog.db.timers.get(str(itx.guild_id), {}).get(str(itx.channel.id))
+        is_assignee = t_data is not None and t_data.assignee_id == itx.user.id
         is_admin = itx.user.guild_permissions.manage_roles
         if not (is_assignee or is_admin):
             await itx.response.send_message("担当者のみ使用可能です。", ephemeral=True)
             return
+        if t_data is None:
+            await itx.response.send_message("⚠️ チケットデータが見つかりません。", ephemeral=True)
+            return
         embed = await cog.create_ticket_dashboard_embed(itx.channel, t_data)
         await itx.response.send_message(embed=embed, view=AssigneeMenuView(itx.channel, itx.message.id), ephemeral=True)
  
@@ -273,20 +737,22 @@ class AssigneeMenuView(discord.ui.View):
     @discord.ui.button(label="⏱️ タイマー設定", style=discord.ButtonStyle.secondary)
     async def timer_settings(self, itx: discord.Interaction, button: discord.ui.Button):
         cog = itx.client.get_cog("Tickets")
-        t = cog.db.timers.get(str(itx.guild_id), {}).get(str(self.target_channel.id), {})
-        await itx.response.send_modal(TimerEditModal(t.get("timeout_hours", DEFAULT_TIMEOUT_HOURS), t.get("auto_close_days", DEFAULT_AUTO_CLOSE_DAYS), self.target_channel))
+        t = cog.db.timers.get(str(itx.guild_id), {}).get(str(self.target_channel.id))
+        h = t.timeout_hours if t and t.timeout_hours is not None else DEFAULT_TIMEOUT_HOURS
+        d = t.auto_close_days if t and t.auto_close_days is not None else DEFAULT_AUTO_CLOSE_DAYS
+        await itx.response.send_modal(TimerEditModal(h, d, self.target_channel))
 
     @discord.ui.button(label="📂 提出先設定", style=discord.ButtonStyle.success)
     async def set_url(self, itx: discord.Interaction, button: discord.ui.Button):
-        await itx.response.send_modal(SubmitUrlModalExt(self.target_channel))
+        await itx.response.send_modal(SubmitUrlModalExt(self.target_channel, self.ticket_msg_id))
 
     @discord.ui.button(label="📋 タスクリスト編集", style=discord.ButtonStyle.primary, row=1)
     async def edit_tasks(self, itx: discord.Interaction, button: discord.ui.Button):
         cog = itx.client.get_cog("Tickets")
         gid, cid = str(itx.guild_id), str(self.target_channel.id)
-        t_data = cog.db.timers.get(gid, {}).get(cid, {})
-        current_tasks = t_data.get("tasks", {}).get(str(self.ticket_msg_id), [])
-        text_val = "\n".join([t["name"] for t in current_tasks])
+        t_data = cog.db.timers.get(gid, {}).get(cid)
+        current_tasks = t_data.task_list(self.ticket_msg_id) if t_data else []
+        text_val = "\n".join([t.name for t in current_tasks])
         await itx.response.send_modal(TaskListEditModal(self.target_channel, self.ticket_msg_id, text_val, is_from_forum_panel=False))
 
     @discord.ui.button(label="✅ 完了/クローズ", style=discord.ButtonStyle.danger, row=1)
@@ -317,25 +783,21 @@ class TaskListEditModal(discord.ui.Modal, title="タスクリスト編集"):
         parts = re.split(r'[,\n]+', raw_text)
         new_names = [p.strip() for p in parts if p.strip()]
 
-        if cid in cog.db.timers.get(gid, {}):
-            if "tasks" not in cog.db.timers[gid][cid]:
-                cog.db.timers[gid][cid]["tasks"] = {}
-            old_list = cog.db.timers[gid][cid]["tasks"].get(str(self.ticket_msg_id), [])
+        t_data = cog.db.timers.get(gid, {}).get(cid)
+        if t_data is not None:
+            if t_data.tasks is None:
+                t_data.tasks = {}
+            old_list = t_data.task_list(self.ticket_msg_id)
             # Map old task completion status: name -> completed
-            status_map = {t["name"]: t["completed"] for t in old_list}
+            status_map = {t.name: t.completed for t in old_list}
             
-            new_list = []
-            for name in new_names:
-                new_list.append({
-                    "name": name,
-                    "completed": status_map.get(name, False)
-                })
+            new_list = [TaskItem(name, status_map.get(name, False)) for name in new_names]
 
             # 以前のリストが空（0件）だった場合のみ「初回作成」と判定する
             is_first_creation = (len(old_list) == 0 and len(new_list) > 0)
             
-            cog.db.timers[gid][cid]["tasks"][str(self.ticket_msg_id)] = new_list
-            cog.db.save_timers()
+            t_data.tasks[int(self.ticket_msg_id)] = new_list
+            cog.db.save_timers(gid, cid)
 
             # 初回作成時のみ、フォーラムに Embed 形式でログを送信（is_update=True でチャットのクールダウンを貫通させる）
             if is_first_creation:
@@ -346,15 +808,15 @@ class TaskListEditModal(discord.ui.Modal, title="タスクリスト編集"):
                 embed = discord.Embed(title="📋 タスク操作パネル", color=discord.Color.blue())
                 desc = "**【操作ログ: 📝 リストを更新しました】**\n\n" # 🟢正しくはこちら
                 for t in new_list:
-                    mark = "✅" if t["completed"] else "☑️"
-                    desc += f"{mark} {t['name']}\n"
+                    mark = "✅" if t.completed else "☑️"
+                    desc += f"{mark} {t.name}\n"
                 embed.description = desc or "タスクなし"
                 await itx.response.edit_message(embed=embed, view=TaskActionView(self.target_channel, self.ticket_msg_id, new_list))
             else:
                 msg_text = f"✅ タスクリストを更新しました ({len(new_list)}件):\n"
                 for t in new_list:
-                    mark = "✅" if t["completed"] else "☑️"
-                    msg_text += f"{mark} {t['name']}\n"
+                    mark = "✅" if t.completed else "☑️"
+                    msg_text += f"{mark} {t.name}\n"
                 await itx.response.send_message(msg_text, ephemeral=True)
         else:
             await itx.response.send_message("⚠️ チケットデータが見つかりません。", ephemeral=True)
@@ -373,37 +835,34 @@ class ForumTaskLogView(discord.ui.View):
         target_data = None
         target_channel = None
 
-        # 検索に時間がかかる可能性があるため、先にdeferする
+        # fetch_channel が走る可能性があるため、先にdeferする
         await itx.response.defer(ephemeral=True)
         
-        # Search timers for matching mirror_thread_id
-        if gid in cog.db.timers:
-            for ch_id, data in list(cog.db.timers[gid].items()):
-                if data.get("mirror_thread_id") == itx.channel.id:
-                    ch = itx.guild.get_channel(int(ch_id))
-                    if not ch:
-                        try:
-                            ch = await itx.guild.fetch_channel(int(ch_id))
-                        except discord.NotFound:
-                            continue # 削除されたゴーストデータならスキップして次を探す
-                            
-                    if ch:
-                        target_channel = ch
-                        target_data = data
-                        cid = ch_id
-                        break
-
-        if not target_channel:
+        # Look up the ticket channel via the mirror_thread_id index
+        cid = cog.db.find_by_thread(gid, itx.channel.id)
+        if cid:
+            ch = itx.guild.get_channel(int(cid))
+            if not ch:
+                try:
+                    ch = await itx.guild.fetch_channel(int(cid))
+                except discord.NotFound:
+                    ch = None # 削除されたゴーストデータ
+            if ch:
+                target_channel = ch
+                # await の間に削除されている場合もあるので、コールド層も含めて引き直す
+                target_data = cog.db.find_timer(gid, cid)
+
+        if not target_channel or target_data is None:
             await itx.followup.send("⚠️ このスレッドに関連付けられたチケット（チャンネル）が見つかりません。", ephemeral=True)
             return
 
-        active_tickets = target_data.get("active_tickets", [])
+        active_tickets = target_data.active_tickets
         if not active_tickets:
              await itx.followup.send("⚠️ 稼働中のチケットがありません。", ephemeral=True)
              return
              
         ticket_msg_id = active_tickets[-1]
-        task_list = target_data.get("tasks", {}).get(str(ticket_msg_id), [])
+        task_list = target_data.task_list(ticket_msg_id)
         
         if not task_list:
              await itx.followup.send("✅ 全てのタスクが完了しているか、タスクがありません。", ephemeral=True)
@@ -412,8 +871,8 @@ class ForumTaskLogView(discord.ui.View):
         embed = discord.Embed(title="📋 タスク操作パネル", color=discord.Color.blue())
         desc = ""
         for t in task_list:
-            mark = "✅" if t["completed"] else "☑️"
-            desc += f"{mark} {t['name']}\n"
+            mark = "✅" if t.completed else "☑️"
+            desc += f"{mark} {t.name}\n"
         embed.description = desc or "タスクなし"
 
         await itx.followup.send(embed=embed, view=TaskActionView(target_channel, ticket_msg_id, task_list), ephemeral=True)
@@ -426,7 +885,7 @@ class TaskActionView(discord.ui.View):
         self.task_list = task_list
         
         # Check for uncompleted tasks
-        self.next_task = next((t for t in task_list if not t["completed"]), None)
+        self.next_task = next((t for t in task_list if not t.completed), None)
         
         btn_label = f"▶️ タスクを進行する" if self.next_task else "🎉 全て完了"
         btn_style = discord.ButtonStyle.success if self.next_task else discord.ButtonStyle.secondary
@@ -447,24 +906,25 @@ class TaskActionView(discord.ui.View):
         cog = itx.client.get_cog("Tickets")
         gid, cid = str(itx.guild_id), str(self.target_channel.id)
         
-        if cid in cog.db.timers.get(gid, {}):
-            tasks = cog.db.timers[gid][cid].get("tasks", {}).get(str(self.ticket_msg_id), [])
-            target_name = self.next_task["name"]
+        t_data = cog.db.timers.get(gid, {}).get(cid)
+        if t_data is not None:
+            tasks = t_data.task_list(self.ticket_msg_id)
+            target_name = self.next_task.name
             
             # Find and update
             for t in tasks:
-                if t["name"] == target_name and not t["completed"]:
-                    t["completed"] = True
+                if t.name == target_name and not t.completed:
+                    t.completed = True
+                    cog.analytics.task_completed(gid, t_data.assignee_id)
                     break
             
-            cog.db.timers[gid][cid]["tasks"][str(self.ticket_msg_id)] = tasks
-            cog.db.save_timers()
+            cog.db.save_timers(gid, cid)
             
             embed = discord.Embed(title="📋 タスク操作パネル", color=discord.Color.blue())
             desc = f"**【操作ログ: ✅ 『{target_name}』を完了しました】**\n\n"
             for t in tasks:
-                mark = "✅" if t["completed"] else "☑️"
-                desc += f"{mark} {t['name']}\n"
+                mark = "✅" if t.completed else "☑️"
+                desc += f"{mark} {t.name}\n"
             embed.description = desc or "タスクなし"
             
             await itx.response.edit_message(embed=embed, view=TaskActionView(self.target_channel, self.ticket_msg_id, tasks))
@@ -472,7 +932,7 @@ class TaskActionView(discord.ui.View):
             await itx.response.send_message("⚠️ エラー: データ不整合", ephemeral=True)
 
     async def edit_list(self, itx: discord.Interaction):
-        current_text = "\n".join([t["name"] for t in self.task_list])
+        current_text = "\n".join([t.name for t in self.task_list])
         await itx.response.send_modal(TaskListEditModal(self.target_channel, self.ticket_msg_id, current_text, is_from_forum_panel=True))
 
 class AssigneeCloseView(discord.ui.View):
@@ -489,9 +949,9 @@ class AssigneeCloseView(discord.ui.View):
         gid, cid = str(itx.guild_id), str(self.target_channel.id)
         
         # Check uncompleted tasks
-        if cid in cog.db.timers.get(gid, {}):
-            tasks = cog.db.timers[gid][cid].get("tasks", {}).get(str(self.ticket_msg_id), [])
-            uncompleted = [t["name"] for t in tasks if not t["completed"]]
+        t_data = cog.db.timers.get(gid, {}).get(cid)
+        if t_data is not None:
+            uncompleted = [t.name for t in t_data.task_list(self.ticket_msg_id) if not t.completed]
             
             if uncompleted:
                 embed = discord.Embed(title="⚠️ 未完了のタスクがあります", description="以下のタスクが残っています。強制的に完了しますか？", color=discord.Color.orange())
@@ -499,19 +959,16 @@ class AssigneeCloseView(discord.ui.View):
                 await itx.followup.send(embed=embed, view=TaskForceCloseView(self.target_channel, self.ticket_msg_id), ephemeral=True)
                 return
 
-        await cog.close_ticket(self.target_channel, itx.user, self.ticket_msg_id)
-        await itx.followup.send("✅ 完了しました。", ephemeral=True)
+        results = await cog.close_ticket(self.target_channel, itx.user, self.ticket_msg_id)
+        await itx.followup.send("✅ 完了しました。" + cog.close_summary(results), ephemeral=True)
 
     @discord.ui.button(label="チャンネル削除", style=discord.ButtonStyle.danger)
     async def delete_ch(self, itx: discord.Interaction, button: discord.ui.Button):
         await itx.response.defer(ephemeral=True)
 
         cog = itx.client.get_cog("Tickets")
-        await cog.log_to_forum(self.target_channel, content="🗑️ 手動削除されました。", close_thread=True)
-        gid, cid = str(itx.guild_id), str(self.target_channel.id)
-        if cid in cog.db.timers.get(gid, {}):
-            del cog.db.timers[gid][cid]
-            cog.db.save_timers()
+        await cog.archive_and_log(self.target_channel, "🗑️ 手動削除されました。")
+        cog.db.delete_timer(itx.guild_id, self.target_channel.id)
         await itx.followup.send("削除します...", ephemeral=True)
         await asyncio.sleep(2)
         try:
@@ -530,8 +987,8 @@ class TaskForceCloseView(discord.ui.View):
         await itx.response.defer(ephemeral=True)
 
         cog = itx.client.get_cog("Tickets")
-        await cog.close_ticket(self.target_channel, itx.user, self.ticket_msg_id)
-        await itx.followup.send("✅ 強制完了しました。", ephemeral=True)
+        results = await cog.close_ticket(self.target_channel, itx.user, self.ticket_msg_id)
+        await itx.followup.send("✅ 強制完了しました。" + cog.close_summary(results), ephemeral=True)
 
     @discord.ui.button(label="キャンセル", style=discord.ButtonStyle.secondary)
     async def cancel(self, itx: discord.Interaction, button: discord.ui.Button):
@@ -620,44 +1077,41 @@ class TimerEditModal(discord.ui.Modal, title="タイマー設定"):
             return
         cog = itx.client.get_cog("Tickets")
         gid, cid = str(itx.guild_id), str(self.target_channel.id)
-        if cid in cog.db.timers.get(gid, {}):
-            cog.db.timers[gid][cid].update({"timeout_hours": h, "auto_close_days": d, "last_message_at": datetime.datetime.now().isoformat(), "reminded": False, "enabled": True})
-            cog.db.save_timers()
+        t = cog.db.timers.get(gid, {}).get(cid)
+        if t is not None:
+            t.timeout_hours, t.auto_close_days = h, d
+            t.touch()
+            t.reminded, t.enabled = False, True
+            cog.db.save_timers(gid, cid)
             await itx.response.send_message("✅ 設定更新＆タイマー再開", ephemeral=True)
 
 class SubmitUrlModalExt(discord.ui.Modal, title="提出先URL"):
     url = discord.ui.TextInput(label="URL", max_length=200)
 
-    def __init__(self, target_channel):
+    def __init__(self, target_channel, ticket_msg_id=None):
         super().__init__()
         self.target_channel = target_channel
+        self.ticket_msg_id = ticket_msg_id
 
     async def on_submit(self, itx: discord.Interaction):
-        target_msg = None
-        async for msg in self.target_channel.history(limit=20):
-            if msg.author.id == itx.client.user.id and msg.embeds and msg.embeds[0].color != discord.Color.dark_grey():
-                target_msg = msg
-                break
-        if not target_msg:
-            await itx.response.send_message("対象なし", ephemeral=True)
-            return
-        embed = target_msg.embeds[0]
-        new_field = {"name": "📂 提出先", "value": f"[Link]({self.url.value})\n`{self.url.value}`", "inline": False}
-        fds = [{"name": f.name, "value": f.value, "inline": f.inline} for f in embed.fields]
-        updated = False
-        for i, f in enumerate(fds):
-            if "提出先" in f["name"]:
-                fds[i] = new_field
-                updated = True
-                break
-        if not updated:
-            fds.insert(2, new_field)
-        embed.clear_fields()
-        for f in fds:
-            embed.add_field(name=f["name"], value=f["value"], inline=f["inline"])
-        await target_msg.edit(embed=embed)
         cog = itx.client.get_cog("Tickets")
-        await cog.log_to_forum(self.target_channel, content=f"📂 提出先設定: {self.url.value}")
+        # 対象はメニューを開いたチケット (無ければ最後に作成された稼働中のチケット)。Embed は保存済みの内容から組み立てる
+        t = cog.db.timers.get(str(self.target_channel.guild.id), {}).get(str(self.target_channel.id))
+        msg_id = self.ticket_msg_id
+        if msg_id is None and t is not None and t.active_tickets:
+            msg_id = t.active_tickets[-1]
+        card = None
+        if t is not None and msg_id is not None:
+            value = f"[Link]({self.url.value})\n`{self.url.value}`"
+            try:
+                card, changed = await cog.edit_ticket_card(self.target_channel, msg_id, lambda c: c.set_field("提出先", "📂 提出先", value, False, position=2))
+            except discord.NotFound:
+                card = None
+        if card is None:
+            await itx.response.send_message("⚠️ 対象のチケットが見つかりません。", ephemeral=True)
+            return
+        if changed:
+            await cog.log_to_forum(self.target_channel, content=f"📂 提出先設定: {self.url.value}")
         await itx.response.send_message("更新しました", ephemeral=True)
 
 class ProfileTemplateModal(discord.ui.Modal, title="テンプレート編集"):
@@ -670,7 +1124,7 @@ class ProfileTemplateModal(discord.ui.Modal, title="テンプレート編集"):
         cog = itx.client.get_cog("Tickets")
         p = cog.db.get_user_profile(itx.guild_id, itx.user.id)
         p["template"] = self.c.value
-        cog.db.save_profiles()
+        cog.db.save_profiles(itx.guild_id, itx.user.id)
         await itx.response.send_message("更新しました", ephemeral=True)
 
 class GlobalTemplateModal(discord.ui.Modal, title="共通テンプレート編集"):
@@ -683,7 +1137,7 @@ class GlobalTemplateModal(discord.ui.Modal, title="共通テンプレート編
         cog = itx.client.get_cog("Tickets")
         g = cog.db.get_guild_config(itx.guild_id)
         g["template"] = self.c.value
-        cog.db.save_profiles()
+        cog.db.save_profiles(itx.guild_id)
         await itx.response.send_message("更新しました", ephemeral=True)
 
 @persistent_view
@@ -698,24 +1152,24 @@ class AutoCloseConfirmView(discord.ui.View):
         cog = itx.client.get_cog("Tickets")
         ch = itx.guild.get_channel(int(cid))
         if ch: 
-            await cog.log_to_forum(ch, content="🗑️ 自動削除を実行しました。", close_thread=True)
-            if cid in cog.db.timers.get(gid, {}): 
-                del cog.db.timers[gid][cid]
-                cog.db.save_timers()
+            # 履歴の書き出しに時間がかかるため先に応答しておく
+            await itx.response.defer(ephemeral=True)
+            await cog.archive_and_log(ch, "🗑️ 自動削除を実行しました。")
+            cog.db.delete_timer(gid, cid)
             await ch.delete()
         else:
-            if cid in cog.db.timers.get(gid, {}): 
-                del cog.db.timers[gid][cid]
-                cog.db.save_timers()
+            cog.db.delete_timer(gid, cid)
 
     @discord.ui.button(label="延長", style=discord.ButtonStyle.success, custom_id="ac_ext")
     async def extend(self, itx: discord.Interaction, btn: discord.ui.Button): 
         cid = str(itx.channel.id)
         gid = str(itx.guild_id)
         cog = itx.client.get_cog("Tickets")
-        if cid in cog.db.timers.get(gid, {}): 
-            cog.db.timers[gid][cid].update({"last_message_at": datetime.datetime.now().isoformat(), "close_confirming": False})
-            cog.db.save_timers()
+        t = cog.db.timers.get(gid, {}).get(cid)
+        if t is not None:
+            t.touch()
+            t.close_confirming = False
+            cog.db.save_timers(gid, cid)
         await itx.message.delete()
         await itx.response.send_message(f"✅ タイマーを延長しました。", ephemeral=True)
 
@@ -724,9 +1178,10 @@ class AutoCloseConfirmView(discord.ui.View):
         cid = str(itx.channel.id)
         gid = str(itx.guild_id)
         cog = itx.client.get_cog("Tickets")
-        if cid in cog.db.timers.get(gid, {}): 
-            cog.db.timers[gid][cid].update({"enabled": False, "close_confirming": False})
-            cog.db.save_timers()
+        t = cog.db.timers.get(gid, {}).get(cid)
+        if t is not None:
+            t.enabled, t.close_confirming = False, False
+            cog.db.save_timers(gid, cid)
         await itx.message.delete()
         await itx.response.send_message(f"⏸️ タイマーを一時停止しました。（再開するにはチャンネルでメッセージを送信してください）", ephemeral=True)
 
@@ -740,9 +1195,11 @@ class ReminderView(discord.ui.View):
         cid = str(itx.channel.id)
         gid = str(itx.guild_id)
         cog = itx.client.get_cog("Tickets")
-        if cid in cog.db.timers.get(gid, {}): 
-            cog.db.timers[gid][cid].update({"last_message_at": datetime.datetime.now().isoformat(), "reminded": False})
-            cog.db.save_timers()
+        t = cog.db.timers.get(gid, {}).get(cid)
+        if t is not None:
+            t.touch()
+            t.reminded = False
+            cog.db.save_timers(gid, cid)
         await itx.message.delete()
         await itx.response.send_message(f"✅ タイマーを延長しました。", ephemeral=True)
 
@@ -751,9 +1208,10 @@ class ReminderView(discord.ui.View):
         cid = str(itx.channel.id)
         gid = str(itx.guild_id)
         cog = itx.client.get_cog("Tickets")
-        if cid in cog.db.timers.get(gid, {}): 
-            cog.db.timers[gid][cid].update({"enabled": False, "reminded": False})
-            cog.db.save_timers()
+        t = cog.db.timers.get(gid, {}).get(cid)
+        if t is not None:
+            t.enabled, t.reminded = False, False
+            cog.db.save_timers(gid, cid)
         await itx.message.delete()
         await itx.response.send_message(f"⏸️ タイマーを一時停止しました。（再開するにはチャンネルでメッセージを送信してください）", ephemeral=True)
 
@@ -765,20 +1223,229 @@ class ReopenView(discord.ui.View):
     @discord.ui.button(label="🔄 再開", style=discord.ButtonStyle.primary, custom_id="reopen_ticket")
     async def reopen(self, itx, btn):
         cog = itx.client.get_cog("Tickets")
-        embed = itx.message.embeds[0]
-        embed.color = discord.Color.blue()
-        embed.title = embed.title.replace("✅ [完了] ", "")
-        await itx.message.edit(embed=embed, view=TicketControlView())
         gid, cid = str(itx.guild_id), str(itx.channel.id)
-        if cid in cog.db.timers.get(gid, {}):
-            at = cog.db.timers[gid][cid].get("active_tickets", [])
-            if itx.message.id not in at:
-                at.append(itx.message.id)
-            cog.db.timers[gid][cid].update({"active_tickets": at, "last_message_at": datetime.datetime.now().isoformat(), "reminded": False})
-            cog.db.save_timers()
+        t = cog.db.promote(gid, cid)
+        def update(card: TicketCard):
+            card.color = discord.Color.blue().value
+            card.title = (card.title or "").replace(CLOSED_TITLE_PREFIX, "")
+        card, _ = await cog.edit_ticket_card(itx.channel, itx.message.id, update, view=TicketControlView(), message=itx.message)
+        if card is None:
+            await itx.response.send_message("⚠️ チケットのEmbedが見つからないため、再開できませんでした。", ephemeral=True)
+            return
+        if t is not None:
+            if t.active_tickets is None:
+                t.active_tickets = []
+            if itx.message.id not in t.active_tickets:
+                t.active_tickets.append(itx.message.id)
+                cog.analytics.reopened(gid, t.assignee_id, cid, itx.message.id)
+            t.touch()
+            t.reminded = False
+            cog.db.save_timers(gid, cid)
         await cog.log_to_forum(itx.channel, content="🔄 **再開されました**")
         await itx.response.send_message("再開しました", ephemeral=True)
 
+class MirrorBuffer:
+    """クールダウン中のログを溜めておく、チケット1件分のバッファ。"""
+    __slots__ = ("channel", "embeds", "chars", "task", "attempts")
+
+    def __init__(self, channel):
+        self.channel = channel
+        self.embeds: List[discord.Embed] = []
+        self.chars = 0
+        self.task: Optional[asyncio.Task] = None
+        # 送信に失敗して溜め直した回数
+        self.attempts = 0
+
+def parse_task_list(text: Optional[str]) -> Optional[List[TaskItem]]:
+    """フォーラムのログに付けたタスクリスト (_send_to_thread の形式) を読み戻します。"""
+    if not text or TASK_LIST_HEADER not in text:
+        return None
+    items = []
+    for line in text.split(TASK_LIST_HEADER, 1)[1].splitlines():
+        line = line.strip()
+        for mark, completed in (("✅", True), ("☑️", False)):
+            if line.startswith(mark):
+                items.append(TaskItem(line[len(mark):].strip(), completed))
+                break
+    return items
+
+class RecoveryJob:
+    """
+    /ticket admin recover のバックグラウンド処理。
+    カテゴリを RECOVER_CONCURRENCY 件ずつ並行して走査し、チャンネルの履歴から稼働中のチケットとタスクを復元します。
+    進捗は state (tickets_recover に保存) に記録するので、再起動後は続きから再開します。
+    """
+    def __init__(self, cog: "Tickets", guild: discord.Guild, state: Dict[str, Any]):
+        self.cog = cog
+        self.guild = guild
+        self.state = state
+        self.done = set(state["done"])
+        self.total = 0
+        self._last_edit = 0.0
+        self._sem = asyncio.Semaphore(RECOVER_CONCURRENCY)
+
+    async def run(self):
+        cats = [self.guild.get_channel(c) for c in self.state["categories"]]
+        cats = [c for c in cats if isinstance(c, discord.CategoryChannel)]
+        self.total = sum(len(c.text_channels) for c in cats)
+        await self.report(force=True)
+        await asyncio.gather(*(self._scan_category(c) for c in cats))
+        self.cog._finish_recovery(self.guild.id, self.state)
+        await self.report(force=True, finished=True)
+
+    async def _scan_category(self, category: discord.CategoryChannel):
+        async with self._sem:
+            for ch in category.text_channels:
+                cid = str(ch.id)
+                if cid in self.done:
+                    continue
+                try:
+                    await self._recover_channel(ch)
+                except (discord.HTTPException, asyncio.TimeoutError) as e:
+                    logger.warning(f"Recover: failed to scan {ch.id}: {e}")
+                    self._fail(ch, e)
+                except Exception as e:
+                    # 1チャンネルの想定外のデータでカテゴリ全体の走査を止めない
+                    logger.exception(f"Recover: unexpected error in {ch.id}: {e}")
+                    self._fail(ch, e)
+                self.done.add(cid)
+                self.state["done"].append(cid)
+                self._checkpoint()
+                await self.report()
+
+    async def _recover_channel(self, ch: discord.TextChannel):
+        db = self.cog.db
+        gid, cid = str(self.guild.id), str(ch.id)
+        if db.find_timer(gid, cid) is not None:
+            return
+        rid = db.get_guild_config(self.guild.id).get("assignee_role_id")
+        ta = tc = None
+        for target, ow in ch.overwrites.items():
+            if isinstance(target, discord.Member) and not target.bot:
+                if any(r.id == rid for r in target.roles):
+                    ta = target
+                elif ow.read_messages:
+                    tc = target
+        if not ta:
+            return
+
+        # 履歴は新しい順。bot のチケット Embed のうち完了になっていないものが稼働中
+        me = self.cog.bot.user.id
+        active: List[int] = []
+        cards: Dict[int, TicketCard] = {}
+        creator_id = None
+        newest = last_human = None
+        async for msg in ch.history(limit=RECOVER_HISTORY_LIMIT):
+            ts = msg.created_at.timestamp()
+            if newest is None:
+                newest = ts
+            if not msg.author.bot:
+                if last_human is None:
+                    last_human = ts
+                continue
+            if msg.author.id != me or not msg.embeds:
+                continue
+            embed = msg.embeds[0]
+            title = embed.title or ""
+            if title.startswith(TICKET_TITLE_PREFIXES):
+                active.append(msg.id)
+                cards[msg.id] = card_from_embed(embed)
+            if creator_id is None and title.startswith(TICKET_TITLE_PREFIXES + (CLOSED_TITLE_PREFIX,)):
+                for f in embed.fields:
+                    m = _MENTION_RE.search(f.value or "") if "依頼者" in (f.name or "") else None
+                    if m:
+                        creator_id = int(m.group(1))
+                        break
+        active.reverse()
+        tasks: Dict[int, List[TaskItem]] = {mid: [] for mid in active}
+
+        # タスクリストはフォーラムのログ (最後にタスクを付けた投稿) から読み戻す
+        e = db.effective(self.guild.id, ta.id)
+        thread_id = await self._find_thread(ch, e)
+        if thread_id and active:
+            try:
+                thread = await self.cog.threads.get(self.guild, thread_id)
+                async for msg in thread.history(limit=RECOVER_HISTORY_LIMIT):
+                    if msg.author.id != me:
+                        continue
+                    texts = [msg.content] + [em.description for em in msg.embeds]
+                    items = next((parsed for parsed in map(parse_task_list, texts) if parsed is not None), None)
+                    if items is not None:
+                        tasks[active[-1]] = items
+                        break
+            except discord.HTTPException as err:
+                logger.warning(f"Recover: failed to read log thread {thread_id}: {err}")
+
+        self.state["recovered"] += 1
+        self._log(f"✅ {ch.name}: {ta.display_name} (稼働 {len(active)})")
+        if self.state["dry_run"]:
+            return
+        db.timers[gid][cid] = TicketTimer(
+            ta.id, creator_id or (tc.id if tc else ta.id),
+            last_message_at=last_human or newest or ch.created_at.timestamp(),
+            enabled=e.notify_enabled, timeout_hours=e.timeout_hours, active_tickets=active,
+            auto_close_enabled=True, auto_close_days=e.auto_close_days, tasks=tasks, embeds=cards,
+        )
+        db.save_timers(gid, cid)
+        if thread_id:
+            db.set_mirror_thread(gid, cid, thread_id)
+        if not active:
+            db.demote(gid, cid)
+
+    async def _find_thread(self, ch: discord.TextChannel, e: EffectiveProfile) -> Optional[int]:
+        forum = self.guild.get_channel(e.transcript_id) if e.transcript_id else None
+        if not isinstance(forum, discord.ForumChannel):
+            return None
+        try:
+            await self.cog.forum_threads.ensure_seeded(forum)
+        except Exception as err:
+            logger.warning(f"Recover: failed to index forum {forum.id}: {err}")
+        return self.cog.forum_threads.get(forum, ch.name)
+
+    def _fail(self, ch: discord.TextChannel, e: Exception):
+        # 失敗したチャンネルも走査済みとして記録し、再開時に繰り返さない
+        self.state["failed"] = self.state.get("failed", 0) + 1
+        self._log(f"⚠️ {ch.name}: {type(e).__name__}")
+
+    def _log(self, line: str):
+        log = self.state["log"]
+        log.append(line)
+        del log[:-RECOVER_LOG_LINES]
+
+    def _checkpoint(self):
+        if not self.state["dry_run"]:
+            self.cog.recover_store.mark_dirty(self.guild.id)
+
+    def embed(self, finished: bool = False) -> discord.Embed:
+        scanned = len(self.done)
+        title = "🚀 復旧完了" if finished else "🔎 復旧中..."
+        if self.state["dry_run"]:
+            title += " (dry run)"
+        embed = discord.Embed(title=title, color=discord.Color.green() if finished else discord.Color.blue())
+        embed.add_field(name="進捗", value=f"{scanned}/{self.total or scanned} ch", inline=True)
+        embed.add_field(name="復旧", value=f"{self.state['recovered']}件", inline=True)
+        if self.state.get("failed"):
+            embed.add_field(name="失敗", value=f"{self.state['failed']}ch", inline=True)
+        embed.add_field(name="カテゴリ", value=str(len(self.state["categories"])), inline=True)
+        if self.state["log"]:
+            embed.add_field(name="ログ", value="\n".join(self.state["log"])[:1024], inline=False)
+        return embed
+
+    async def report(self, force: bool = False, finished: bool = False):
+        """進捗を1つのステータスメッセージに書き込みます (RECOVER_STATUS_INTERVAL 秒に1回まで)。"""
+        now = time.monotonic()
+        if not force and now - self._last_edit < RECOVER_STATUS_INTERVAL:
+            return
+        self._last_edit = now
+        status = self.state.get("status")
+        ch = self.guild.get_channel_or_thread(status[0]) if status else None
+        if ch is None:
+            return
+        try:
+            await ch.get_partial_message(status[1]).edit(embed=self.embed(finished))
+        except discord.HTTPException as e:
+            logger.warning(f"Recover: failed to update status message: {e}")
+
 # ====================================================
 # Cog Logic
 # ====================================================
@@ -786,69 +1453,143 @@ class Tickets(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
         self.db = TicketDataManager()
-        self.check_inactivity_loop.start()
-        self.autosave_loop.start()
+        bot.persistence.attach(self.db)
+        # 未稼働通知 / 自動削除確認は、チケットごとの次の期限で起動する
+        self.deadlines = DeadlineScheduler()
+        self.db.timer_listeners.append(self._reschedule)
+        self.db.activity_listeners.append(self._postpone)
+        # シャード形式では、ギルドごとの一番近い期限を索引に残し、起動時にシャードを読まずに済ませる
+        set_summarizer(self.db.timers, self._summarize_guild)
+        self._deadline_task: Optional[asyncio.Task] = None
+        # ログスレッドの取得は毎メッセージ走るので、REST はキャッシュに無い時だけ
+        self.threads = ThreadCache()
+        # (guild_id, channel_id) -> クールダウン中に溜まったログ
+        self._mirror: Dict[tuple, MirrorBuffer] = {}
+        # guild_id -> テンプレートの {channel:...} 解決用の名前索引 (初回使用時に作成)
+        self.names: Dict[int, ChannelNameIndex] = {}
+        # guild_id -> 担当者候補の一覧 (初回使用時に作成し、ロール変更・プロフィール保存で差分更新)
+        self.rosters: Dict[int, AssigneeRoster] = {}
+        self.db.profile_listeners.append(self._on_profiles_saved)
+        # close_ticket のメッセージ編集はギルドをまたいでこの数までに抑える
+        self._close_sem = asyncio.Semaphore(CLOSE_CONCURRENCY)
+        # ログ用フォーラムの スレッド名 -> スレッドID (アーカイブ済みを含む)
+        self.forum_store = bot.persistence.register("tickets_forum_threads", open_store(FORUM_INDEX_FILE))
+        self.forum_threads = ForumThreadIndex(self.forum_store)
+        # 担当者ごとの集計。イベントのたびに差分で更新する (/ticket admin stats)
+        self.analytics_store = bot.persistence.register("tickets_analytics", open_store(ANALYTICS_FILE))
+        self.analytics = TicketAnalytics(self.analytics_store)
+        self.db.timer_listeners.append(self._on_timer_removed)
+        # /ticket admin recover のチェックポイント ({guild_id: 進捗})。残っていれば起動後に再開する
+        self.recover_store = bot.persistence.register("tickets_recover", open_store(RECOVER_FILE))
+        self._recoveries: Dict[int, asyncio.Task] = {}
+        self._resume_task: Optional[asyncio.Task] = None
+
+    async def cog_load(self):
+        self._deadline_task = asyncio.create_task(self.run_deadlines())
+        self._resume_task = asyncio.create_task(self.resume_recoveries())
+
+    async def cog_unload(self):
+        if self._deadline_task:
+            self._deadline_task.cancel()
+        if self._resume_task:
+            self._resume_task.cancel()
+        # 復旧は中断してもチェックポイントから再開できる
+        for task in list(self._recoveries.values()):
+            task.cancel()
+        for gid, cid in list(self._mirror):
+            await self.flush_mirror(gid, cid)
+        self.db.timer_listeners.remove(self._reschedule)
+        self.db.activity_listeners.remove(self._postpone)
+        self.db.timer_listeners.remove(self._on_timer_removed)
+        self.db.profile_listeners.remove(self._on_profiles_saved)
+        self.bot.persistence.unregister(self.db)
+        self.bot.persistence.unregister(self.forum_store)
+        self.bot.persistence.unregister(self.analytics_store)
+        self.bot.persistence.unregister(self.recover_store)
+
+    def _on_timer_removed(self, gid: Optional[str] = None, cid: Optional[str] = None):
+        # チャンネルが消えたチケットは完了しないので、集計の未完了記録から外す
+        if cid is not None and cid not in self.db.timers.get(gid, {}):
+            self.analytics.channel_removed(gid, cid)
+
+    # --- 復旧スキャン ---
+    def _start_recovery(self, guild: discord.Guild, state: Dict[str, Any]):
+        task = asyncio.create_task(RecoveryJob(self, guild, state).run())
+        self._recoveries[guild.id] = task
+        def done(t: asyncio.Task):
+            self._recoveries.pop(guild.id, None)
+            if not t.cancelled() and t.exception() is not None:
+                logger.error(f"Recover job failed in guild {guild.id}: {t.exception()}")
+        task.add_done_callback(done)
+
+    def _finish_recovery(self, guild_id: int, state: Dict[str, Any]):
+        gid = str(guild_id)
+        if self.recover_store.data.get(gid) is state:
+            del self.recover_store.data[gid]
+            self.recover_store.mark_dirty(gid)
+        logger.info(f"Recovered {state['recovered']} tickets in guild {gid}")
 
-    def cog_unload(self):
-        self.check_inactivity_loop.cancel()
-        self.autosave_loop.cancel()
-        self.db.flush()
+    async def resume_recoveries(self):
+        await self.bot.wait_until_ready()
+        for gid, state in list(self.recover_store.data.items()):
+            guild = self.bot.get_guild(int(gid))
+            if guild is not None and guild.id not in self._recoveries:
+                logger.info(f"Resuming ticket recovery in guild {gid} ({len(state['done'])} channels done)")
+                self._start_recovery(guild, state)
+
+    def _roster(self, guild: discord.Guild) -> AssigneeRoster:
+        roster = self.rosters.get(guild.id)
+        if roster is None:
+            # プロフィールは毎回引き直す (シャード形式ではギルドのドキュメントが読み直されることがある)
+            gid = guild.id
+            profile_of = lambda mid: self.db.get_guild_config(gid).get("profiles", {}).get(str(mid)) or {}
+            roster = self.rosters[guild.id] = AssigneeRoster.build(guild, self.db.get_guild_config(guild.id), profile_of)
+        return roster
+
+    def _on_profiles_saved(self, guild_id=None, user_id=None):
+        if guild_id is None:
+            self.rosters.clear()
+        elif user_id is None:
+            # ロール・属性の定義が変わった可能性があるので作り直す
+            self.rosters.pop(int(guild_id), None)
+        else:
+            roster = self.rosters.get(int(guild_id))
+            if roster is not None:
+                roster.profile_changed(int(user_id))
 
-    @tasks.loop(seconds=60)
-    async def autosave_loop(self):
-        self.db.flush()
+    @commands.Cog.listener()
+    async def on_member_update(self, before: discord.Member, after: discord.Member):
+        roster = self.rosters.get(after.guild.id)
+        if roster is not None and before.roles != after.roles:
+            roster.upsert(after)
 
-    def get_assignee_options(self, guild: discord.Guild, sort_key: str = None) -> List[discord.SelectOption]:
-        g_conf = self.db.get_guild_config(guild.id)
-        a_rid = g_conf.get("assignee_role_id")
-        q_rid = g_conf.get("assignee_qual_role_id")
-        a_role = guild.get_role(a_rid) if a_rid else None
-        q_role = guild.get_role(q_rid) if q_rid else None
-        if not a_role and not q_role:
-            return []
-        
-        target_members = set()
-        if a_role:
-            target_members.update(a_role.members)
-        if q_role:
-            target_members.update(q_role.members)
-        
-        is_desc = True 
-        if sort_key:
-            attr_def = g_conf.get("attributes", {}).get(sort_key, {})
-            if attr_def.get("order") == "asc":
-                is_desc = False
-
-        member_list = []
-        for member in target_members:
-            if member.bot:
-                continue
-            p = self.db.get_user_profile(guild.id, member.id)
-            val = p.get("attributes", {}).get(sort_key, 0) if sort_key else 0
-            if sort_key and val == 0 and not is_desc:
-                val = 99999999
-            member_list.append({"member": member, "val": val})
-        
-        member_list.sort(key=lambda x: (x["val"] if not is_desc else -x["val"]))
+    @commands.Cog.listener()
+    async def on_member_remove(self, member: discord.Member):
+        roster = self.rosters.get(member.guild.id)
+        if roster is not None:
+            roster.remove(member.id)
+
+    @commands.Cog.listener()
+    async def on_guild_role_delete(self, role: discord.Role):
+        self.rosters.pop(role.guild.id, None)
+
+    def get_assignee_options(self, guild: discord.Guild, sort_key: str = None, limit: int = 25) -> List[discord.SelectOption]:
+        roster = self._roster(guild)
         options = []
-        for s in member_list:
-            member = s["member"]
+        for member_id, val in roster.ordered(sort_key):
+            member = guild.get_member(member_id)
+            if member is None:
+                continue
             desc_text = f"{member.display_name} さん"
             if sort_key:
-                raw_val = s["val"]
-                val_str = raw_val if raw_val != 99999999 else '-'
+                val_str = val if val != UNSET_ASC else '-'
                 desc_text = f"[{sort_key}: {val_str}]"
-            status_mark = "🟢" if (a_role and a_role in member.roles) else "💤"
+            status_mark = "🟢" if roster.accepting[member_id] else "💤"
             options.append(discord.SelectOption(label=member.display_name, value=str(member.id), description=f"{status_mark} {desc_text}", emoji="👤"))
+            if len(options) >= limit:
+                break
         return options
 
-    def _get_setting(self, guild_id, profile, key, system_default):
-        val = profile.get(key)
-        if val is not None:
-            return val
-        g_conf = self.db.get_guild_config(guild_id)
-        return g_conf.get(key, system_default)
-
     def check_accept_status(self, guild, assignee, creator):
         g_conf = self.db.get_guild_config(guild.id)
         rid = g_conf.get("assignee_role_id")
@@ -857,18 +1598,14 @@ class Tickets(commands.Cog):
             if role and role not in assignee.roles:
                 return "⚠️ 現在、この担当者は受付を停止しています (休憩中)。"
         p = self.db.get_user_profile(guild.id, assignee.id)
-        has_category = p.get("category_id") or g_conf.get("category_id")
-        if not (has_category or bool(p.get("attributes"))):
+        e = self.db.effective(guild.id, assignee.id)
+        if not (e.category_id or bool(p.get("attributes"))):
             return f"⚠️ {assignee.display_name} さんは、受付設定が未完了です。"
         if creator.id in p.get("blacklist", []):
             return "⛔ 受付不可 (BL)"
         
-        max_s = p.get("max_slots") or g_conf.get("max_slots", DEFAULT_MAX_SLOTS)
-        current_user_tickets = 0
-        gid = str(guild.id)
-        for t in self.db.timers.get(gid, {}).values():
-            if t.get("assignee_id") == assignee.id and t.get("creator_id") == creator.id and t.get("active_tickets"):
-                current_user_tickets += len(t.get("active_tickets", []))
+        max_s = e.max_slots
+        current_user_tickets = self.db.active_index(guild.id).active_for(assignee.id, creator.id)
         if current_user_tickets >= max_s:
             return f"⛔ あなたは既に {current_user_tickets}件 依頼中です。(上限: {max_s}件)"
         return None
@@ -934,64 +1671,34 @@ class Tickets(commands.Cog):
         if isinstance(creator, (discord.User, discord.Object)):
             creator = guild.get_member(creator.id) or creator
             
-        p = self.db.get_user_profile(guild.id, assignee.id)
-        reuse = self._get_setting(guild.id, p, "reuse_channel", DEFAULT_REUSE_CHANNEL)
+        e = self.db.effective(guild.id, assignee.id)
+        reuse = e.reuse_channel
         target_channel = None
         gid = str(guild.id)
         if reuse:
-            for cid, data in self.db.timers.get(gid, {}).items():
-                if data.get("assignee_id") == assignee.id and data.get("creator_id") == creator.id:
-                    ch = guild.get_channel(int(cid))
-                    if ch:
-                        target_channel = ch
-                        break
+            for cid in self.db.reusable_channels(guild.id, assignee.id, creator.id):
+                ch = guild.get_channel(int(cid))
+                if ch:
+                    target_channel = ch
+                    break
         if not target_channel:
-            target_channel = await self._create_new_channel(guild, creator, assignee, p, title)
+            target_channel = await self._create_new_channel(guild, creator, assignee, e, title)
         
         mentions = [assignee.mention]
-        t_rids = p.get("mention_roles")
-        if not t_rids:
-            t_rids = self.db.get_guild_config(guild.id).get("mention_roles", [])
-        for rid in t_rids:
+        for rid in e.mention_roles:
             r = guild.get_role(rid)
             if r and r.mention not in mentions:
                 mentions.append(r.mention)
             
-        tmpl = p.get("template") or self.db.get_guild_config(guild.id).get("template")
+        tmpl = e.template
         desc_head = ""
         if tmpl:
-            tmpl = tmpl.replace("{creator}", creator.mention).replace("{user}", creator.mention).replace("{creator_name}", creator_name).replace("{assignee}", assignee.mention).replace("{title}", title).replace("\\n", "\n")
-            
-            # {channel: xxx} または {thread: xxx} の動的探索機能
-            def channel_replacer(match):
-                query = match.group(1)
-                parts = [pt.strip() for pt in query.split(':')]
-                target = None
-                
-                if len(parts) == 1:
-                    name = parts[0].lower()
-                    target = discord.utils.find(lambda c: c.name.lower() == name, guild.channels) or \
-                             discord.utils.find(lambda t: t.name.lower() == name, guild.threads)
-                elif len(parts) == 2:
-                    p1, p2 = parts[0].lower(), parts[1].lower()
-                    cat = discord.utils.find(lambda c: isinstance(c, discord.CategoryChannel) and c.name.lower() == p1, guild.categories)
-                    if cat:
-                        target = discord.utils.find(lambda c: c.name.lower() == p2, cat.channels)
-                    if not target:
-                        ch = discord.utils.find(lambda c: c.name.lower() == p1, guild.channels)
-                        if ch and hasattr(ch, 'threads'):
-                            target = discord.utils.find(lambda t: t.name.lower() == p2, ch.threads)
-                elif len(parts) >= 3:
-                    cat_name, ch_name, th_name = parts[0].lower(), parts[1].lower(), parts[2].lower()
-                    cat = discord.utils.find(lambda c: isinstance(c, discord.CategoryChannel) and c.name.lower() == cat_name, guild.categories)
-                    if cat:
-                        ch = discord.utils.find(lambda c: c.name.lower() == ch_name, cat.channels)
-                        if ch and hasattr(ch, 'threads'):
-                            target = discord.utils.find(lambda t: t.name.lower() == th_name, ch.threads)
-                
-                return target.mention if target else match.group(0)
-
-            tmpl = re.sub(r"\{(?:channel|thread):(.*?)\}", channel_replacer, tmpl)
+            values = {"creator": creator.mention, "user": creator.mention, "creator_name": creator_name, "assignee": assignee.mention, "title": title}
+            # {channel: xxx} または {thread: xxx} の動的探索は名前索引で解決する
+            def resolve(parts):
+                target = self._name_index(guild).resolve(parts)
+                return target.mention if target else None
+            tmpl = render(compile_template(tmpl), values, resolve)
             desc_head = tmpl + "\n\n"
         
         embed = discord.Embed(title=f"案件: {title}", description=f"{desc_head}担当: {assignee.mention}", color=discord.Color.blue(), timestamp=datetime.datetime.now())
@@ -1004,24 +1711,29 @@ class Tickets(commands.Cog):
         embed.add_field(name="⚠️ 次のステップ", value="下の **「🎵 詳細入力」** ボタンを押して、内容を入力してください。", inline=False)
         
         msg = await target_channel.send(content=" ".join(mentions), embed=embed, view=TicketControlView())
-        cd = self.db.timers[gid][str(target_channel.id)]
-        if "tasks" not in cd:
-            cd["tasks"] = {}
-        cd["tasks"][str(msg.id)] = []
+        cd = self.db.promote(gid, target_channel.id)
+        if cd.tasks is None:
+            cd.tasks = {}
+        cd.tasks[msg.id] = []
+        # 以降の編集はこの内容から組み立てる (メッセージを読み直さない)
+        if cd.embeds is None:
+            cd.embeds = {}
+        cd.embeds[msg.id] = card_from_embed(embed)
         
-        cd["active_tickets"].append(msg.id)
-        cd["last_message_at"] = datetime.datetime.now().isoformat()
-        cd["reminded"] = False
-        self.db.save_timers()
-        await self._init_forum_thread(target_channel, embed, p, mentions)
+        cd.active_tickets.append(msg.id)
+        cd.touch()
+        cd.reminded = False
+        self.db.save_timers(gid, target_channel.id)
+        self.analytics.opened(guild.id, assignee.id, target_channel.id, msg.id)
+        await self._init_forum_thread(target_channel, embed, e, mentions)
         return target_channel, msg
 
-    async def _create_new_channel(self, guild, creator, assignee, profile, title):
-        cat_id = profile.get("category_id") or self.db.get_guild_config(guild.id).get("category_id")
+    async def _create_new_channel(self, guild, creator, assignee, eff: EffectiveProfile, title):
+        cat_id = eff.category_id
         category = guild.get_channel(cat_id) if cat_id else None
         date_str = datetime.datetime.now().strftime("%y%m%d")
         safe_title = title.replace(" ", "_").lower()[:10]
-        fmt = profile.get("name_format") or self.db.get_guild_config(guild.id).get("name_format") or "{creator}"
+        fmt = eff.name_format or "{creator}"
         ch_name = fmt.format(date=date_str, creator=creator.name.lower(), assignee=assignee.name.lower(), title=safe_title, id=creator.id, assignee_id=assignee.id)
         
         overwrites = {
@@ -1030,68 +1742,63 @@ class Tickets(commands.Cog):
             assignee: discord.PermissionOverwrite(read_messages=True, send_messages=True),
             guild.me: discord.PermissionOverwrite(read_messages=True, manage_channels=True)
         }
-        m_rids = profile.get("mention_roles")
-        if not m_rids:
-            m_rids = self.db.get_guild_config(guild.id).get("mention_roles", [])
-        for rid in m_rids:
+        for rid in eff.mention_roles:
             r = guild.get_role(rid)
             if r:
                 overwrites[r] = discord.PermissionOverwrite(read_messages=True, send_messages=True)
             
         channel = await guild.create_text_channel(name=ch_name, category=category, overwrites=overwrites)
-        self.db.timers[str(guild.id)][str(channel.id)] = {
-            "last_message_at": datetime.datetime.now().isoformat(),
-            "enabled": self._get_setting(guild.id, profile, "notify_enabled", DEFAULT_NOTIFY_ENABLED),
-            "timeout_hours": self._get_setting(guild.id, profile, "timeout_hours", DEFAULT_TIMEOUT_HOURS),
-            "assignee_id": assignee.id, "creator_id": creator.id, "active_tickets": [],
-            "auto_close_enabled": self._get_setting(guild.id, profile, "auto_close_enabled", DEFAULT_AUTO_CLOSE_ENABLED),
-            "auto_close_days": self._get_setting(guild.id, profile, "auto_close_days", DEFAULT_AUTO_CLOSE_DAYS),
-            "mirror_thread_id": None, "last_log_at": None, "tasks": {}
-        }
-        self.db.save_timers()
+        self.db.timers[str(guild.id)][str(channel.id)] = TicketTimer(
+            assignee.id, creator.id,
+            enabled=eff.notify_enabled,
+            timeout_hours=eff.timeout_hours,
+            auto_close_enabled=eff.auto_close_enabled,
+            auto_close_days=eff.auto_close_days,
+        )
+        self.db.save_timers(guild.id, channel.id)
         return channel
 
-    async def _init_forum_thread(self, channel, embed, profile, mentions):
-        fid = profile.get("transcript_id") or self.db.get_guild_config(channel.guild.id).get("transcript_id")
+    async def _init_forum_thread(self, channel, embed, eff: EffectiveProfile, mentions):
+        fid = eff.transcript_id
         if not fid:
             return 
         forum = channel.guild.get_channel(fid)
         if not isinstance(forum, discord.ForumChannel):
             return
         gid, cid = str(channel.guild.id), str(channel.id)
-        t_data = self.db.timers.get(gid, {}).get(cid, {})
+        t_data = self.db.timers.get(gid, {}).get(cid)
         thread = None
         created_new = False
 
-        if t_data.get("mirror_thread_id"):
+        if t_data and t_data.mirror_thread_id:
             try:
-                thread = await channel.guild.fetch_channel(t_data["mirror_thread_id"])
+                thread = await self.threads.get(channel.guild, t_data.mirror_thread_id)
             except:
                 pass 
 
         if not thread:
-            candidates = []
-            try: 
-                for t in forum.threads:
-                    candidates.append(t)
-                async for t in forum.archived_threads(limit=50):
-                    candidates.append(t)
-            except:
-                pass
-            for t in candidates:
-                if t.name == channel.name:
-                    thread = t
-                    self.db.timers[gid][cid]["mirror_thread_id"] = thread.id
-                    self.db.save_timers()
-                    break
+            # 同名のスレッドはアーカイブ済みも含めて索引から探す (初回のみ全件走査)
+            try:
+                await self.forum_threads.ensure_seeded(forum)
+            except Exception as e:
+                logger.warning(f"Failed to index forum {forum.id}: {e}")
+            tid = self.forum_threads.get(forum, channel.name)
+            if tid:
+                try:
+                    thread = await self.threads.get(channel.guild, tid)
+                    self.db.set_mirror_thread(gid, cid, thread.id)
+                except discord.NotFound:
+                    self.forum_threads.discard(forum, channel.name, tid)
+                except:
+                    pass
 
         if not thread:
             try:
                 mention_str = " ".join(mentions) if mentions else ""
                 t_w_msg = await forum.create_thread(name=channel.name, content=f"🆕 **New Ticket Log Created** (Source: {channel.mention})\n{mention_str}", embed=embed)
                 thread = t_w_msg.thread
-                self.db.timers[gid][cid]["mirror_thread_id"] = thread.id
-                self.db.save_timers()
+                self.db.set_mirror_thread(gid, cid, thread.id)
+                self.forum_threads.set(forum, thread.name, thread.id)
             except:
                 return
         else:
@@ -1101,73 +1808,144 @@ class Tickets(commands.Cog):
         if mentions and not created_new:
             await thread.send(content=f"🔔 **Notification:** {' '.join(mentions)}")
 
-    async def log_to_forum(self, channel, content=None, embed=None, attachments=None, is_update=False, close_thread=False, view=None, target_msg_id=None):
+    async def log_to_forum(self, channel, content=None, embed=None, attachments=None, is_update=False, close_thread=False, view=None, target_msg_id=None, files=None):
         gid, cid = str(channel.guild.id), str(channel.id)
-        if cid not in self.db.timers.get(gid, {}):
+        t_data = self.db.timers.get(gid, {}).get(cid)
+        if t_data is None:
             return
-        t_data = self.db.timers[gid][cid]
-        tid = t_data.get("mirror_thread_id")
+        tid = t_data.mirror_thread_id
         if not tid:
             return
+        if not attachments and not files and not is_update and not close_thread and not view:
+            last_log = t_data.last_log_at
+            cooldown = self.db.effective(channel.guild.id, t_data.assignee_id).cooldown
+            if last_log and time.time() - last_log < cooldown:
+                # クールダウン中は捨てずに溜めておき、明けた時点でまとめて送る
+                self._buffer_mirror(channel, embed if embed is not None else discord.Embed(description=content), last_log + cooldown)
+                return
         try:
-            thread = await channel.guild.fetch_channel(tid)
+            thread = await self.threads.get(channel.guild, tid)
         except:
-            return 
-        if not attachments and not is_update and not close_thread and not view:
-            last_log, assignee_id = t_data.get("last_log_at"), t_data.get("assignee_id")
-            prof = self.db.get_user_profile(channel.guild.id, assignee_id) if assignee_id else {}
-            cooldown = self._get_setting(channel.guild.id, prof, "cooldown", DEFAULT_LOG_COOLDOWN)
-            if last_log and (datetime.datetime.now() - datetime.datetime.fromisoformat(last_log)).total_seconds() < cooldown:
-                return 
+            return
+        # 溜まっている分を先に送って順序を保つ
+        pending = self._take_mirror(gid, cid)
+        if pending is not None and pending.embeds:
+            await self._send_to_thread(channel, thread, t_data, embeds=pending.embeds, mirror_attempts=pending.attempts)
+        await self._send_to_thread(channel, thread, t_data, content=content, embeds=[embed] if embed else [], attachments=attachments, close_thread=close_thread, view=view, target_msg_id=target_msg_id, files=files)
+
+    # --- ログのまとめ送り ---
+    def _buffer_mirror(self, channel, embed: discord.Embed, due: float):
+        key = (str(channel.guild.id), str(channel.id))
+        buf = self._mirror.get(key)
+        if buf is None:
+            buf = self._mirror[key] = MirrorBuffer(channel)
+        buf.embeds.append(embed)
+        buf.chars += len(embed)
+        if len(buf.embeds) >= MIRROR_MAX_EMBEDS or buf.chars >= MIRROR_MAX_CHARS:
+            # 1投稿分たまったらクールダウンを待たずに送る
+            if buf.task is not None:
+                buf.task.cancel()
+            buf.task = asyncio.create_task(self._flush_mirror_later(key, 0))
+        elif buf.task is None:
+            buf.task = asyncio.create_task(self._flush_mirror_later(key, max(0.0, due - time.time())))
+
+    def _take_mirror(self, gid: str, cid: str) -> Optional[MirrorBuffer]:
+        buf = self._mirror.pop((gid, cid), None)
+        if buf is not None and buf.task is not None and buf.task is not asyncio.current_task():
+            buf.task.cancel()
+        return buf
+
+    def _requeue_mirror(self, channel, embeds: List[discord.Embed], attempts: int):
+        """送れなかったログをバッファの先頭に戻し、少し待って再送します。"""
+        if attempts >= MIRROR_MAX_RETRIES:
+            logger.warning(f"Dropped {len(embeds)} buffered log embeds for {channel.id} after {attempts} failed sends")
+            return
+        key = (str(channel.guild.id), str(channel.id))
+        buf = self._mirror.get(key)
+        if buf is None:
+            buf = self._mirror[key] = MirrorBuffer(channel)
+        buf.embeds[:0] = embeds
+        buf.chars += sum(len(e) for e in embeds)
+        buf.attempts = max(buf.attempts, attempts)
+        if buf.task is None:
+            buf.task = asyncio.create_task(self._flush_mirror_later(key, MIRROR_RETRY_SECONDS))
+
+    async def _flush_mirror_later(self, key, delay: float):
+        if delay:
+            await asyncio.sleep(delay)
+        await self.flush_mirror(*key)
+
+    async def flush_mirror(self, gid: str, cid: str):
+        """溜まっているログを (Embed を詰めた) 投稿にまとめて送ります。"""
+        buf = self._take_mirror(gid, cid)
+        if buf is None:
+            return
+        t_data = self.db.timers.get(gid, {}).get(cid)
+        if not buf.embeds or t_data is None or not t_data.mirror_thread_id:
+            return
+        try:
+            thread = await self.threads.get(buf.channel.guild, t_data.mirror_thread_id)
+        except Exception as e:
+            logger.error(f"Log Error: {e}")
+            self._requeue_mirror(buf.channel, buf.embeds, buf.attempts + 1)
+            return
+        await self._send_to_thread(buf.channel, thread, t_data, embeds=buf.embeds, mirror_attempts=buf.attempts)
+
+    @staticmethod
+    def _pack_embeds(embeds: List[discord.Embed]) -> List[List[discord.Embed]]:
+        """Embed を1投稿あたりの上限 (件数 / 合計文字数) に収まるように分けます。"""
+        packs: List[List[discord.Embed]] = []
+        current: List[discord.Embed] = []
+        chars = 0
+        for e in embeds:
+            n = len(e)
+            if current and (len(current) >= MIRROR_MAX_EMBEDS or chars + n > MIRROR_MAX_CHARS):
+                packs.append(current)
+                current, chars = [], 0
+            current.append(e)
+            chars += n
+        packs.append(current)
+        return packs
+
+    @staticmethod
+    def _clip(text: str, limit: int) -> str:
+        return text if len(text) <= limit else text[:limit - 1] + "…"
+
+    async def _send_to_thread(self, channel, thread, t_data, content=None, embeds=None, attachments=None, close_thread=False, view=None, target_msg_id=None, files=None, mirror_attempts: Optional[int] = None):
+        """mirror_attempts を渡した場合 (まとめ送り) は、送れなかった Embed をバッファに戻して再送します。"""
+        gid, cid = str(channel.guild.id), str(channel.id)
+        embeds = list(embeds or [])
+        # 1件で上限を超える Embed は何度送っても通らないので、ここで捨てる
+        oversized = [e for e in embeds if len(e) > MIRROR_MAX_CHARS]
+        if oversized:
+            logger.warning(f"Dropped {len(oversized)} log embeds over {MIRROR_MAX_CHARS} chars for {cid}")
+            embeds = [e for e in embeds if len(e) <= MIRROR_MAX_CHARS]
+        # 再送用に、タスクリストを付ける前のもの
+        original = list(embeds)
         final_content = content
         if not close_thread:
-            aid = t_data.get("assignee_id")
-            g_conf = self.db.get_guild_config(channel.guild.id)
-            m_list = [] 
-            
-            base_rids = None
-            log_rids = None
-            if aid:
-                p = self.db.get_user_profile(channel.guild.id, aid)
-                base_rids = p.get("mention_roles")
-                log_rids = p.get("log_roles")
-            if not base_rids:
-                base_rids = g_conf.get("mention_roles", [])
-            if not log_rids:
-                log_rids = g_conf.get("log_roles", [])
-            
-            all_rids = list(set((base_rids or []) + (log_rids or [])))
-
-            for rid in all_rids:
-                if f"<@&{rid}>" not in m_list:
-                    m_list.append(f"<@&{rid}>")
-            if view:
-                mention_str = " ".join(m_list)
-                final_content = f"{mention_str}\n{content}" if content else mention_str
-            elif m_list:
-                mention_str = " ".join(m_list)
+            mention_str = self.db.effective(channel.guild.id, t_data.assignee_id).log_mentions
+            if view or mention_str:
                 final_content = f"{mention_str}\n{content}" if content else mention_str
 
         # Append Task List if exists
         task_view = None
         ticket_msg_id = target_msg_id
-        if ticket_msg_id is None and t_data.get("active_tickets"):
-            ticket_msg_id = t_data["active_tickets"][-1]
+        if ticket_msg_id is None and t_data.active_tickets:
+            ticket_msg_id = t_data.active_tickets[-1]
             
-        task_list = t_data.get("tasks", {}).get(str(ticket_msg_id), []) if ticket_msg_id else []
+        task_list = t_data.task_list(ticket_msg_id) if ticket_msg_id else []
         if task_list and not close_thread:
-            task_str = "\n──────────────\n**📋 タスクリスト**\n"
+            task_str = f"\n──────────────\n{TASK_LIST_HEADER}\n"
             for t in task_list:
-                mark = "✅" if t["completed"] else "☑️"
-                task_str += f"{mark} {t['name']}\n"
+                mark = "✅" if t.completed else "☑️"
+                task_str += f"{mark} {t.name}\n"
             
-            if embed:
+            if embeds:
                 # Add to description or last field if possible, or new field?
                 # User preference: "Embedの末尾（または description の最後）"
-                if embed.description:
-                    embed.description += task_str
-                else:
-                    embed.description = task_str
+                embed = embeds[-1] = embeds[-1].copy()
+                embed.description = self._clip(f"{embed.description or ''}{task_str}", EMBED_DESCRIPTION_LIMIT)
             else:
                 # If no embed, make one? Or append to content.
                 # Usually logs have embeds or content. If only content, append to content.
@@ -1183,37 +1961,143 @@ class Tickets(commands.Cog):
         # Determine final view
         final_view = view if view else task_view
 
-        files = [await a.to_file() for a in attachments] if attachments else []
+        relayed, links = await self.bot.attachment_relay.prepare(attachments, channel.guild.filesize_limit) if attachments else ([], [])
+        files = (files or []) + relayed
+        if links:
+            # アップロード上限を超えた分はリンクで残す
+            link_str = "\n".join(f"📎 {url}" for url in links)
+            final_content = f"{final_content}\n{link_str}" if final_content else link_str
+        if final_content:
+            final_content = self._clip(final_content, MESSAGE_CONTENT_LIMIT)
+        sent = 0
         try:
-            await thread.send(content=final_content, embed=embed, files=files, view=final_view)
-            t_data["last_log_at"] = datetime.datetime.now().isoformat()
-            self.db.save_timers()
+            # 本文・添付・ボタンは最後の投稿に付ける
+            packs = self._pack_embeds(embeds)
+            for pack in packs[:-1]:
+                await thread.send(embeds=pack)
+                sent += len(pack)
+            await thread.send(content=final_content, embeds=packs[-1], files=files, view=final_view)
+            sent = len(embeds)
+            t_data.last_log_at = time.time()
+            self.db.save_timers(gid, cid)
             if close_thread:
                 await thread.edit(archived=True, locked=True)
         except Exception as e:
-            logger.error(f"Log Error: {e}")
+            unsent = original[sent:]
+            # 400 (不正なリクエスト) は再送しても通らない
+            permanent = isinstance(e, discord.HTTPException) and e.status == 400
+            if unsent and mirror_attempts is not None and not permanent:
+                logger.warning(f"Log Error: {e} ({len(unsent)} embeds requeued)")
+                self._requeue_mirror(channel, unsent, mirror_attempts + 1)
+            else:
+                logger.error(f"Log Error: {e}" + (f" ({len(unsent)} embeds lost)" if unsent else ""))
 
-    async def close_ticket(self, channel, user, ticket_msg_id=None):
+    async def edit_ticket_card(self, channel, msg_id: int, update: Callable[[TicketCard], None], view=None, message=None) -> Tuple[Optional[TicketCard], bool]:
+        """
+        チケットメッセージの Embed を、保存済みの内容に update を適用したもので1回だけ編集します。
+        内容が変わらなければ編集しません。(編集後の内容, 編集したか) を返し、Embed の無いメッセージなら (None, False) です。
+        """
         gid, cid = str(channel.guild.id), str(channel.id)
-        if cid not in self.db.timers.get(gid, {}):
-            return
-        active_tickets = self.db.timers[gid][cid].get("active_tickets", [])
+        msg_id = int(msg_id)
+        t = self.db.timers.get(gid, {}).get(cid)
+        card = t.card(msg_id) if t is not None else None
+        seeded = card is None
+        if seeded:
+            # 内容を保存する前に作られたチケットだけ、一度メッセージを読んで取り込む
+            if message is None:
+                message = next((m for m in self.bot.cached_messages if m.id == msg_id and m.channel.id == channel.id), None)
+            if message is None:
+                message = await channel.fetch_message(msg_id)
+            if not message.embeds:
+                return None, False
+            card = card_from_embed(message.embeds[0])
+        new = card.copy()
+        update(new)
+        changed = new != card
+        if changed:
+            kwargs = {"embed": render_card(new)}
+            if view is not None:
+                kwargs["view"] = view
+            await channel.get_partial_message(msg_id).edit(**kwargs)
+        if t is not None and (changed or seeded):
+            if t.embeds is None:
+                t.embeds = {}
+            t.embeds[msg_id] = new
+            self.db.save_timers(gid, cid)
+        return new, changed
+
+    async def close_ticket(self, channel, user, ticket_msg_id=None) -> Dict[int, Optional[str]]:
+        """
+        チケットを完了にします。メッセージの編集とフォーラムへのログ送信 (スレッドのアーカイブ) は並行して行います。
+        メッセージIDごとの結果 (成功は None、失敗は理由) を返します。
+        """
+        gid, cid = str(channel.guild.id), str(channel.id)
+        t_data = self.db.timers.get(gid, {}).get(cid)
+        if t_data is None:
+            return {}
+        active_tickets = t_data.active_tickets if t_data.active_tickets is not None else []
         to_close = [ticket_msg_id] if ticket_msg_id else active_tickets.copy()
         for msg_id in to_close:
-            try:
-                msg = await channel.fetch_message(msg_id)
-                if msg and msg.embeds:
-                    embed = msg.embeds[0]
-                    embed.title = f"✅ [完了] {embed.title}"
-                    embed.color = discord.Color.grey()
-                    await msg.edit(embed=embed, view=ReopenView())
-            except:
-                pass
             if msg_id in active_tickets:
                 active_tickets.remove(msg_id)
-        self.db.timers[gid][cid]["active_tickets"] = active_tickets
-        self.db.save_timers()
-        await self.log_to_forum(channel, content=f"✅ **{user.display_name} によって完了とマークされました**", close_thread=(len(active_tickets) == 0))
+                self.analytics.closed(gid, t_data.assignee_id, msg_id, t_data.task_list(msg_id))
+        t_data.active_tickets = active_tickets
+        self.db.save_timers(gid, cid)
+
+        edits = asyncio.gather(*(self._close_message(channel, msg_id) for msg_id in to_close))
+        log = self.archive_and_log(channel, f"✅ **{user.display_name} によって完了とマークされました**", close_thread=(len(active_tickets) == 0))
+        outcomes, _ = await asyncio.gather(edits, log)
+        if not t_data.active_tickets:
+            # ログ送信が終わってから、完了したチケットをコールド層へ移す
+            self.db.demote(gid, cid)
+        results = dict(zip(to_close, outcomes))
+        failed = {m: r for m, r in results.items() if r}
+        if failed:
+            logger.warning(f"close_ticket {cid}: {len(failed)}/{len(results)} messages not updated: {failed}")
+        return results
+
+    async def archive_and_log(self, channel, content: str, close_thread: bool = True):
+        """
+        最後のログを送ってスレッドを閉じます。close_thread の時はチャンネル履歴のアーカイブを添付します。
+        """
+        archive = None
+        t_data = self.db.timers.get(str(channel.guild.id), {}).get(str(channel.id))
+        if close_thread and t_data is not None and t_data.mirror_thread_id and self.db.effective(channel.guild.id, t_data.assignee_id).archive_transcripts:
+            try:
+                archive = await export_transcript(channel)
+            except Exception as e:
+                logger.error(f"Transcript export failed for {channel.id}: {e}")
+        try:
+            files = archive.to_files(channel.guild.filesize_limit) if archive else None
+            if archive and len(files) < len(archive.paths()):
+                content += f"\n⚠️ アーカイブの一部がアップロード上限を超えたため添付していません ({archive.count}件)"
+            await self.log_to_forum(channel, content=content, close_thread=close_thread, files=files)
+        finally:
+            if archive:
+                archive.cleanup()
+
+    async def _close_message(self, channel, msg_id: int, msg=None) -> Optional[str]:
+        def update(card: TicketCard):
+            if not (card.title or "").startswith(CLOSED_TITLE_PREFIX):
+                card.title = f"{CLOSED_TITLE_PREFIX}{card.title or ''}"
+            card.color = discord.Color.grey().value
+        async with self._close_sem:
+            try:
+                card, _ = await self.edit_ticket_card(channel, msg_id, update, view=ReopenView(), message=msg)
+                return None if card is not None else "no embed"
+            except discord.NotFound:
+                return "not found"
+            except discord.Forbidden:
+                return "forbidden"
+            except Exception as e:
+                return str(e) or type(e).__name__
+
+    @staticmethod
+    def close_summary(results: Dict[int, Optional[str]]) -> str:
+        failed = [m for m, r in results.items() if r]
+        if not failed:
+            return ""
+        return f"\n⚠️ {len(results) - len(failed)}/{len(results)}件のメッセージを更新しました (失敗: {', '.join(str(m) for m in failed[:5])})"
 
     async def toggle_reception(self, interaction: discord.Interaction):
         g_conf = self.db.get_guild_config(interaction.guild_id)
@@ -1233,27 +2117,75 @@ class Tickets(commands.Cog):
             await user.add_roles(role)
             await interaction.response.send_message("🟢 受付を開始しました。", ephemeral=True)
 
+    def _name_index(self, guild: discord.Guild) -> ChannelNameIndex:
+        idx = self.names.get(guild.id)
+        if idx is None:
+            idx = self.names[guild.id] = ChannelNameIndex(guild)
+        return idx
+
+    def _index_event(self, guild, remove=None, add=None):
+        idx = self.names.get(guild.id)
+        if idx is None:
+            return
+        if remove is not None:
+            idx.remove(remove)
+        if add is not None:
+            idx.add(add)
+
+    @commands.Cog.listener()
+    async def on_guild_channel_create(self, channel):
+        self._index_event(channel.guild, add=channel)
+
+    @commands.Cog.listener()
+    async def on_guild_channel_update(self, before, after):
+        self._index_event(after.guild, remove=before, add=after)
+
+    @commands.Cog.listener()
+    async def on_guild_channel_delete(self, channel):
+        self._index_event(channel.guild, remove=channel)
+
+    @commands.Cog.listener()
+    async def on_thread_create(self, thread):
+        self._index_event(thread.guild, add=thread)
+        self.forum_threads.on_create(thread)
+
+    @commands.Cog.listener()
+    async def on_thread_update(self, before, after):
+        self._index_event(after.guild, remove=before, add=after)
+        self.forum_threads.on_update(before, after)
+
+    @commands.Cog.listener()
+    async def on_thread_delete(self, thread):
+        self._index_event(thread.guild, remove=thread)
+
+    @commands.Cog.listener()
+    async def on_guild_remove(self, guild):
+        self.names.pop(guild.id, None)
+        self.rosters.pop(guild.id, None)
+
+    @commands.Cog.listener()
+    async def on_raw_thread_update(self, payload):
+        self.threads.invalidate(payload.thread_id)
+
+    @commands.Cog.listener()
+    async def on_raw_thread_delete(self, payload):
+        self.threads.invalidate(payload.thread_id)
+        self.forum_threads.on_delete(payload.guild_id, payload.parent_id, payload.thread_id)
+
     @commands.Cog.listener()
     async def on_message(self, message):
         if message.author.bot or not message.guild:
             return
         gid, cid = str(message.guild.id), str(message.channel.id)
-        if cid in self.db.timers.get(gid, {}):
-            self.db.timers[gid][cid].update({"last_message_at": datetime.datetime.now().isoformat(), "reminded": False, "close_confirming": False, "enabled": True})
-            self.db.save_timers()
+        t_data = self.db.touch_activity(gid, cid)
+        if t_data is not None:
+            self.analytics.message(gid, cid, message.author.id)
             
-            g_conf = self.db.get_guild_config(message.guild.id)
-            ignore_rids = g_conf.get("ignore_roles", []) or []
-
-            t_data = self.db.timers.get(gid, {}).get(cid, {})
-            aid = t_data.get("assignee_id")
-            if aid:
-                p = self.db.get_user_profile(message.guild.id, aid)
-                p_ignore = p.get("ignore_roles")
-                if p_ignore:
-                    ignore_rids = list(set(ignore_rids + p_ignore))
-
-            if any(r.id in ignore_rids for r in message.author.roles):
+            eff = self.db.effective(message.guild.id, t_data.assignee_id)
+            if not eff.mirror_messages:
+                # アーカイブのみで運用する場合
+                return
+            if eff.ignore_roles and any(r.id in eff.ignore_roles for r in message.author.roles):
                 return
 
             desc = f"{message.content}\n\n🔗 [Jump]({message.jump_url})"
@@ -1261,43 +2193,100 @@ class Tickets(commands.Cog):
             e.set_author(name=message.author.display_name, icon_url=message.author.display_avatar.url)
             await self.log_to_forum(message.channel, embed=e, attachments=message.attachments)
 
-    @tasks.loop(minutes=10)
-    async def check_inactivity_loop(self):
+    @staticmethod
+    def next_deadline(info: TicketTimer) -> Optional[float]:
+        """次に自動削除確認か未稼働通知を出す時刻 (epoch 秒)。何も予定が無ければ None。"""
+        if not info.enabled or not info.active_tickets or not info.last_message_at:
+            return None
+        deadlines = []
+        if info.auto_close_enabled and not info.close_confirming:
+            limit_days = info.auto_close_days if info.auto_close_days is not None else DEFAULT_AUTO_CLOSE_DAYS
+            deadlines.append(info.last_message_at + limit_days * 86400)
+        if not info.reminded:
+            limit_hours = info.timeout_hours if info.timeout_hours is not None else DEFAULT_TIMEOUT_HOURS
+            deadlines.append(info.last_message_at + limit_hours * 3600)
+        return min(deadlines) if deadlines else None
+
+    def _reschedule(self, gid: Optional[str] = None, cid: Optional[str] = None):
+        # save_timers から呼ばれる。ギルド単位 / 全体の保存は該当分をまとめて入れ直す
+        if gid is None:
+            items = [(g, c, t) for g, guild_timers in list(self.db.timers.items()) for c, t in guild_timers.items()]
+        elif cid is None:
+            items = [(gid, c, t) for c, t in self.db.timers.get(gid, {}).items()]
+        else:
+            items = [(gid, cid, self.db.timers.get(gid, {}).get(cid))]
+        for g, c, t in items:
+            self.deadlines.schedule((g, c), self.next_deadline(t) if t is not None else None)
+
+    def _postpone(self, gid: str, cid: str):
+        # 発言で期限が延びただけなので、ヒープには積まずに今の期限が来た時に入れ直す
+        t = self.db.timers.get(gid, {}).get(cid)
+        self.deadlines.postpone((gid, cid), self.next_deadline(t) if t is not None else None)
+
+    def _summarize_guild(self, gid: str, guild_timers: Dict[str, TicketTimer]) -> Dict[str, Any]:
+        deadlines = [d for d in map(self.next_deadline, guild_timers.values()) if d is not None]
+        idle = sum(1 for t in guild_timers.values() if not t.active_tickets)
+        return {"due": min(deadlines) if deadlines else None, "idle": idle}
+
+    async def run_deadlines(self):
         await self.bot.wait_until_ready()
-        now = datetime.datetime.now()
-        for gid, guild_timers in list(self.db.timers.items()):
-            for cid, info in list(guild_timers.items()):
-                if not info.get("enabled", True) or not info.get("active_tickets") or not info.get("last_message_at"):
-                    continue
-                try:
-                    last_msg_time = datetime.datetime.fromisoformat(info["last_message_at"])
-                except ValueError:
-                    continue
-                delta = now - last_msg_time
-                ch = self.bot.get_channel(int(cid))
-                if not ch:
-                    del self.db.timers[gid][cid]
-                    self.db.save_timers()
-                    continue
-                if info.get("auto_close_enabled", True) and not info.get("close_confirming", False):
-                    limit_days = info.get("auto_close_days", DEFAULT_AUTO_CLOSE_DAYS)
-                    if delta > datetime.timedelta(days=limit_days):
-                        view = AutoCloseConfirmView()
-                        embed = discord.Embed(title="⚠️ 自動削除の確認", description=f"このチケットは {limit_days}日間 動きがありません。\n削除してもよろしいですか？", color=discord.Color.red())
-                        embed.add_field(name="対象チャンネル", value=f"<#{cid}>")
-                        await self.log_to_forum(ch, embed=embed, view=view)
-                        info["close_confirming"] = True
-                        self.db.save_timers()
-                        continue
-                if not info.get("reminded", False):
-                    limit_hours = info.get("timeout_hours", DEFAULT_TIMEOUT_HOURS)
-                    if delta > datetime.timedelta(hours=limit_hours):
-                        view = ReminderView()
-                        embed = discord.Embed(title="⏰ 未稼働通知", description=f"最後のメッセージから {limit_hours}時間 が経過しました。\n進行状況を確認してください。", color=discord.Color.orange())
-                        embed.add_field(name="対象チャンネル", value=f"<#{cid}>")
-                        await self.log_to_forum(ch, embed=embed, view=view)
-                        info["reminded"] = True
-                        self.db.save_timers()
+        moved = 0
+        for gid in list(self.db.timers):
+            summary = guild_summary(self.db.timers, gid)
+            if summary is not None and not summary["idle"]:
+                # シャードは読まずに、ギルドで一番近い期限に起きてから各チケットを入れ直す
+                self.deadlines.schedule((gid, None), summary["due"])
+                continue
+            # 要約の無いギルド (通常の JSON / SQLite、索引作成前) と完了済みが残るギルドだけ読み込む
+            moved += self.db.demote_inactive(gid)
+            self._reschedule(gid)
+        if moved:
+            logger.info(f"Moved {moved} closed tickets to the cold tier")
+        logger.info(f"Scheduled {len(self.deadlines)} ticket deadlines")
+        await self.deadlines.run(self._on_deadline)
+
+    async def _on_deadline(self, key):
+        gid, cid = key
+        if cid is None:
+            # ギルド単位の起床。シャードを読み込んでチケットごとの期限を入れ直す
+            self._reschedule(gid)
+            return
+        info = self.db.timers.get(gid, {}).get(cid)
+        if info is None or not info.enabled or not info.active_tickets or not info.last_message_at:
+            return
+        delta = time.time() - info.last_message_at
+        ch = self.bot.get_channel(int(cid))
+        if not ch:
+            self.db.delete_timer(gid, cid)
+            return
+        try:
+            if info.auto_close_enabled and not info.close_confirming:
+                limit_days = info.auto_close_days if info.auto_close_days is not None else DEFAULT_AUTO_CLOSE_DAYS
+                if delta >= limit_days * 86400:
+                    view = AutoCloseConfirmView()
+                    embed = discord.Embed(title="⚠️ 自動削除の確認", description=f"このチケットは {limit_days}日間 動きがありません。\n削除してもよろしいですか？", color=discord.Color.red())
+                    embed.add_field(name="対象チャンネル", value=f"<#{cid}>")
+                    await self.log_to_forum(ch, embed=embed, view=view)
+                    info.close_confirming = True
+                    self.db.save_timers(gid, cid)
+                    return
+            if not info.reminded:
+                limit_hours = info.timeout_hours if info.timeout_hours is not None else DEFAULT_TIMEOUT_HOURS
+                if delta >= limit_hours * 3600:
+                    view = ReminderView()
+                    embed = discord.Embed(title="⏰ 未稼働通知", description=f"最後のメッセージから {limit_hours}時間 が経過しました。\n進行状況を確認してください。", color=discord.Color.orange())
+                    embed.add_field(name="対象チャンネル", value=f"<#{cid}>")
+                    await self.log_to_forum(ch, embed=embed, view=view)
+                    info.reminded = True
+                    self.db.save_timers(gid, cid)
+                    self.analytics.reminded(gid, info.assignee_id)
+        finally:
+            # 保存が無かった場合 (時刻のずれ・送信失敗) も次の期限を入れ直す。過ぎたままなら少し待って再試行
+            info = self.db.timers.get(gid, {}).get(cid)
+            deadline = self.next_deadline(info) if info is not None else None
+            if deadline is not None and deadline <= time.time():
+                deadline = time.time() + DEADLINE_RETRY_SECONDS
+            self.deadlines.schedule(key, deadline)
 
     async def create_my_dashboard_embed(self, guild, user):
         p = self.db.get_user_profile(guild.id, user.id)
@@ -1326,7 +2315,6 @@ class Tickets(commands.Cog):
 
     async def create_admin_dashboard_embed(self, guild):
         g = self.db.get_guild_config(guild.id)
-        gid = str(guild.id)
         embed = discord.Embed(title="🛡️ Admin Dashboard (Full View)", description="下のメニューから担当者を選択して詳細設定を確認できます。", color=discord.Color.gold())
         def r_name(rid):
             r = guild.get_role(rid)
@@ -1337,7 +2325,7 @@ class Tickets(commands.Cog):
         lfid = g.get("transcript_id")
         lf = guild.get_channel(lfid) if lfid else None
         embed.add_field(name="📜 Logs", value=f"Channel: {lf.mention if lf else '❌ 未設定'}\nCooldown: {g.get('cooldown')}s", inline=True)
-        embed.add_field(name="⚙️ Behaviors", value=f"Reuse Channel: {on_off(g.get('reuse_channel'))}\nNotify Enabled: {on_off(g.get('notify_enabled'))}\nFormat: `{g.get('name_format', 'Default')}`", inline=False)
+        embed.add_field(name="⚙️ Behaviors", value=f"Reuse Channel: {on_off(g.get('reuse_channel'))}\nNotify Enabled: {on_off(g.get('notify_enabled'))}\nMirror Messages: {on_off(g.get('mirror_messages'))}\nArchive: {on_off(g.get('archive_transcripts'))}\nFormat: `{g.get('name_format', 'Default')}`", inline=False)
         ac_days = f"{g.get('auto_close_days')}d" if g.get("auto_close_enabled") else "❌ Disabled"
         embed.add_field(name="⏱️ Timers & Limits", value=f"Timeout: {g.get('timeout_hours')}h\nAuto Close: {ac_days}\nMax Slots/User: {g.get('max_slots')}", inline=False)
         m_roles = g.get("mention_roles", [])
@@ -1372,16 +2360,12 @@ class Tickets(commands.Cog):
             accepting_count = len([m for m in target_members if a_role and a_role in m.roles])
             total_count = len(target_members)
             embed.add_field(name="Assignee Stats", value=f"Accepting: **{accepting_count}** / Total: **{total_count}**", inline=False)
+            index = self.db.active_index(guild.id)
             text_lines = []
             for member in target_members:
-                p = self.db.get_user_profile(guild.id, member.id)
                 status_icon = "🟢" if (a_role and a_role in member.roles) else "💤"
-                active = 0
-                if gid in self.db.timers:
-                    for t in self.db.timers[gid].values():
-                        if int(t.get("assignee_id", 0)) == member.id and t.get("active_tickets"):
-                            active += len(t.get("active_tickets", []))
-                max_s = p.get("max_slots") or g.get("max_slots", DEFAULT_MAX_SLOTS)
+                active = index.active_for(member.id)
+                max_s = self.db.effective(guild.id, member.id).max_slots
                 text_lines.append(f"{status_icon} **{member.display_name}** | Act: **{active}** | Lim: {max_s}")
             chunk = ""
             for line in text_lines:
@@ -1393,6 +2377,8 @@ class Tickets(commands.Cog):
                 embed.add_field(name="👥 Assignees", value=chunk, inline=False)
         else:
             embed.add_field(name="👥 Assignees", value="メンバーなし", inline=False)
+        tc = self.threads.report()
+        embed.set_footer(text=f"Thread cache: {tc['size']} cached / hit {tc['hit_rate']:.0%} (gateway {tc['gateway_hits']}, lru {tc['hits']}, rest {tc['misses']})")
         return embed
 
     async def create_assignee_detail_embed(self, guild, member_id, name):
@@ -1446,18 +2432,17 @@ class Tickets(commands.Cog):
         return embed
 
     async def create_ticket_dashboard_embed(self, channel, t_data):
-        last = datetime.datetime.fromisoformat(t_data["last_message_at"])
-        delta = datetime.datetime.now() - last
+        elapsed = time.time() - t_data.last_message_at if t_data.last_message_at else 0.0
         embed = discord.Embed(title=f"⏱️ Manager: {channel.name}", color=discord.Color.light_grey())
         status = "✅ 稼働中"
-        if not t_data.get("enabled", True):
+        if not t_data.enabled:
             status = "⏸️ 一時停止中"
-        elif t_data.get("reminded"):
+        elif t_data.reminded:
             status = "⏰ 通知済み"
         embed.add_field(name="Status", value=status, inline=True)
-        embed.add_field(name="Setting", value=f"Limit: {t_data.get('timeout_hours')}h", inline=True)
-        embed.add_field(name="Elapsed", value=f"{delta.total_seconds()/3600:.1f} hours", inline=False)
-        tid = t_data.get("mirror_thread_id")
+        embed.add_field(name="Setting", value=f"Limit: {t_data.timeout_hours}h", inline=True)
+        embed.add_field(name="Elapsed", value=f"{elapsed/3600:.1f} hours", inline=False)
+        tid = t_data.mirror_thread_id
         embed.add_field(name="Transcript", value=f"<#{tid}>" if tid else "⚠️ 未連携", inline=False)
         return embed
 
@@ -1470,10 +2455,10 @@ class Tickets(commands.Cog):
     attr_group = app_commands.Group(name="attribute", description="属性管理", parent=ticket_group)
 
     @admin_group.command(name="setup", description="サーバー設定の変更")
-    async def admin_setup(self, itx: discord.Interaction, category: Optional[discord.CategoryChannel] = None, assignee_role: Optional[discord.Role] = None, assignee_qual_role: Optional[discord.Role] = None, transcript: Optional[discord.ForumChannel] = None, timeout_hours: Optional[int] = None, auto_close_enabled: Optional[bool] = None, auto_close_days: Optional[int] = None, reuse_channel: Optional[bool] = None, max_slots: Optional[int] = None, notify_enabled: Optional[bool] = None, name_format: Optional[str] = None, cooldown: Optional[int] = None, mention_role: Optional[discord.Role] = None, log_role: Optional[discord.Role] = None, ignore_role: Optional[discord.Role] = None, reset_roles: bool = False):
+    async def admin_setup(self, itx: discord.Interaction, category: Optional[discord.CategoryChannel] = None, assignee_role: Optional[discord.Role] = None, assignee_qual_role: Optional[discord.Role] = None, transcript: Optional[discord.ForumChannel] = None, timeout_hours: Optional[int] = None, auto_close_enabled: Optional[bool] = None, auto_close_days: Optional[int] = None, reuse_channel: Optional[bool] = None, max_slots: Optional[int] = None, notify_enabled: Optional[bool] = None, name_format: Optional[str] = None, cooldown: Optional[int] = None, mention_role: Optional[discord.Role] = None, log_role: Optional[discord.Role] = None, ignore_role: Optional[discord.Role] = None, reset_roles: bool = False, mirror_messages: Optional[bool] = None, archive_transcripts: Optional[bool] = None):
         g = self.db.get_guild_config(itx.guild_id)
-        msg = self._update_settings_logic(g, is_guild=True, category=category, assignee_role=assignee_role, assignee_qual_role=assignee_qual_role, transcript=transcript, timeout_hours=timeout_hours, auto_close_enabled=auto_close_enabled, auto_close_days=auto_close_days, reuse_channel=reuse_channel, max_slots=max_slots, notify_enabled=notify_enabled, name_format=name_format, cooldown=cooldown, mention_role=mention_role, log_role=log_role, ignore_role=ignore_role, reset_roles=reset_roles)
-        self.db.save_profiles()
+        msg = self._update_settings_logic(g, is_guild=True, category=category, assignee_role=assignee_role, assignee_qual_role=assignee_qual_role, transcript=transcript, timeout_hours=timeout_hours, auto_close_enabled=auto_close_enabled, auto_close_days=auto_close_days, reuse_channel=reuse_channel, max_slots=max_slots, notify_enabled=notify_enabled, name_format=name_format, cooldown=cooldown, mention_role=mention_role, log_role=log_role, ignore_role=ignore_role, reset_roles=reset_roles, mirror_messages=mirror_messages, archive_transcripts=archive_transcripts)
+        self.db.save_profiles(itx.guild_id)
         await itx.response.defer(ephemeral=True)
         embed = await self.create_admin_dashboard_embed(itx.guild)
         await itx.followup.send(embed=embed, view=AdminDashboardView(self, itx.guild), ephemeral=True)
@@ -1483,83 +2468,104 @@ class Tickets(commands.Cog):
         embed = await self.create_admin_dashboard_embed(itx.guild)
         await itx.response.send_message(embed=embed, view=AdminDashboardView(self, itx.guild), ephemeral=True)
 
+    @admin_group.command(name="stats", description="担当者ごとのチケット集計")
+    async def admin_stats(self, itx: discord.Interaction, assignee: Optional[discord.Member] = None, days: int = 7):
+        summary = self.analytics.summary(itx.guild_id, assignee.id if assignee else None, days)
+        days = max(1, min(days, self.analytics.daily_days))
+        total = self.analytics.totals(summary)
+        def pct(v):
+            return f"{v:.0%}" if v is not None else "-"
+        embed = discord.Embed(title=f"📊 Ticket Stats{f': {assignee.display_name}' if assignee else ''}", color=discord.Color.gold())
+        if not summary:
+            embed.description = "集計データがありません。"
+            await itx.response.send_message(embed=embed, ephemeral=True)
+            return
+        embed.add_field(name="📦 Throughput", value=f"Opened: **{total['opened']}** / Closed: **{total['closed']}** / Reopened: {total['reopened']}\nClosed ({days}d): **{total['closed_recent']}**", inline=False)
+        embed.add_field(name="⏱️ Time", value=f"First Response: {format_duration(total['avg_first_response'])}\nTo Close: {format_duration(total['avg_time_to_close'])}", inline=True)
+        embed.add_field(name="📋 Tasks", value=f"Done: {total['tasks_completed']}\nRate: {pct(total['task_rate'])}", inline=True)
+        embed.add_field(name="⏰ Reminders", value=str(total["reminders"]), inline=True)
+        index = self.db.active_index(itx.guild_id)
+        lines = []
+        for uid, s in sorted(summary.items(), key=lambda kv: (-kv[1]["closed_recent"], -kv[1]["closed"])):
+            member = itx.guild.get_member(int(uid)) if uid.isdigit() else None
+            name = member.display_name if member else uid
+            lines.append(f"**{name}** | Act: {index.active_for(int(uid)) if uid.isdigit() else 0} | {days}d: **{s['closed_recent']}** | FRT: {format_duration(s['p50_first_response'])} | TTC: {format_duration(s['p50_time_to_close'])} | ⏰{s['reminders']} | 📋{pct(s['task_rate'])}")
+        chunk = ""
+        for line in lines[:25]:
+            if len(chunk) + len(line) > 1000:
+                embed.add_field(name="👥 Assignees (median)", value=chunk, inline=False)
+                chunk = ""
+            chunk += line + "\n"
+        if chunk:
+            embed.add_field(name="👥 Assignees (median)", value=chunk, inline=False)
+        await itx.response.send_message(embed=embed, ephemeral=True)
+
     @admin_group.command(name="link", description="チケット紐付け")
     async def admin_link(self, itx: discord.Interaction, channel: discord.TextChannel, thread_id: Optional[str] = None, create_thread: bool = False, assignee: Optional[discord.Member] = None, creator: Optional[discord.Member] = None):
         gid, cid = str(itx.guild_id), str(channel.id)
         is_new = False
+        # 完了済み (コールド層) のチケットなら稼働側へ戻して紐付ける
+        self.db.promote(gid, cid)
         if cid not in self.db.timers.get(gid, {}):
             if not assignee:
                 await itx.response.send_message("⚠️ assignee指定必須", ephemeral=True)
                 return
             c_id = creator.id if creator else assignee.id
-            p = self.db.get_user_profile(itx.guild_id, assignee.id)
+            e = self.db.effective(itx.guild_id, assignee.id)
             embed = discord.Embed(title=f"✅ 登録: {channel.name}", color=discord.Color.green())
             msg = await channel.send(embed=embed, view=TicketControlView())
-            self.db.timers[gid][cid] = {"last_message_at": datetime.datetime.now().isoformat(), "enabled": self._get_setting(itx.guild_id, p, "notify_enabled", DEFAULT_NOTIFY_ENABLED), "timeout_hours": self._get_setting(itx.guild_id, p, "timeout_hours", DEFAULT_TIMEOUT_HOURS), "assignee_id": assignee.id, "creator_id": c_id, "active_tickets": [msg.id], "auto_close_enabled": True, "auto_close_days": self._get_setting(itx.guild_id, p, "auto_close_days", DEFAULT_AUTO_CLOSE_DAYS), "mirror_thread_id": None, "last_log_at": None, "tasks": {str(msg.id): []}}
-            self.db.save_timers()
+            self.db.timers[gid][cid] = TicketTimer(assignee.id, c_id, enabled=e.notify_enabled, timeout_hours=e.timeout_hours, active_tickets=[msg.id], auto_close_enabled=True, auto_close_days=e.auto_close_days, tasks={msg.id: []}, embeds={msg.id: card_from_embed(embed)})
+            self.db.save_timers(gid, cid)
             is_new = True
         if thread_id:
             try:
-                t = await channel.guild.fetch_channel(int(thread_id))
-                self.db.timers[gid][cid]["mirror_thread_id"] = t.id
-                self.db.save_timers()
+                t = await self.threads.get(channel.guild, int(thread_id))
+                self.db.set_mirror_thread(gid, cid, t.id)
                 await itx.response.send_message(f"🔗 {t.mention} 紐付け完了", ephemeral=True)
             except:
                 await itx.response.send_message("⚠️ 不明ID", ephemeral=True)
             return
         if create_thread:
-            aid = self.db.timers[gid][cid]["assignee_id"]
-            p = self.db.get_user_profile(itx.guild_id, aid)
+            aid = self.db.timers[gid][cid].assignee_id
+            e = self.db.effective(itx.guild_id, aid)
             m_list = [f"<@{aid}>"]
-            r_ids = p.get("mention_roles")
-            if not r_ids:
-                r_ids = self.db.get_guild_config(itx.guild_id).get("mention_roles", [])
-            for r in r_ids:
+            for r in e.mention_roles:
                 m_list.append(f"<@&{r}>")
-            await self._init_forum_thread(channel, discord.Embed(title="Transcript", description=f"Source: {channel.mention}"), p, m_list)
+            await self._init_forum_thread(channel, discord.Embed(title="Transcript", description=f"Source: {channel.mention}"), e, m_list)
             await itx.response.send_message(f"🆕 ログ作成完了", ephemeral=True)
             return
         await itx.response.send_message(f"{'✅ 済' if not is_new else '🆕 新規'}", ephemeral=True)
 
-    @admin_group.command(name="recover", description="スキャン復旧")
-    async def admin_recover(self, itx: discord.Interaction, category: discord.CategoryChannel, dry_run: bool = False):
-        await itx.response.defer(ephemeral=True)
+    @admin_group.command(name="recover", description="スキャン復旧 (バックグラウンドで実行し、中断しても再開します)")
+    async def admin_recover(self, itx: discord.Interaction, category: Optional[discord.CategoryChannel] = None, dry_run: bool = False, restart: bool = False):
         gid = str(itx.guild_id)
         g = self.db.get_guild_config(itx.guild_id)
-        rid = g.get("assignee_role_id")
-        recovered = 0
-        log = []
-        if not rid:
-            await itx.followup.send("⚠️ 担当ロール未設定", ephemeral=True)
+        if not g.get("assignee_role_id"):
+            await itx.response.send_message("⚠️ 担当ロール未設定", ephemeral=True)
             return
-        for ch in category.text_channels:
-            cid = str(ch.id)
-            if cid in self.db.timers.get(gid, {}):
-                continue
-            ta = None
-            tc = None
-            for target, ow in ch.overwrites.items():
-                if isinstance(target, discord.Member) and not target.bot:
-                    if any(r.id == rid for r in target.roles):
-                        ta = target
-                    elif ow.read_messages:
-                        tc = target
-            if ta:
-                recovered += 1
-                if not dry_run: 
-                    c_id = tc.id if tc else ta.id
-                    p = self.db.get_user_profile(itx.guild_id, ta.id)
-                    self.db.timers[gid][cid] = {"last_message_at": datetime.datetime.now().isoformat(), "enabled": self._get_setting(itx.guild_id, p, "notify_enabled", DEFAULT_NOTIFY_ENABLED), "timeout_hours": self._get_setting(itx.guild_id, p, "timeout_hours", DEFAULT_TIMEOUT_HOURS), "assignee_id": ta.id, "creator_id": c_id, "active_tickets": [], "auto_close_enabled": True, "auto_close_days": self._get_setting(itx.guild_id, p, "auto_close_days", DEFAULT_AUTO_CLOSE_DAYS), "mirror_thread_id": None, "last_log_at": None, "tasks": {}}
-                log.append(f"✅ {ch.name}: {ta.display_name}")
-        if not dry_run:
-            self.db.save_timers()
-        await itx.followup.send(f"🚀 復旧完了 ({recovered}件)\n" + "\n".join(log[:10]), ephemeral=True)
+        if itx.guild_id in self._recoveries:
+            await itx.response.send_message("⏳ 復旧を実行中です。進捗はステータスメッセージを確認してください。", ephemeral=True)
+            return
+        state = None if restart else self.recover_store.data.get(gid)
+        if state is None:
+            # category 省略時はサーバーの全カテゴリを対象にする
+            cats = [category] if category else list(itx.guild.categories)
+            state = {"categories": [c.id for c in cats], "done": [], "recovered": 0, "failed": 0, "log": [], "dry_run": dry_run, "status": None}
+            await itx.response.send_message(f"🔎 {len(cats)}カテゴリの復旧を開始しました。", ephemeral=True)
+        else:
+            await itx.response.send_message(f"▶️ 中断した復旧を再開します ({len(state['done'])}ch 完了済み)。", ephemeral=True)
+        status = await itx.channel.send(embed=discord.Embed(title="🔎 復旧を準備中...", color=discord.Color.blue()))
+        state["status"] = [status.channel.id, status.id]
+        if not state["dry_run"]:
+            self.recover_store.data[gid] = state
+            self.recover_store.mark_dirty(gid)
+        self._start_recovery(itx.guild, state)
 
     @admin_group.command(name="assignee", description="【管理者】担当者個別設定")
     async def admin_assignee(self, itx: discord.Interaction, target: discord.Member, category: Optional[discord.CategoryChannel] = None, transcript: Optional[discord.ForumChannel] = None, timeout_hours: Optional[int] = None, auto_close_enabled: Optional[bool] = None, auto_close_days: Optional[int] = None, reuse_channel: Optional[bool] = None, max_slots: Optional[int] = None, cooldown: Optional[int] = None, notify_enabled: Optional[bool] = None, name_format: Optional[str] = None, mention_role: Optional[discord.Role] = None, log_role: Optional[discord.Role] = None, ignore_role: Optional[discord.Role] = None, reset_roles: bool = False):
         p = self.db.get_user_profile(itx.guild_id, target.id)
         msg = self._update_settings_logic(p, is_guild=False, category=category, transcript=transcript, timeout_hours=timeout_hours, auto_close_enabled=auto_close_enabled, auto_close_days=auto_close_days, reuse_channel=reuse_channel, max_slots=max_slots, cooldown=cooldown, notify_enabled=notify_enabled, name_format=name_format, mention_role=mention_role, log_role=log_role, ignore_role=ignore_role, reset_roles=reset_roles)
-        self.db.save_profiles()
+        self.db.save_profiles(itx.guild_id, target.id)
         await itx.response.defer(ephemeral=True)
         embed = await self.create_assignee_detail_embed(itx.guild, target.id, target.display_name)
         await itx.followup.send(embed=embed, view=AdminAssigneeDetailView(self, itx.guild), ephemeral=True)
@@ -1568,7 +2574,7 @@ class Tickets(commands.Cog):
     async def my_setup(self, itx: discord.Interaction, transcript: Optional[discord.ForumChannel] = None, timeout_hours: Optional[int] = None, auto_close_enabled: Optional[bool] = None, auto_close_days: Optional[int] = None, reuse_channel: Optional[bool] = None, max_slots: Optional[int] = None, cooldown: Optional[int] = None, notify_enabled: Optional[bool] = None, name_format: Optional[str] = None, mention_role: Optional[discord.Role] = None, log_role: Optional[discord.Role] = None, ignore_role: Optional[discord.Role] = None, reset_roles: bool = False):
         p = self.db.get_user_profile(itx.guild_id, itx.user.id)
         msg = self._update_settings_logic(p, is_guild=False, transcript=transcript, timeout_hours=timeout_hours, auto_close_enabled=auto_close_enabled, auto_close_days=auto_close_days, reuse_channel=reuse_channel, max_slots=max_slots, cooldown=cooldown, notify_enabled=notify_enabled, name_format=name_format, mention_role=mention_role, log_role=log_role, ignore_role=ignore_role, reset_roles=reset_roles)
-        self.db.save_profiles()
+        self.db.save_profiles(itx.guild_id, itx.user.id)
         await itx.response.defer(ephemeral=True)
         embed = await self.create_my_dashboard_embed(itx.guild, itx.user)
         await itx.followup.send(embed=embed, view=MyDashboardView(), ephemeral=True)
@@ -1582,18 +2588,18 @@ class Tickets(commands.Cog):
     async def my_manage(self, itx: discord.Interaction, channel: Optional[discord.TextChannel] = None):
         target_channel = channel or itx.channel
         gid, cid = str(itx.guild_id), str(target_channel.id)
-        if cid not in self.db.timers.get(gid, {}):
+        t_data = self.db.find_timer(gid, cid)
+        if t_data is None:
             await itx.response.send_message(f"⚠️ {target_channel.mention} はチケットとして登録されていません。", ephemeral=True)
             return
-        t_data = self.db.timers[gid][cid]
         
-        is_assignee = t_data.get("assignee_id") == itx.user.id
+        is_assignee = t_data.assignee_id == itx.user.id
         is_admin = itx.user.guild_permissions.manage_roles
         if not (is_assignee or is_admin):
             await itx.response.send_message("担当者または管理者のみ使用可能です。", ephemeral=True)
             return
 
-        active_tickets = t_data.get("active_tickets", [])
+        active_tickets = t_data.active_tickets
         if not active_tickets:
             await itx.response.send_message("⚠️ このチャンネルに稼働中のチケットがありません。", ephemeral=True)
             return
@@ -1609,8 +2615,9 @@ class Tickets(commands.Cog):
         p = self.db.get_user_profile(itx.guild_id, user.id)
         if key not in g["attributes"]:
             g["attributes"][key] = {"order": "desc"}
+            self.db.save_profiles(itx.guild_id)
         p["attributes"][key] = value
-        self.db.save_profiles()
+        self.db.save_profiles(itx.guild_id, user.id)
         await itx.response.send_message(f"✅ Set [{key}:{value}]", ephemeral=True)
     
     @attr_group.command(name="list", description="属性一覧")
@@ -6,34 +6,42 @@ import os
 import datetime
 import uuid
 from typing import Optional, Dict, Any
-from utils.storage import JsonHandler
+from utils.storage import open_store
+from utils.migrations import Schema, fill_defaults
 
 DATA_FILE = os.path.join("data", "todo_settings.json")
+PROFILE_DEFAULTS = {"default_channel_id": None, "mention_role_ids": None}
+
+def _normalize_profiles(g: Dict[str, Any]):
+    for p in g["profiles"].values():
+        fill_defaults(p, PROFILE_DEFAULTS)
+
+SCHEMA = Schema("todo_settings", 1, {"role_ids": [], "tasks": {}, "profiles": {}}, normalize=_normalize_profiles)
 
 class ToDo(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
-        self.db = JsonHandler(DATA_FILE)
-        self.data = self.db.load()
+        self.db = open_store(DATA_FILE)
+        self.store = bot.persistence.register("todo", self.db, schema=SCHEMA)
+        self.data = self.store.data
+
+    def cog_unload(self):
+        self.bot.persistence.unregister(self.store)
 
-    def save_data(self):
-        self.db.save(self.data)
+    def save_data(self, guild_id: int):
+        self.store.mark_dirty(guild_id)
 
     def get_guild_config(self, guild_id: int) -> Dict[str, Any]:
         gid = str(guild_id)
-        if gid not in self.data: self.data[gid] = {}
-        defaults = {"role_ids": [], "tasks": {}, "profiles": {}}
-        for k, v in defaults.items():
-            if k not in self.data[gid]: self.data[gid][k] = v
-        return self.data[gid]
+        g = self.data.get(gid)
+        if g is None: g = self.data[gid] = SCHEMA.new()
+        return g
 
     def get_user_profile(self, guild_id: int, user_id: int) -> Dict[str, Any]:
-        g_conf = self.get_guild_config(guild_id)
+        profiles = self.get_guild_config(guild_id)["profiles"]
         uid = str(user_id)
-        if uid not in g_conf["profiles"]: g_conf["profiles"][uid] = {}
-        p = g_conf["profiles"][uid]
-        if "default_channel_id" not in p: p["default_channel_id"] = None
-        if "mention_role_ids" not in p: p["mention_role_ids"] = None 
+        p = profiles.get(uid)
+        if p is None: p = profiles[uid] = dict(PROFILE_DEFAULTS)
         return p
 
     def save_task(self, guild_id: int, message_id: int, title: str, description: str, author_id: int):
@@ -41,7 +49,7 @@ class ToDo(commands.Cog):
         conf["tasks"][str(message_id)] = {
             "title": title, "description": description, "status": "open", "author_id": author_id, "created_at": datetime.datetime.now().isoformat()
         }
-        self.save_data()
+        self.save_data(guild_id)
 
     def get_task(self, guild_id: int, message_id: int) -> Optional[Dict[str, Any]]:
         conf = self.get_guild_config(guild_id)
@@ -52,14 +60,14 @@ class ToDo(commands.Cog):
         mid = str(message_id)
         if mid in conf["tasks"]:
             conf["tasks"][mid]["status"] = status
-            self.save_data()
+            self.save_data(guild_id)
 
     def delete_task_data(self, guild_id: int, message_id: int):
         conf = self.get_guild_config(guild_id)
         mid = str(message_id)
         if mid in conf["tasks"]:
             del conf["tasks"][mid]
-            self.save_data()
+            self.save_data(guild_id)
 
     todo_group = app_commands.Group(name="todo", description="ToDo管理機能")
     setup_group = app_commands.Group(name="setup", description="ToDo機能の設定(管理者用)", parent=todo_group)
@@ -70,7 +78,7 @@ class ToDo(commands.Cog):
         conf = self.get_guild_config(itx.guild_id)
         if role.id not in conf["role_ids"]:
             conf["role_ids"].append(role.id)
-            self.save_data()
+            self.save_data(itx.guild_id)
             await itx.response.send_message(f"✅ 追加しました: {role.mention}", ephemeral=True)
         else: await itx.response.send_message("既に追加されています。", ephemeral=True)
 
@@ -79,7 +87,7 @@ class ToDo(commands.Cog):
         conf = self.get_guild_config(itx.guild_id)
         if role.id in conf["role_ids"]:
             conf["role_ids"].remove(role.id)
-            self.save_data()
+            self.save_data(itx.guild_id)
             await itx.response.send_message(f"🗑️ 削除しました: {role.mention}", ephemeral=True)
         else: await itx.response.send_message("設定されていません。", ephemeral=True)
 
@@ -99,7 +107,7 @@ class ToDo(commands.Cog):
             if p["mention_role_ids"] is None: p["mention_role_ids"] = []
             if add and add.id not in p["mention_role_ids"]: p["mention_role_ids"].append(add.id); msg.append(f"+ {add.mention}")
             if remove and remove.id in p["mention_role_ids"]: p["mention_role_ids"].remove(remove.id); msg.append(f"- {remove.mention}")
-        self.save_data()
+        self.save_data(itx.guild_id)
         await itx.response.send_message("\n".join(msg) or "変更なし", ephemeral=True)
 
     @my_group.command(name="status", description="自分の設定状況を確認")
@@ -0,0 +1,222 @@
+import time
+import datetime
+import logging
+from typing import Any, Dict, List, Optional, Set
+
+logger = logging.getLogger("utils.analytics")
+
+def _new_rollup() -> Dict[str, Any]:
+    return {
+        "opened": 0, "closed": 0, "reopened": 0, "reminders": 0, "tasks_completed": 0,
+        # 完了時点のタスク数 / 完了済みタスク数 (完了率用)
+        "tasks_total": 0, "tasks_done": 0,
+        "frt_sum": 0.0, "frt_n": 0, "ttc_sum": 0.0, "ttc_n": 0,
+        # 直近の初回応答時間 / 完了までの時間 (秒)。古いものから捨てる
+        "recent_frt": [], "recent_ttc": [],
+        # "YYYY-MM-DD" -> その日の完了件数
+        "daily": {},
+    }
+
+def format_duration(seconds: Optional[float]) -> str:
+    if seconds is None:
+        return "-"
+    minutes = int(seconds // 60)
+    if minutes < 60:
+        return f"{minutes}m"
+    hours, minutes = divmod(minutes, 60)
+    if hours < 24:
+        return f"{hours}h{minutes:02d}m"
+    days, hours = divmod(hours, 24)
+    return f"{days}d{hours:02d}h"
+
+def _median(values: List[float]) -> Optional[float]:
+    if not values:
+        return None
+    s = sorted(values)
+    mid = len(s) // 2
+    return s[mid] if len(s) % 2 else (s[mid - 1] + s[mid]) / 2
+
+class TicketAnalytics:
+    """
+    担当者ごとのチケット集計 (処理件数・初回応答時間・完了までの時間・未稼働通知・タスク完了率)。
+    チケットのイベントごとに集計値を差分で更新するので、参照時にチケットデータを走査しません。
+    データは {guild_id: {"assignees": {user_id: 集計}, "open": {msg_id: [担当者ID, チャンネルID, 開始時刻, 初回応答時刻]}}}
+    の形で store に保存します。
+    """
+    def __init__(self, store, ring_size: Optional[int] = None, daily_days: Optional[int] = None):
+        from utils.config import ANALYTICS_RING_SIZE, ANALYTICS_DAILY_DAYS
+        self.store = store
+        self.ring_size = ANALYTICS_RING_SIZE if ring_size is None else ring_size
+        self.daily_days = ANALYTICS_DAILY_DAYS if daily_days is None else daily_days
+        # guild_id -> {channel_id: 初回応答待ちの msg_id}。on_message の判定用 (ギルドごとに初回参照時に構築)
+        self._awaiting: Dict[str, Dict[str, Set[str]]] = {}
+
+    def _guild(self, guild_id) -> Dict[str, Any]:
+        gid = str(guild_id)
+        g = self.store.data.get(gid)
+        if g is None:
+            g = self.store.data[gid] = {"assignees": {}, "open": {}}
+        return g
+
+    def _rollup(self, g: Dict[str, Any], assignee_id) -> Dict[str, Any]:
+        key = str(assignee_id)
+        r = g["assignees"].get(key)
+        if r is None:
+            r = g["assignees"][key] = _new_rollup()
+        return r
+
+    def _waiting(self, guild_id) -> Dict[str, Set[str]]:
+        gid = str(guild_id)
+        w = self._awaiting.get(gid)
+        if w is None:
+            w = self._awaiting[gid] = {}
+            g = self.store.data.get(gid)
+            for mid, rec in (g["open"].items() if g else ()):
+                if rec[3] is None:
+                    w.setdefault(rec[1], set()).add(mid)
+        return w
+
+    def _push(self, ring: List[float], value: float):
+        ring.append(round(value, 1))
+        if len(ring) > self.ring_size:
+            del ring[:-self.ring_size]
+
+    def _bump_daily(self, r: Dict[str, Any], now: float):
+        daily = r["daily"]
+        day = datetime.date.fromtimestamp(now).isoformat()
+        if day not in daily:
+            # 新しい日が始まった時だけ古い日を捨てる
+            oldest = (datetime.date.fromtimestamp(now) - datetime.timedelta(days=self.daily_days - 1)).isoformat()
+            for d in [d for d in daily if d < oldest]:
+                del daily[d]
+        daily[day] = daily.get(day, 0) + 1
+
+    # --- イベント ---
+    def opened(self, guild_id, assignee_id, channel_id, msg_id, now: Optional[float] = None):
+        now = time.time() if now is None else now
+        g = self._guild(guild_id)
+        self._rollup(g, assignee_id)["opened"] += 1
+        mid, cid = str(msg_id), str(channel_id)
+        g["open"][mid] = [assignee_id, cid, now, None]
+        self._waiting(guild_id).setdefault(cid, set()).add(mid)
+        self.store.mark_dirty(guild_id)
+
+    def message(self, guild_id, channel_id, author_id, now: Optional[float] = None):
+        """チケットチャンネルの発言ごとに呼ばれます。担当者の最初の発言を初回応答として記録します。"""
+        waiting = self._waiting(guild_id).get(str(channel_id))
+        if not waiting:
+            return
+        g = self._guild(guild_id)
+        now = time.time() if now is None else now
+        for mid in list(waiting):
+            rec = g["open"].get(mid)
+            if rec is None:
+                waiting.discard(mid)
+                continue
+            if rec[0] != author_id:
+                continue
+            rec[3] = now
+            waiting.discard(mid)
+            r = self._rollup(g, rec[0])
+            r["frt_sum"] += now - rec[2]
+            r["frt_n"] += 1
+            self._push(r["recent_frt"], now - rec[2])
+            self.store.mark_dirty(guild_id)
+        if not waiting:
+            self._waiting(guild_id).pop(str(channel_id), None)
+
+    def closed(self, guild_id, assignee_id, msg_id, tasks=(), now: Optional[float] = None):
+        now = time.time() if now is None else now
+        g = self._guild(guild_id)
+        mid = str(msg_id)
+        rec = g["open"].pop(mid, None)
+        if rec is not None:
+            assignee_id = rec[0]
+            w = self._waiting(guild_id).get(rec[1])
+            if w is not None:
+                w.discard(mid)
+        r = self._rollup(g, assignee_id)
+        r["closed"] += 1
+        self._bump_daily(r, now)
+        if rec is not None:
+            r["ttc_sum"] += now - rec[2]
+            r["ttc_n"] += 1
+            self._push(r["recent_ttc"], now - rec[2])
+        if tasks:
+            r["tasks_total"] += len(tasks)
+            r["tasks_done"] += sum(1 for t in tasks if t.completed)
+        self.store.mark_dirty(guild_id)
+
+    def reopened(self, guild_id, assignee_id, channel_id, msg_id, now: Optional[float] = None):
+        # 再開後は新しい区間として完了までの時間を測る (初回応答は最初の区間で記録済みとみなす)
+        now = time.time() if now is None else now
+        g = self._guild(guild_id)
+        self._rollup(g, assignee_id)["reopened"] += 1
+        g["open"].setdefault(str(msg_id), [assignee_id, str(channel_id), now, now])
+        self.store.mark_dirty(guild_id)
+
+    def reminded(self, guild_id, assignee_id):
+        self._rollup(self._guild(guild_id), assignee_id)["reminders"] += 1
+        self.store.mark_dirty(guild_id)
+
+    def task_completed(self, guild_id, assignee_id, n: int = 1):
+        self._rollup(self._guild(guild_id), assignee_id)["tasks_completed"] += n
+        self.store.mark_dirty(guild_id)
+
+    def channel_removed(self, guild_id, channel_id):
+        """チャンネル削除時に、完了しないまま残る記録を捨てます。"""
+        g = self.store.data.get(str(guild_id))
+        if not g:
+            return
+        cid = str(channel_id)
+        stale = [mid for mid, rec in g["open"].items() if rec[1] == cid]
+        for mid in stale:
+            del g["open"][mid]
+        self._waiting(guild_id).pop(cid, None)
+        if stale:
+            self.store.mark_dirty(guild_id)
+
+    # --- 参照 ---
+    def summary(self, guild_id, assignee_id=None, days: int = 7, now: Optional[float] = None) -> Dict[str, Dict[str, Any]]:
+        """
+        担当者ごとの集計を返します (assignee_id 指定時はその人だけ)。
+        closed_recent は直近 days 日 (最大 daily_days 日) の完了件数です。
+        """
+        now = time.time() if now is None else now
+        g = self.store.data.get(str(guild_id))
+        if not g:
+            return {}
+        days = max(1, min(days, self.daily_days))
+        since = (datetime.date.fromtimestamp(now) - datetime.timedelta(days=days - 1)).isoformat()
+        rollups = g["assignees"]
+        if assignee_id is not None:
+            rollups = {str(assignee_id): rollups[str(assignee_id)]} if str(assignee_id) in rollups else {}
+        out = {}
+        for uid, r in rollups.items():
+            out[uid] = {
+                "opened": r["opened"], "closed": r["closed"], "reopened": r["reopened"],
+                "reminders": r["reminders"], "tasks_completed": r["tasks_completed"],
+                "closed_recent": sum(n for d, n in r["daily"].items() if d >= since),
+                "responded": r["frt_n"], "timed_closes": r["ttc_n"],
+                "avg_first_response": r["frt_sum"] / r["frt_n"] if r["frt_n"] else None,
+                "avg_time_to_close": r["ttc_sum"] / r["ttc_n"] if r["ttc_n"] else None,
+                "p50_first_response": _median(r["recent_frt"]),
+                "p50_time_to_close": _median(r["recent_ttc"]),
+                "tasks_total": r["tasks_total"], "tasks_done": r["tasks_done"],
+                "task_rate": r["tasks_done"] / r["tasks_total"] if r["tasks_total"] else None,
+            }
+        return out
+
+    @staticmethod
+    def totals(summary: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+        """summary() の結果をギルド全体に合算します。"""
+        keys = ("opened", "closed", "reopened", "reminders", "tasks_completed", "closed_recent",
+                "responded", "timed_closes", "tasks_total", "tasks_done")
+        out = {k: sum(s[k] for s in summary.values()) for k in keys}
+        def weighted(avg_key, n_key):
+            n = out[n_key]
+            return sum(s[avg_key] * s[n_key] for s in summary.values() if s[n_key]) / n if n else None
+        out["avg_first_response"] = weighted("avg_first_response", "responded")
+        out["avg_time_to_close"] = weighted("avg_time_to_close", "timed_closes")
+        out["task_rate"] = out["tasks_done"] / out["tasks_total"] if out["tasks_total"] else None
+        return out
@@ -0,0 +1,209 @@
+import io
+import os
+import time
+import shutil
+import asyncio
+import hashlib
+import logging
+import tempfile
+from typing import Any, Dict, List, Optional, Tuple
+import aiohttp
+import discord
+
+logger = logging.getLogger("utils.attachment_relay")
+
+CHUNK_SIZE = 64 * 1024
+
+class ByteBudget:
+    """
+    ダウンロード中の合計バイト数を制限するセマフォ。上限より大きい1件は単独でなら通します。
+    release() は同期的に返すので、キャンセル中の finally からでも確実に戻せます。
+    """
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.in_use = 0
+        self._waiters: List[asyncio.Future] = []
+
+    async def acquire(self, n: int):
+        while not (self.in_use == 0 or self.in_use + n <= self.limit):
+            fut = asyncio.get_running_loop().create_future()
+            self._waiters.append(fut)
+            try:
+                await fut
+            finally:
+                if fut in self._waiters:
+                    self._waiters.remove(fut)
+        self.in_use += n
+
+    def release(self, n: int):
+        self.in_use -= n
+        # 待っている全員を起こし、それぞれ空きを確かめ直させる
+        waiters, self._waiters = self._waiters, []
+        for fut in waiters:
+            if not fut.done():
+                fut.set_result(None)
+
+class Blob:
+    """取得済みの添付ファイル。小さいものはメモリ、大きいものは一時ファイルに置きます。"""
+    __slots__ = ("digest", "size", "data", "path", "expires")
+
+    def __init__(self, digest: str, size: int, data: Optional[bytes], path: Optional[str], expires: float):
+        self.digest = digest
+        self.size = size
+        self.data = data
+        self.path = path
+        self.expires = expires
+
+    def to_file(self, filename: str, spoiler: bool = False) -> discord.File:
+        fp = io.BytesIO(self.data) if self.data is not None else self.path
+        return discord.File(fp, filename=filename, spoiler=spoiler)
+
+class AttachmentRelay:
+    """
+    添付ファイルを別のチャンネルへ転送するための取得サービス。
+    並列にストリーミングで取得し、大きいものは一時ファイルへ書き出します。
+    取得結果は内容のハッシュで短時間保持し、同じ添付を複数箇所へ転送する時は再取得しません。
+    """
+    def __init__(self, concurrency: Optional[int] = None, max_bytes: Optional[int] = None,
+                 spool_bytes: Optional[int] = None, ttl: Optional[float] = None):
+        from utils import config
+        self.concurrency = config.ATTACHMENT_RELAY_CONCURRENCY if concurrency is None else concurrency
+        self.spool_bytes = config.ATTACHMENT_SPOOL_BYTES if spool_bytes is None else spool_bytes
+        self.ttl = config.ATTACHMENT_CACHE_SECONDS if ttl is None else ttl
+        self.budget = ByteBudget(config.ATTACHMENT_RELAY_MAX_BYTES if max_bytes is None else max_bytes)
+        self._sem = asyncio.Semaphore(self.concurrency)
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._dir: Optional[str] = None
+        # sha256 -> Blob と、添付ID -> sha256
+        self._blobs: Dict[str, Blob] = {}
+        self._by_id: Dict[int, str] = {}
+        self._inflight: Dict[int, asyncio.Future] = {}
+        self.stats: Dict[str, int] = {"downloads": 0, "cache_hits": 0, "spooled": 0, "links": 0, "failures": 0, "bytes": 0}
+
+    async def prepare(self, attachments, limit_bytes: int) -> Tuple[List[discord.File], List[str]]:
+        """
+        送信用の File 一覧と、添付できなかった分の URL 一覧を返します。
+        limit_bytes (ギルドのアップロード上限) を超える分はリンクで代替します。
+        """
+        self._sweep()
+        files: List[discord.File] = []
+        links: List[str] = []
+        targets = []
+        total = 0
+        for a in attachments:
+            if total + a.size > limit_bytes:
+                links.append(a.url)
+            else:
+                total += a.size
+                targets.append(a)
+        blobs = await asyncio.gather(*(self._get(a) for a in targets))
+        for a, blob in zip(targets, blobs):
+            if blob is None:
+                links.append(a.url)
+            else:
+                files.append(blob.to_file(a.filename, spoiler=a.is_spoiler()))
+        self.stats["links"] += len(links)
+        return files, links
+
+    async def _get(self, a) -> Optional[Blob]:
+        digest = self._by_id.get(a.id)
+        blob = self._blobs.get(digest) if digest else None
+        if blob is not None:
+            self.stats["cache_hits"] += 1
+            return blob
+        fut = self._inflight.get(a.id)
+        if fut is not None:
+            # 同じ添付を同時に取得している場合はその結果を待つ
+            self.stats["cache_hits"] += 1
+            return await asyncio.shield(fut)
+        fut = asyncio.get_running_loop().create_future()
+        self._inflight[a.id] = fut
+        blob = None
+        try:
+            blob = await self._download(a)
+        except Exception as e:
+            self.stats["failures"] += 1
+            logger.warning(f"Attachment download failed ({a.filename}): {e}")
+        finally:
+            del self._inflight[a.id]
+            fut.set_result(blob)
+        return blob
+
+    async def _download(self, a) -> Blob:
+        size = a.size
+        await self.budget.acquire(size)
+        try:
+            async with self._sem:
+                if self._session is None or self._session.closed:
+                    self._session = aiohttp.ClientSession()
+                h = hashlib.sha256()
+                spool = size > self.spool_bytes
+                out = tempfile.NamedTemporaryFile(dir=self._tmpdir(), delete=False) if spool else io.BytesIO()
+                try:
+                    async with self._session.get(a.url) as resp:
+                        resp.raise_for_status()
+                        async for chunk in resp.content.iter_chunked(CHUNK_SIZE):
+                            h.update(chunk)
+                            out.write(chunk)
+                except BaseException:
+                    out.close()
+                    if spool:
+                        os.unlink(out.name)
+                    raise
+        finally:
+            self.budget.release(size)
+        self.stats["downloads"] += 1
+        self.stats["bytes"] += size
+        digest = h.hexdigest()
+        blob = self._blobs.get(digest)
+        expires = time.monotonic() + self.ttl
+        if blob is not None:
+            # 別の添付IDで同じ内容を取得済み
+            if spool:
+                out.close()
+                os.unlink(out.name)
+            blob.expires = expires
+        elif spool:
+            out.close()
+            self.stats["spooled"] += 1
+            blob = Blob(digest, size, None, out.name, expires)
+        else:
+            blob = Blob(digest, size, out.getvalue(), None, expires)
+        self._blobs[digest] = blob
+        self._by_id[a.id] = digest
+        return blob
+
+    def _tmpdir(self) -> str:
+        if self._dir is None:
+            self._dir = tempfile.mkdtemp(prefix="attachment-relay-")
+        return self._dir
+
+    def _sweep(self):
+        now = time.monotonic()
+        expired = [d for d, b in self._blobs.items() if b.expires <= now]
+        for d in expired:
+            blob = self._blobs.pop(d)
+            if blob.path:
+                # 送信中の File は開いたままなので消しても読めます
+                try:
+                    os.unlink(blob.path)
+                except OSError:
+                    pass
+        if expired:
+            self._by_id = {i: d for i, d in self._by_id.items() if d in self._blobs}
+
+    def report(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = dict(self.stats)
+        out["cached"] = len(self._blobs)
+        out["in_flight_bytes"] = self.budget.in_use
+        return out
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+        self._blobs.clear()
+        self._by_id.clear()
+        if self._dir is not None:
+            shutil.rmtree(self._dir, ignore_errors=True)
+            self._dir = None
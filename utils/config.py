@@ -2,3 +2,32 @@ import os
 
 LOG_CHANNEL_ID = int(os.getenv("LOG_CHANNEL_ID", "0")) or None
 QUALIFIED_ROLE_ID   = int(os.getenv("QUALIFIED_ROLE_ID", "0")) or None 
+
+# 保存先バックエンド: "json" (既定), "sharded" (ギルド毎のファイル) または "sqlite"
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "json").lower()
+SQLITE_PATH = os.getenv("SQLITE_PATH", os.path.join("data", "chomabot.sqlite3"))
+
+# sharded: 常駐させるギルドデータの上限 (バイト) と、退避対象になるまでの無アクセス秒数
+SHARD_CACHE_BYTES = int(os.getenv("SHARD_CACHE_BYTES", str(64 * 1024 * 1024)))
+SHARD_IDLE_SECONDS = int(os.getenv("SHARD_IDLE_SECONDS", "600"))
+
+# 遅延書き込み: 最初の変更から書き込むまでの最大秒数と、即時書き込みする未保存件数
+WRITE_BEHIND_MAX_DELAY = float(os.getenv("WRITE_BEHIND_MAX_DELAY", "5"))
+WRITE_BEHIND_MAX_DIRTY = int(os.getenv("WRITE_BEHIND_MAX_DIRTY", "100"))
+
+# フォーラムのログスレッドを REST で取得した結果を保持する件数 (LRU)
+THREAD_CACHE_SIZE = int(os.getenv("THREAD_CACHE_SIZE", "512"))
+
+# 添付ファイルの中継: 同時ダウンロード数 / ダウンロード中の合計バイト数の上限 /
+# これを超えるファイルは一時ファイルに書き出す / 取得済みファイルを使い回す秒数
+ATTACHMENT_RELAY_CONCURRENCY = int(os.getenv("ATTACHMENT_RELAY_CONCURRENCY", "4"))
+ATTACHMENT_RELAY_MAX_BYTES = int(os.getenv("ATTACHMENT_RELAY_MAX_BYTES", str(64 * 1024 * 1024)))
+ATTACHMENT_SPOOL_BYTES = int(os.getenv("ATTACHMENT_SPOOL_BYTES", str(1024 * 1024)))
+ATTACHMENT_CACHE_SECONDS = int(os.getenv("ATTACHMENT_CACHE_SECONDS", "300"))
+
+# チケット集計: 直近の所要時間を保持する件数 (中央値用) / 日別の完了件数を保持する日数
+ANALYTICS_RING_SIZE = int(os.getenv("ANALYTICS_RING_SIZE", "100"))
+ANALYTICS_DAILY_DAYS = int(os.getenv("ANALYTICS_DAILY_DAYS", "30"))
+
+# チケットの最終発言時刻を保存する間隔 (秒)。この間の発言はメモリ上でまとめる
+ACTIVITY_PERSIST_SECONDS = float(os.getenv("ACTIVITY_PERSIST_SECONDS", "300"))
@@ -0,0 +1,143 @@
+import os
+import re
+import json
+import glob
+import asyncio
+import logging
+from typing import Any, Dict, List, Sequence
+from utils.storage import to_json
+
+logger = logging.getLogger("utils.journal")
+
+_DELETE = object()
+
+class Journal:
+    """
+    追記専用の変更ジャーナル。1行1レコード ({"s": ストア名, "p": パス, "v": 値}) の JSONL です。
+    セグメント単位でローテーションし、スナップショット保存後に古いセグメントを削除します。
+    """
+    def __init__(self, basepath: str):
+        self.basepath = basepath
+        self._seq = max(self._segments(), default=0) + 1
+        self._fp = None
+        self.size = 0
+        self.stats: Dict[str, Any] = {"records": 0, "replayed": 0, "compactions": 0}
+
+    def _segment_path(self, seq: int) -> str:
+        return f"{self.basepath}.{seq:06d}"
+
+    def _segments(self) -> List[int]:
+        seqs = []
+        pattern = re.compile(re.escape(os.path.basename(self.basepath)) + r"\.(\d+)$")
+        for path in glob.glob(f"{self.basepath}.*"):
+            m = pattern.match(os.path.basename(path))
+            if m:
+                seqs.append(int(m.group(1)))
+        return sorted(seqs)
+
+    def _open(self):
+        if self._fp is None:
+            os.makedirs(os.path.dirname(self.basepath) or ".", exist_ok=True)
+            path = self._segment_path(self._seq)
+            self._fp = open(path, "a", encoding="utf-8")
+            self.size = os.path.getsize(path)
+        return self._fp
+
+    def append(self, store: str, path: Sequence[str], value: Any = _DELETE):
+        rec = {"s": store, "p": list(path)}
+        if value is _DELETE:
+            rec["d"] = 1
+        else:
+            rec["v"] = value
+        line = json.dumps(rec, ensure_ascii=False, separators=(",", ":"), default=to_json) + "\n"
+        fp = self._open()
+        fp.write(line)
+        # OSのバッファまでは即時に渡す (プロセスが落ちても失われない)
+        fp.flush()
+        self.size += len(line.encode("utf-8"))
+        self.stats["records"] += 1
+
+    def delete(self, store: str, path: Sequence[str]):
+        self.append(store, path)
+
+    def replay(self, docs: Dict[str, Dict[str, Any]]) -> List[tuple]:
+        """
+        全セグメントを順に docs に適用し、適用したパスの一覧 (store, *path) を返します。
+        """
+        applied = []
+        for seq in self._segments():
+            path = self._segment_path(seq)
+            with open(path, "r", encoding="utf-8") as f:
+                for lineno, line in enumerate(f, 1):
+                    if not line.strip():
+                        continue
+                    try:
+                        rec = json.loads(line)
+                    except ValueError:
+                        # 書き込み途中で落ちた末尾行など
+                        logger.warning(f"Skip broken journal record ({path}:{lineno})")
+                        continue
+                    doc = docs.get(rec.get("s"))
+                    if doc is None:
+                        continue
+                    self._apply(doc, rec["p"], rec.get("v"), bool(rec.get("d")))
+                    applied.append((rec["s"], *rec["p"]))
+        self.stats["replayed"] = len(applied)
+        return applied
+
+    @staticmethod
+    def _apply(doc: Dict[str, Any], path: List[str], value: Any, deleted: bool):
+        if not path:
+            if not deleted:
+                doc.clear()
+                doc.update(value)
+            return
+        node = doc
+        for key in path[:-1]:
+            nxt = node.get(key)
+            if not isinstance(nxt, dict):
+                if deleted:
+                    return
+                nxt = node[key] = {}
+            node = nxt
+        if deleted:
+            node.pop(path[-1], None)
+        else:
+            node[path[-1]] = value
+
+    def rotate(self) -> int:
+        """現在のセグメントを閉じて新しいセグメントに切り替え、閉じたセグメント番号を返します。"""
+        closed = self._seq
+        if self._fp is not None:
+            self._fp.close()
+            self._fp = None
+        self._seq += 1
+        self.size = 0
+        return closed
+
+    def drop_through(self, seq: int):
+        for s in self._segments():
+            if s <= seq:
+                try:
+                    os.remove(self._segment_path(s))
+                except OSError as e:
+                    logger.warning(f"Failed to remove journal segment {s}: {e}")
+        self.stats["compactions"] += 1
+
+    def sync(self):
+        fp = self._fp
+        if fp is not None:
+            try:
+                os.fsync(fp.fileno())
+            except (OSError, ValueError):
+                # ローテーションで閉じられた場合など
+                pass
+
+    async def sync_async(self):
+        if self._fp is not None:
+            await asyncio.get_running_loop().run_in_executor(None, self.sync)
+
+    def close(self):
+        if self._fp is not None:
+            self._fp.close()
+            self._fp = None
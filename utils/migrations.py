@@ -0,0 +1,56 @@
+import copy
+import logging
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger("utils.migrations")
+
+# ギルド単位ドキュメントに記録するスキーマバージョンのキー
+SCHEMA_KEY = "_schema"
+
+class Schema:
+    """
+    ギルド単位ドキュメントのスキーマ定義。
+    読み込み時に upgrade() で一度だけ移行と既定値の補完を行い、バージョンを記録します。
+    既定値やドキュメントの形を変えるときは version を上げ、必要なら migrations[新version] を追加してください。
+    """
+    def __init__(self, name: str, version: int, defaults: Dict[str, Any],
+                 migrations: Optional[Dict[int, Callable[[Dict[str, Any]], None]]] = None,
+                 normalize: Optional[Callable[[Dict[str, Any]], None]] = None):
+        self.name = name
+        self.version = version
+        self.defaults = defaults
+        # migrations[v] は v-1 -> v の変換 (その場で書き換える)
+        self.migrations = migrations or {}
+        # ネストしたレコード (プロフィール等) の補完用。毎回のアップグレードの最後に呼ばれます
+        self.normalize = normalize
+        self.upgraded = 0
+
+    def new(self) -> Dict[str, Any]:
+        """新しいギルド用の、最新スキーマのドキュメントを作ります。"""
+        doc = copy.deepcopy(self.defaults)
+        doc[SCHEMA_KEY] = self.version
+        return doc
+
+    def upgrade(self, gdoc: Dict[str, Any]) -> bool:
+        """古いドキュメントを最新スキーマに移行します。変更した場合は True を返します。"""
+        current = gdoc.get(SCHEMA_KEY, 0)
+        if current >= self.version:
+            return False
+        for v in range(current + 1, self.version + 1):
+            step = self.migrations.get(v)
+            if step is not None:
+                step(gdoc)
+        for k, v in self.defaults.items():
+            if k not in gdoc:
+                gdoc[k] = copy.deepcopy(v)
+        if self.normalize is not None:
+            self.normalize(gdoc)
+        gdoc[SCHEMA_KEY] = self.version
+        self.upgraded += 1
+        return True
+
+def fill_defaults(doc: Dict[str, Any], defaults: Dict[str, Any]) -> Dict[str, Any]:
+    for k, v in defaults.items():
+        if k not in doc:
+            doc[k] = copy.deepcopy(v)
+    return doc
@@ -0,0 +1,238 @@
+import time
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+import discord
+
+logger = logging.getLogger("utils.name_index")
+
+class ChannelNameIndex:
+    """
+    1ギルド分の チャンネル / カテゴリ / スレッド の小文字名 -> ID の索引。
+    {channel:...} / {thread:...} の解決用で、作成・更新・削除イベントで差分更新します。
+    """
+    # 見つからなかった時に、Gateway キャッシュから作り直してよい間隔 (秒)
+    REBUILD_INTERVAL = 60
+
+    def __init__(self, guild: discord.Guild):
+        self.guild = guild
+        self.channels: Dict[str, List[int]] = {}
+        self.categories: Dict[str, List[int]] = {}
+        self.threads: Dict[str, List[int]] = {}
+        # (カテゴリID, 名前) -> チャンネルID / (チャンネルID, 名前) -> スレッドID
+        self.in_category: Dict[Tuple[int, str], List[int]] = {}
+        self.in_channel: Dict[Tuple[int, str], List[int]] = {}
+        self.built_at = 0.0
+        self.rebuild()
+
+    def rebuild(self):
+        for d in (self.channels, self.categories, self.threads, self.in_category, self.in_channel):
+            d.clear()
+        for ch in self.guild.channels:
+            self.add(ch)
+        for th in self.guild.threads:
+            self.add(th)
+        self.built_at = time.monotonic()
+
+    @staticmethod
+    def _put(d: Dict, key, oid: int):
+        ids = d.setdefault(key, [])
+        if oid not in ids:
+            ids.append(oid)
+
+    @staticmethod
+    def _drop(d: Dict, key, oid: int):
+        ids = d.get(key)
+        if ids and oid in ids:
+            ids.remove(oid)
+            if not ids:
+                del d[key]
+
+    def _entries(self, obj):
+        name = obj.name.lower()
+        if isinstance(obj, discord.Thread):
+            yield self.threads, name
+            if obj.parent_id:
+                yield self.in_channel, (obj.parent_id, name)
+            return
+        yield self.channels, name
+        if isinstance(obj, discord.CategoryChannel):
+            yield self.categories, name
+        elif obj.category_id:
+            yield self.in_category, (obj.category_id, name)
+
+    def add(self, obj):
+        for d, key in self._entries(obj):
+            self._put(d, key, obj.id)
+
+    def remove(self, obj):
+        for d, key in self._entries(obj):
+            self._drop(d, key, obj.id)
+
+    def _first(self, d: Dict, key, name: str):
+        # イベントの取りこぼしに備えて、実体と名前を確認してから返す
+        for oid in list(d.get(key, ())):
+            obj = self.guild.get_channel_or_thread(oid)
+            if obj is not None and obj.name.lower() == name:
+                return obj
+            self._drop(d, key, oid)
+        return None
+
+    def _lookup(self, parts: Tuple[str, ...]):
+        if len(parts) == 1:
+            name = parts[0]
+            return self._first(self.channels, name, name) or self._first(self.threads, name, name)
+        if len(parts) == 2:
+            p1, p2 = parts
+            target = None
+            cat = self._first(self.categories, p1, p1)
+            if cat:
+                target = self._first(self.in_category, (cat.id, p2), p2)
+            if not target:
+                ch = self._first(self.channels, p1, p1)
+                if ch and not isinstance(ch, discord.CategoryChannel):
+                    target = self._first(self.in_channel, (ch.id, p2), p2)
+            return target
+        cat_name, ch_name, th_name = parts[:3]
+        cat = self._first(self.categories, cat_name, cat_name)
+        if cat:
+            ch = self._first(self.in_category, (cat.id, ch_name), ch_name)
+            if ch:
+                return self._first(self.in_channel, (ch.id, th_name), th_name)
+        return None
+
+    def resolve(self, parts: Tuple[str, ...]):
+        """名前 (小文字) の並び [カテゴリ/チャンネル/スレッド] からチャンネルかスレッドを探します。"""
+        target = self._lookup(parts)
+        if target is None and time.monotonic() - self.built_at > self.REBUILD_INTERVAL:
+            # スレッド一覧の同期など、イベントの来ない変更を拾う
+            self.rebuild()
+            target = self._lookup(parts)
+        return target
+
+class ForumThreadIndex:
+    """
+    フォーラムごとの スレッド名 -> スレッドID の永続索引 (アーカイブ済みも含む)。
+    フォーラムごとに一度だけ全件を走査して作り、以降はスレッドの作成・更新・削除イベントで更新します。
+    データは {guild_id: {forum_id: {"seeded": bool, "threads": {name: thread_id}}}} の形で store に保存します。
+    """
+    def __init__(self, store):
+        self.store = store
+        self._seeding: Dict[int, asyncio.Task] = {}
+        # (guild_id, forum_id) -> (threads の辞書, thread_id -> 名前の集合)。削除イベント用の逆引きでメモリ上だけに持つ
+        self._ids: Dict[tuple, tuple] = {}
+
+    def _forum(self, guild_id, forum_id, create: bool = False) -> Optional[Dict[str, Any]]:
+        gid, fid = str(guild_id), str(forum_id)
+        g = self.store.data.get(gid)
+        if g is None:
+            if not create:
+                return None
+            g = self.store.data[gid] = {}
+        f = g.get(fid)
+        if f is None and create:
+            f = g[fid] = {"seeded": False, "threads": {}}
+        return f
+
+    def _reverse(self, guild_id, forum_id, f: Dict[str, Any]) -> Dict[int, set]:
+        key = (str(guild_id), str(forum_id))
+        cached = self._ids.get(key)
+        # 初回参照時と、ドキュメントが読み直された (シャードの追い出し等) 時に作り直す
+        if cached is None or cached[0] is not f["threads"]:
+            ids: Dict[int, set] = {}
+            for name, tid in f["threads"].items():
+                ids.setdefault(tid, set()).add(name)
+            cached = self._ids[key] = (f["threads"], ids)
+        return cached[1]
+
+    def get(self, forum, name: str) -> Optional[int]:
+        f = self._forum(forum.guild.id, forum.id)
+        return f["threads"].get(name) if f else None
+
+    async def ensure_seeded(self, forum):
+        """未走査のフォーラムなら、公開スレッドとアーカイブを全件たどって索引を作ります。"""
+        f = self._forum(forum.guild.id, forum.id)
+        if f is not None and f["seeded"]:
+            return
+        task = self._seeding.get(forum.id)
+        if task is None:
+            task = self._seeding[forum.id] = asyncio.create_task(self._seed(forum))
+            task.add_done_callback(lambda _: self._seeding.pop(forum.id, None))
+        await asyncio.shield(task)
+
+    async def _seed(self, forum):
+        # 走査中に作られたスレッドもイベントで入るよう、先に枠を作っておく
+        f = self._forum(forum.guild.id, forum.id, create=True)
+        count = 0
+        for t in forum.threads:
+            self._put(f, self._reverse(forum.guild.id, forum.id, f), t)
+            count += 1
+        async for t in forum.archived_threads(limit=None):
+            self._put(f, self._reverse(forum.guild.id, forum.id, f), t)
+            count += 1
+        f["seeded"] = True
+        self.store.mark_dirty(forum.guild.id)
+        logger.info(f"Indexed {count} threads in forum {forum.id}")
+
+    @staticmethod
+    def _put(f: Dict[str, Any], ids: Dict[int, set], thread):
+        # 同名のスレッドは先に見つかった (新しい) 方を使う
+        if thread.name not in f["threads"]:
+            f["threads"][thread.name] = thread.id
+            ids.setdefault(thread.id, set()).add(thread.name)
+
+    @staticmethod
+    def _drop(f: Dict[str, Any], ids: Dict[int, set], name: str, thread_id: int):
+        if f["threads"].get(name) == thread_id:
+            del f["threads"][name]
+            names = ids.get(thread_id)
+            if names is not None:
+                names.discard(name)
+                if not names:
+                    del ids[thread_id]
+
+    def set(self, forum, name: str, thread_id: int):
+        """スレッドを作成・紐付けした時に、その名前で引けるようにします。"""
+        f = self._forum(forum.guild.id, forum.id, create=True)
+        ids = self._reverse(forum.guild.id, forum.id, f)
+        old = f["threads"].get(name)
+        if old is not None:
+            self._drop(f, ids, name, old)
+        f["threads"][name] = thread_id
+        ids.setdefault(thread_id, set()).add(name)
+        self.store.mark_dirty(forum.guild.id)
+
+    def discard(self, forum, name: str, thread_id: int):
+        f = self._forum(forum.guild.id, forum.id)
+        if f is not None:
+            self._drop(f, self._reverse(forum.guild.id, forum.id, f), name, thread_id)
+            self.store.mark_dirty(forum.guild.id)
+
+    # --- イベント ---
+    def on_create(self, thread):
+        f = self._forum(thread.guild.id, thread.parent_id)
+        if f is not None and thread.name not in f["threads"]:
+            self._put(f, self._reverse(thread.guild.id, thread.parent_id, f), thread)
+            self.store.mark_dirty(thread.guild.id)
+
+    def on_update(self, before, after):
+        if before.name == after.name:
+            return
+        f = self._forum(after.guild.id, after.parent_id)
+        if f is not None:
+            ids = self._reverse(after.guild.id, after.parent_id, f)
+            self._drop(f, ids, before.name, before.id)
+            self._put(f, ids, after)
+            self.store.mark_dirty(after.guild.id)
+
+    def on_delete(self, guild_id, forum_id, thread_id: int):
+        f = self._forum(guild_id, forum_id)
+        if f is None:
+            return
+        ids = self._reverse(guild_id, forum_id, f)
+        names = ids.get(thread_id)
+        if not names:
+            return
+        for name in list(names):
+            self._drop(f, ids, name, thread_id)
+        self.store.mark_dirty(guild_id)
@@ -0,0 +1,208 @@
+import time
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional
+from utils.storage import mark_dirty
+from utils.migrations import Schema
+
+logger = logging.getLogger("utils.persistence")
+
+class Flushable:
+    """
+    WriteBehindManager に登録できるオブジェクトの基底クラス。
+    変更があったら _notify() を呼び、flush_async() / flush() で書き出します。
+    """
+    name = "unnamed"
+    _manager: Optional["WriteBehindManager"] = None
+
+    def pending(self) -> int:
+        return 0
+
+    def _notify(self):
+        if self._manager is not None:
+            self._manager.notify(self)
+
+    async def flush_async(self):
+        pass
+
+    def flush(self):
+        pass
+
+class Store(Flushable):
+    """
+    ハンドラと、そのハンドラで保存するデータのペア。
+    data を省略するとハンドラから読み込みます。schema を渡すと古いギルドを移行し、保存対象にします。
+    """
+    def __init__(self, name: str, handler, data: Optional[Dict[str, Any]] = None, schema: Optional[Schema] = None):
+        self.name = name
+        self.handler = handler
+        self.schema = schema
+        self._keys: Optional[set] = set()
+        self._dirty = False
+        self.data = None
+        if data is None:
+            data = handler.load(decode=self._upgrade if schema is not None else None)
+        self.data = data
+
+    def _upgrade(self, gid: str, gdoc: Dict[str, Any]) -> Dict[str, Any]:
+        # シャード形式では初回アクセス時に呼ばれる
+        if self.schema.upgrade(gdoc):
+            self._dirty = True
+            if self._keys is not None:
+                self._keys.add((str(gid),))
+            if self.data is not None:
+                mark_dirty(self.data, gid)
+            self._notify()
+        return gdoc
+
+    def mark_dirty(self, *key):
+        """key は guild_id または (guild_id, record_id)。省略時は全体。"""
+        self._dirty = True
+        if not key or key[0] is None:
+            self._keys = None
+        else:
+            mark_dirty(self.data, key[0])
+            if self._keys is not None:
+                self._keys.add(tuple(str(k) for k in key))
+        self._notify()
+
+    def pending(self) -> int:
+        if not self._dirty:
+            return 0
+        return len(self._keys) if self._keys is not None else 1
+
+    def _take(self):
+        keys = self._keys
+        self._dirty, self._keys = False, set()
+        return keys
+
+    def _restore(self):
+        self._dirty, self._keys = True, None
+
+    async def flush_async(self):
+        if not self._dirty:
+            return
+        keys = self._take()
+        if not await self.handler.save_async(self.data, keys=keys):
+            self._restore()
+
+    def flush(self):
+        if not self._dirty:
+            return
+        keys = self._take()
+        if not self.handler.save(self.data, keys=keys):
+            self._restore()
+
+class WriteBehindManager:
+    """
+    全 Cog 共通の遅延書き込みサービス。
+    最初の変更から max_delay 秒後、または未保存件数が max_dirty に達した時点でまとめて書き込みます。
+    """
+    def __init__(self, max_delay: Optional[float] = None, max_dirty: Optional[int] = None):
+        from utils.config import WRITE_BEHIND_MAX_DELAY, WRITE_BEHIND_MAX_DIRTY
+        self.max_delay = WRITE_BEHIND_MAX_DELAY if max_delay is None else max_delay
+        self.max_dirty = WRITE_BEHIND_MAX_DIRTY if max_dirty is None else max_dirty
+        self._stores: List[Flushable] = []
+        self._wake: Optional[asyncio.Event] = None
+        self._full: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._first_dirty_at: Optional[float] = None
+        self.stats: Dict[str, Any] = {
+            "flushes": 0, "failures": 0, "last_batch": 0,
+            "last_flush_ms": 0.0, "max_flush_ms": 0.0,
+        }
+
+    def register(self, name: str, handler, data: Optional[Dict[str, Any]] = None, schema: Optional[Schema] = None) -> Store:
+        return self.attach(Store(name, handler, data, schema))
+
+    def attach(self, store: Flushable) -> Flushable:
+        store._manager = self
+        self._stores.append(store)
+        if store.pending():
+            # 読み込み時の移行分など
+            self.notify(store)
+        return store
+
+    def unregister(self, store: Flushable):
+        """Cog のアンロード時用。残っている変更を同期的に書き出します。"""
+        if store in self._stores:
+            self._stores.remove(store)
+        store._manager = None
+        try:
+            store.flush()
+        except Exception as e:
+            logger.error(f"Failed to flush store {store.name}: {e}")
+
+    def queue_depth(self) -> int:
+        return sum(s.pending() for s in self._stores)
+
+    def notify(self, store: Flushable):
+        if self._wake is None:
+            return
+        if not self._wake.is_set():
+            self._first_dirty_at = time.monotonic()
+            self._wake.set()
+        if self.queue_depth() >= self.max_dirty:
+            self._full.set()
+
+    def start(self):
+        self._wake = asyncio.Event()
+        self._full = asyncio.Event()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+        # start() 以前の変更を拾う
+        if self.queue_depth():
+            self.notify(self._stores[0])
+
+    async def _run(self):
+        while True:
+            await self._wake.wait()
+            remaining = self.max_delay - (time.monotonic() - (self._first_dirty_at or 0))
+            if remaining > 0 and not self._full.is_set():
+                try:
+                    await asyncio.wait_for(self._full.wait(), timeout=remaining)
+                except asyncio.TimeoutError:
+                    pass
+            self._wake.clear()
+            self._full.clear()
+            await self.flush_all()
+            # 書き込み中に入った変更は次のバッチへ
+            if self.queue_depth():
+                self._first_dirty_at = time.monotonic()
+                self._wake.set()
+
+    async def flush_all(self):
+        start = time.perf_counter()
+        batch = self.queue_depth()
+        for store in list(self._stores):
+            if not store.pending():
+                continue
+            try:
+                await store.flush_async()
+            except Exception as e:
+                self.stats["failures"] += 1
+                logger.error(f"Failed to flush store {store.name}: {e}")
+        elapsed = (time.perf_counter() - start) * 1000
+        self.stats["flushes"] += 1
+        self.stats["last_batch"] = batch
+        self.stats["last_flush_ms"] = elapsed
+        self.stats["max_flush_ms"] = max(self.stats["max_flush_ms"], elapsed)
+        if elapsed > 1000:
+            logger.warning(f"Slow flush: {batch} pending, {elapsed:.0f}ms")
+        else:
+            logger.debug(f"Flushed {batch} pending in {elapsed:.1f}ms")
+
+    async def shutdown(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush_all()
+
+    def report(self) -> Dict[str, Any]:
+        out = dict(self.stats)
+        out["queue_depth"] = self.queue_depth()
+        out["stores"] = {s.name: s.pending() for s in self._stores}
+        return out
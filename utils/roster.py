@@ -0,0 +1,112 @@
+import bisect
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# 昇順の属性で値が 0 (未設定) のメンバーを末尾に回すための値
+UNSET_ASC = 99999999
+
+class AssigneeRoster:
+    """
+    1ギルド分の担当者候補 (担当ロール / 資格ロールを持つ bot 以外のメンバー) の一覧。
+    属性ごとの並び順をソート済みで持ち、メンバーのロール変更やプロフィール変更で差分更新します。
+    ロールや属性の定義が変わった場合は作り直してください。
+    """
+    def __init__(self, assignee_role_id: Optional[int], qual_role_id: Optional[int],
+                 attributes: Dict[str, Dict[str, Any]], profile_of: Callable[[int], Dict[str, Any]]):
+        self.assignee_role_id = assignee_role_id
+        self.qual_role_id = qual_role_id
+        # 属性名 -> 昇順かどうか
+        self.ascending = {k: (v or {}).get("order") == "asc" for k, v in attributes.items()}
+        self.profile_of = profile_of
+        # member_id -> 受付中 (担当ロールあり) か
+        self.accepting: Dict[int, bool] = {}
+        # member_id -> {属性名 (None は標準): ソートキー}
+        self._keys: Dict[int, Dict[Optional[str], Tuple]] = {}
+        self.orders: Dict[Optional[str], List[Tuple]] = {None: []}
+        for attr in self.ascending:
+            self.orders[attr] = []
+
+    @classmethod
+    def build(cls, guild, g_conf: Dict[str, Any],
+              profile_of: Optional[Callable[[int], Dict[str, Any]]] = None) -> "AssigneeRoster":
+        """
+        profile_of は member_id からプロフィールを引く関数。ギルドのドキュメントが読み直される
+        (シャードの追い出し等) 場合は、g_conf を掴まずに毎回引き直すものを渡してください。
+        """
+        if profile_of is None:
+            profiles = g_conf.get("profiles", {})
+            profile_of = lambda mid: profiles.get(str(mid)) or {}
+        roster = cls(g_conf.get("assignee_role_id"), g_conf.get("assignee_qual_role_id"),
+                     g_conf.get("attributes", {}), profile_of)
+        members = {}
+        for rid in (roster.assignee_role_id, roster.qual_role_id):
+            role = guild.get_role(rid) if rid else None
+            if role:
+                members.update((m.id, m) for m in role.members)
+        for m in members.values():
+            roster.upsert(m)
+        return roster
+
+    def __len__(self) -> int:
+        return len(self.accepting)
+
+    def _sort_key(self, attr: Optional[str], member_id: int, profile: Dict[str, Any]) -> Tuple:
+        if attr is None:
+            return (0, member_id)
+        val = (profile.get("attributes") or {}).get(attr, 0)
+        if self.ascending.get(attr, False):
+            return (UNSET_ASC if val == 0 else val, member_id)
+        return (-val, member_id)
+
+    def _place(self, member_id: int):
+        self._unplace(member_id)
+        profile = self.profile_of(member_id)
+        keys = self._keys[member_id] = {}
+        for attr, order in self.orders.items():
+            key = keys[attr] = self._sort_key(attr, member_id, profile)
+            bisect.insort(order, key)
+
+    def _unplace(self, member_id: int):
+        keys = self._keys.pop(member_id, None)
+        if not keys:
+            return
+        for attr, key in keys.items():
+            order = self.orders.get(attr)
+            if order is None:
+                continue
+            i = bisect.bisect_left(order, key)
+            if i < len(order) and order[i] == key:
+                del order[i]
+
+    def upsert(self, member):
+        """メンバーのロールに応じて追加 / 更新 / 除外します (on_member_update 用)。"""
+        role_ids = {r.id for r in member.roles}
+        accepting = bool(self.assignee_role_id) and self.assignee_role_id in role_ids
+        qualified = bool(self.qual_role_id) and self.qual_role_id in role_ids
+        if member.bot or not (accepting or qualified):
+            self.remove(member.id)
+            return
+        self.accepting[member.id] = accepting
+        if member.id not in self._keys:
+            self._place(member.id)
+
+    def remove(self, member_id: int):
+        self.accepting.pop(member_id, None)
+        self._unplace(member_id)
+
+    def profile_changed(self, member_id: int):
+        """プロフィール (属性値) が変わったメンバーの並び位置を直します。"""
+        if member_id in self.accepting:
+            self._place(member_id)
+
+    def ordered(self, attr: Optional[str] = None):
+        """(member_id, 属性値) を並び順に返すイテレータ。必要な件数だけ取り出してください。"""
+        order = self.orders.get(attr)
+        if order is None:
+            # 未定義の属性 (降順扱い) は初回に並べる
+            order = self.orders[attr] = sorted(
+                self._sort_key(attr, mid, self.profile_of(mid)) for mid in self.accepting)
+            for key in order:
+                self._keys[key[1]][attr] = key
+        negate = attr is not None and not self.ascending.get(attr, False)
+        for val, member_id in order:
+            yield member_id, (-val if negate else val)
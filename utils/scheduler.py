@@ -0,0 +1,94 @@
+import time
+import heapq
+import asyncio
+import logging
+import itertools
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+logger = logging.getLogger("utils.scheduler")
+
+class DeadlineScheduler:
+    """
+    キーごとに1つの期限 (epoch 秒) を持つ最小ヒープ。
+    run() は一番近い期限まで眠り、期限が来たキーで fire(key) を呼びます。
+    再スケジュールされた古いエントリは取り出し時に読み捨てます。
+    """
+    # 時計のずれやスリープ復帰に備えて、待機はこの秒数ごとに区切る
+    MAX_SLEEP = 3600
+
+    def __init__(self):
+        self._heap: List[Tuple[float, int, Hashable]] = []
+        self._deadlines: Dict[Hashable, float] = {}
+        # postpone() で後ろにずらした期限。ヒープ上の期限が来た時に入れ直す
+        self._postponed: Dict[Hashable, float] = {}
+        self._seq = itertools.count()
+        self._wake: Optional[asyncio.Event] = None
+        self.stats: Dict[str, Any] = {"fired": 0, "max_lateness_ms": 0.0}
+
+    def __len__(self) -> int:
+        return len(self._deadlines)
+
+    def schedule(self, key: Hashable, deadline: Optional[float]):
+        """key の期限を設定します。None なら取り消します。"""
+        if deadline is None:
+            self.cancel(key)
+            return
+        self._postponed.pop(key, None)
+        if self._deadlines.get(key) == deadline:
+            return
+        self._deadlines[key] = deadline
+        heapq.heappush(self._heap, (deadline, next(self._seq), key))
+        # 先頭が変わった場合だけ起こせば十分
+        if self._wake is not None and self._heap[0][2] == key:
+            self._wake.set()
+
+    def postpone(self, key: Hashable, deadline: Optional[float]):
+        """
+        key の期限を後ろにずらします。ヒープには積まず、今の期限が来た時点で入れ直すので、
+        発言のたびに延びる期限でもヒープが膨らみません。前に動く場合は schedule() と同じです。
+        """
+        current = self._deadlines.get(key)
+        if current is None or deadline is None or deadline <= current:
+            self.schedule(key, deadline)
+            return
+        self._postponed[key] = deadline
+
+    def cancel(self, key: Hashable):
+        self._deadlines.pop(key, None)
+        self._postponed.pop(key, None)
+
+    def next_deadline(self) -> Optional[float]:
+        heap = self._heap
+        while heap and self._deadlines.get(heap[0][2]) != heap[0][0]:
+            heapq.heappop(heap)
+        return heap[0][0] if heap else None
+
+    async def run(self, fire: Callable[[Hashable], Awaitable[None]]):
+        self._wake = asyncio.Event()
+        while True:
+            self._wake.clear()
+            deadline = self.next_deadline()
+            if deadline is None:
+                # 何も無い間は起こされるまで待つだけ
+                await self._wake.wait()
+                continue
+            delay = deadline - time.time()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=min(delay, self.MAX_SLEEP))
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            _, _, key = heapq.heappop(self._heap)
+            later = self._postponed.pop(key, None)
+            if later is not None and later > deadline:
+                self._deadlines[key] = later
+                heapq.heappush(self._heap, (later, next(self._seq), key))
+                continue
+            del self._deadlines[key]
+            self.stats["fired"] += 1
+            self.stats["max_lateness_ms"] = max(self.stats["max_lateness_ms"], -delay * 1000)
+            try:
+                await fire(key)
+            except Exception as e:
+                logger.error(f"Scheduled callback failed for {key}: {e}")
@@ -0,0 +1,368 @@
+import os
+import json
+import time
+import asyncio
+import logging
+import weakref
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+from utils.storage import JsonHandler, to_json, write_atomic, fsync_dir
+
+logger = logging.getLogger("utils.shards")
+
+class _GuildDoc(dict):
+    """シャードから読んだギルドデータ。退避後も参照が残っているかを weakref で確かめられます。"""
+    __slots__ = ("__weakref__",)
+
+# 退避したギルドの (データへの weakref, 値ごとの weakref, サイズ)
+_Evicted = Tuple[weakref.ref, "weakref.WeakValueDictionary", int]
+
+class GuildShardMap(MutableMapping):
+    """
+    guild_id -> ギルドデータ の遅延ロード辞書。
+    初回アクセス時にシャードを読み込み、上限を超えたら無アクセス時間の長いギルドから退避します。
+    未保存 (dirty) のギルドは退避しません。退避したデータやその値 (TicketTimer 等) への参照が外に残っていれば、
+    次のアクセスや mark_dirty() でそのオブジェクトを戻すので、参照経由の変更も失われません。
+    """
+    def __init__(self, handler: "ShardedJsonHandler", max_bytes: int, idle_seconds: float, decode: Optional[Callable] = None):
+        self.handler = handler
+        self.decode = decode
+        self.max_bytes = max_bytes
+        self.idle_seconds = idle_seconds
+        self._resident: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._last_access: Dict[str, float] = {}
+        self._sizes: Dict[str, int] = {}
+        self._known = set(handler.guild_ids())
+        self._dirty: set = set()
+        self._deleted: set = set()
+        self._evicted: Dict[str, _Evicted] = {}
+        # デコード中のギルド (decode から mark_dirty されることがある)
+        self._loading: Optional[str] = None
+        # summarize(guild_id, doc) を設定すると、ギルドの要約をシャードと一緒に索引へ保存し、
+        # シャードを読まずに summary() で参照できるようにします
+        self.summarize: Optional[Callable[[str, Dict[str, Any]], Any]] = None
+        self._summaries: Optional[Dict[str, Any]] = None
+        self._index_dirty = False
+
+    # --- Mapping ---
+    def __getitem__(self, gid: str) -> Dict[str, Any]:
+        doc = self._resident.get(gid)
+        if doc is None:
+            if gid not in self._known:
+                raise KeyError(gid)
+            doc = self._revive(gid)
+            if doc is None:
+                doc = self._load(gid)
+            self._evict(keep=gid)
+        self._resident.move_to_end(gid)
+        self._last_access[gid] = time.monotonic()
+        return doc
+
+    def _load(self, gid: str) -> Dict[str, Any]:
+        doc, size = self.handler.load_guild(gid)
+        self._loading = gid
+        try:
+            doc = _GuildDoc(doc)
+            if self.decode is not None:
+                doc = self.decode(gid, doc)
+        finally:
+            self._loading = None
+        self._resident[gid] = doc
+        self._sizes[gid] = size
+        self._last_access[gid] = time.monotonic()
+        self.handler.stats["loads"] += 1
+        if self.summarize is not None and gid not in self._index():
+            # 索引に無いギルド (移行直後など) は読み込んだついでに要約しておく
+            self._summarize(gid, doc)
+        return doc
+
+    def __setitem__(self, gid: str, doc: Dict[str, Any]):
+        self._resident[gid] = doc
+        self._resident.move_to_end(gid)
+        self._last_access[gid] = time.monotonic()
+        self._sizes.setdefault(gid, 0)
+        self._evicted.pop(gid, None)
+        self._known.add(gid)
+        self._deleted.discard(gid)
+        self._dirty.add(gid)
+
+    def __delitem__(self, gid: str):
+        if gid not in self._known:
+            raise KeyError(gid)
+        self._known.discard(gid)
+        self._resident.pop(gid, None)
+        self._evicted.pop(gid, None)
+        self._sizes.pop(gid, None)
+        self._last_access.pop(gid, None)
+        self._deleted.add(gid)
+        self._dirty.add(gid)
+
+    def __contains__(self, gid: object) -> bool:
+        return gid in self._known
+
+    def __iter__(self):
+        return iter(list(self._known))
+
+    def __len__(self) -> int:
+        return len(self._known)
+
+    # --- Cache control ---
+    def mark_dirty(self, gid: str):
+        if gid not in self._known:
+            return
+        if gid not in self._resident and gid != self._loading and self._revive(gid) is None:
+            # 読み込まずに (参照も残っていない退避済みのギルドを) 変更済みとするのは呼び出し側の誤り
+            logger.warning(f"mark_dirty on non-resident guild {gid} ({self.handler.dirpath}); nothing to save")
+            return
+        self._dirty.add(gid)
+
+    def _revive(self, gid: str) -> Optional[Dict[str, Any]]:
+        """退避したデータかその値への参照が外に残っていれば、そのオブジェクトを常駐に戻します。"""
+        entry = self._evicted.pop(gid, None)
+        if entry is None:
+            return None
+        ref, values, size = entry
+        doc = ref()
+        if doc is not None:
+            self._resident[gid] = doc
+            self._sizes[gid] = size
+            self._last_access[gid] = time.monotonic()
+        else:
+            values = list(values.items())
+            if not values:
+                return None
+            # 値だけが残っている。退避時点のシャードは保存済みなので、読み直して残っている方に差し替える
+            doc = self._load(gid)
+            for key, value in values:
+                doc[key] = value
+        self.handler.stats["revived"] += 1
+        return doc
+
+    def resident_bytes(self) -> int:
+        return sum(self._sizes.values())
+
+    # --- Summary index ---
+    def summary(self, gid: str) -> Any:
+        """ギルドの要約を返します。常駐中なら作り直し、索引に無ければ None (シャードは読みません)。"""
+        if self.summarize is None:
+            return None
+        doc = self._resident.get(gid)
+        if doc is not None:
+            return self._summarize(gid, doc)
+        return self._index().get(gid)
+
+    def _index(self) -> Dict[str, Any]:
+        if self._summaries is None:
+            self._summaries = self.handler.load_index()
+        return self._summaries
+
+    def _summarize(self, gid: str, doc: Dict[str, Any]) -> Any:
+        s = self.summarize(gid, doc)
+        index = self._index()
+        if gid not in index or index[gid] != s:
+            index[gid] = s
+            self._index_dirty = True
+        return s
+
+    def _forget_summary(self, gid: str):
+        if self.summarize is not None and self._index().pop(gid, None) is not None:
+            self._index_dirty = True
+
+    def _evict(self, keep: Optional[str] = None):
+        if self.resident_bytes() <= self.max_bytes:
+            return
+        now = time.monotonic()
+        for gid, (ref, values, _) in list(self._evicted.items()):
+            if ref() is None and not values:
+                del self._evicted[gid]
+        for gid in list(self._resident.keys()):
+            if self.resident_bytes() <= self.max_bytes:
+                break
+            if gid == keep or gid in self._dirty or now - self._last_access.get(gid, 0) < self.idle_seconds:
+                continue
+            doc = self._resident[gid]
+            try:
+                ref = weakref.ref(doc)
+            except TypeError:
+                # __setitem__ で渡された通常の dict は参照を追えないので退避しない
+                continue
+            values = weakref.WeakValueDictionary()
+            for key, value in doc.items():
+                try:
+                    values[key] = value
+                except TypeError:
+                    # dict / str など weakref を取れない値は追わない
+                    pass
+            self._evicted[gid] = (ref, values, self._sizes.get(gid, 0))
+            del doc
+            del self._resident[gid]
+            self._sizes.pop(gid, None)
+            self._last_access.pop(gid, None)
+            self.handler.stats["evictions"] += 1
+
+    def _take(self, keys: Optional[Iterable]) -> set:
+        gids = set(self._dirty)
+        if keys is None:
+            gids.update(self._resident.keys())
+        else:
+            for k in keys:
+                gids.add(str(k[0] if isinstance(k, tuple) else k))
+        self._dirty.difference_update(gids)
+        return gids
+
+class ShardedJsonHandler:
+    """
+    data/<store>/<guild_id>.json にギルド単位で保存するハンドラ。
+    load() は GuildShardMap を返し、save() は変更のあったギルドだけを書き込みます。
+    """
+    def __init__(self, dirpath: str, legacy_file: Optional[str] = None, indent: Optional[int] = 4):
+        from utils.config import SHARD_CACHE_BYTES, SHARD_IDLE_SECONDS
+        self.dirpath = dirpath
+        self.legacy_file = legacy_file
+        self.indent = indent
+        self.max_bytes = SHARD_CACHE_BYTES
+        self.idle_seconds = SHARD_IDLE_SECONDS
+        self._lock: Optional[asyncio.Lock] = None
+        self.stats: Dict[str, Any] = {
+            "writes": 0, "failures": 0, "bytes": 0, "loads": 0, "evictions": 0, "revived": 0,
+            "last_serialize_ms": 0.0, "last_write_ms": 0.0, "max_write_ms": 0.0,
+        }
+
+    def _path(self, gid: Optional[str]) -> str:
+        # gid が None なら要約の索引 (guild_ids からは除外される)
+        if gid is None:
+            return os.path.join(self.dirpath, ".index.json")
+        return os.path.join(self.dirpath, f"{gid}.json")
+
+    def guild_ids(self) -> List[str]:
+        if not os.path.isdir(self.dirpath):
+            return []
+        return [e.name[:-5] for e in os.scandir(self.dirpath) if e.name.endswith(".json") and not e.name.startswith(".")]
+
+    def load_guild(self, gid: str) -> Tuple[Dict[str, Any], int]:
+        path = self._path(gid)
+        try:
+            with open(path, "rb") as f:
+                raw = f.read()
+            return json.loads(raw), len(raw)
+        except Exception as e:
+            logger.error(f"Failed to load shard ({path}): {e}")
+            return {}, 0
+
+    def load_index(self) -> Dict[str, Any]:
+        path = self._path(None)
+        if not os.path.exists(path):
+            return {}
+        try:
+            with open(path, "rb") as f:
+                return json.loads(f.read())
+        except Exception as e:
+            # 索引が無くても各シャードを読めば作り直せる
+            logger.error(f"Failed to load shard index ({path}): {e}")
+            return {}
+
+    def _migrate_legacy(self):
+        # 単一ファイル形式からの初回移行
+        if os.path.isdir(self.dirpath) or not self.legacy_file or not os.path.exists(self.legacy_file):
+            return
+        data = JsonHandler(self.legacy_file).load()
+        os.makedirs(self.dirpath, exist_ok=True)
+        for gid, doc in data.items():
+            write_atomic(self._path(gid), json.dumps(doc, indent=self.indent, ensure_ascii=False).encode("utf-8"))
+        os.replace(self.legacy_file, self.legacy_file + ".migrated")
+        logger.info(f"Migrated {self.legacy_file} into {len(data)} shards")
+
+    def load(self, default: Dict[str, Any] = None, decode: Optional[Callable] = None) -> GuildShardMap:
+        try:
+            self._migrate_legacy()
+        except Exception as e:
+            logger.error(f"Failed to migrate legacy JSON ({self.legacy_file}): {e}")
+        return GuildShardMap(self, self.max_bytes, self.idle_seconds, decode)
+
+    def _plan(self, data: GuildShardMap, keys: Optional[Iterable]) -> List[Tuple[str, Optional[bytes]]]:
+        start = time.perf_counter()
+        ops = []
+        for gid in data._take(keys):
+            if gid in data._deleted:
+                ops.append((gid, None))
+                data._forget_summary(gid)
+                continue
+            doc = data._resident.get(gid)
+            if doc is None:
+                # 常駐していない = 変更なし
+                continue
+            payload = json.dumps(doc, indent=self.indent, ensure_ascii=False, default=to_json).encode("utf-8")
+            data._sizes[gid] = len(payload)
+            ops.append((gid, payload))
+            if data.summarize is not None:
+                data._summarize(gid, doc)
+        if data._index_dirty:
+            # 索引はシャードの後に書く (途中で落ちても、古い索引はシャードを読めば直る)
+            ops.append((None, json.dumps(data._summaries, ensure_ascii=False).encode("utf-8")))
+            data._index_dirty = False
+        self.stats["last_serialize_ms"] = (time.perf_counter() - start) * 1000
+        return ops
+
+    def _write(self, ops: List[Tuple[str, Optional[bytes]]]):
+        start = time.perf_counter()
+        written = 0
+        for gid, payload in ops:
+            path = self._path(gid)
+            if payload is None:
+                if os.path.exists(path):
+                    os.remove(path)
+            else:
+                write_atomic(path, payload, sync_dir=False)
+                written += len(payload)
+        if ops:
+            # rename / 削除はまとめて1回で反映する
+            fsync_dir(self.dirpath)
+        elapsed = (time.perf_counter() - start) * 1000
+        self.stats["writes"] += 1
+        self.stats["bytes"] = written
+        self.stats["last_write_ms"] = elapsed
+        self.stats["max_write_ms"] = max(self.stats["max_write_ms"], elapsed)
+        logger.debug(f"Saved shards ({self.dirpath}): {len(ops)} guilds, {written} bytes, write {elapsed:.1f}ms")
+
+    def _finish(self, data: GuildShardMap, ops, ok: bool):
+        for gid, payload in ops:
+            if gid is None:
+                if not ok:
+                    data._index_dirty = True
+            elif not ok:
+                data._dirty.add(gid)
+            elif payload is None:
+                data._deleted.discard(gid)
+        data._evict()
+
+    def save(self, data: GuildShardMap, keys: Optional[Iterable] = None) -> bool:
+        ops = self._plan(data, keys)
+        if not ops:
+            return True
+        try:
+            self._write(ops)
+            ok = True
+        except Exception as e:
+            self.stats["failures"] += 1
+            logger.error(f"Failed to save shards ({self.dirpath}): {e}")
+            ok = False
+        self._finish(data, ops, ok)
+        return ok
+
+    async def save_async(self, data: GuildShardMap, keys: Optional[Iterable] = None) -> bool:
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        ops = self._plan(data, keys)
+        if not ops:
+            return True
+        async with self._lock:
+            try:
+                await asyncio.get_running_loop().run_in_executor(None, self._write, ops)
+                ok = True
+            except Exception as e:
+                self.stats["failures"] += 1
+                logger.error(f"Failed to save shards ({self.dirpath}): {e}")
+                ok = False
+        self._finish(data, ops, ok)
+        return ok
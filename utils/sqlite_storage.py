@@ -0,0 +1,509 @@
+import os
+import sys
+import json
+import time
+import glob
+import asyncio
+import sqlite3
+import logging
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+from utils.storage import to_json
+
+logger = logging.getLogger("utils.sqlite_storage")
+
+RowKey = Tuple[str, tuple]
+Rows = Dict[RowKey, tuple]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    store TEXT NOT NULL, guild_id TEXT NOT NULL, body TEXT NOT NULL,
+    PRIMARY KEY (store, guild_id)
+);
+CREATE TABLE IF NOT EXISTS ticket_timers (
+    guild_id TEXT NOT NULL, channel_id TEXT NOT NULL,
+    assignee_id, creator_id, last_message_at, last_log_at,
+    enabled, reminded, close_confirming,
+    timeout_hours, auto_close_enabled, auto_close_days,
+    mirror_thread_id, active_tickets, task_lists,
+    present INTEGER NOT NULL, extra TEXT,
+    PRIMARY KEY (guild_id, channel_id)
+);
+CREATE TABLE IF NOT EXISTS ticket_tasks (
+    guild_id TEXT NOT NULL, channel_id TEXT NOT NULL, message_id TEXT NOT NULL, position INTEGER NOT NULL,
+    name, completed, extra TEXT,
+    PRIMARY KEY (guild_id, channel_id, message_id, position)
+);
+CREATE TABLE IF NOT EXISTS ticket_profiles (
+    guild_id TEXT NOT NULL, user_id TEXT NOT NULL, body TEXT NOT NULL,
+    PRIMARY KEY (guild_id, user_id)
+);
+CREATE TABLE IF NOT EXISTS log_routes (
+    guild_id TEXT NOT NULL, kind TEXT NOT NULL, source_id TEXT NOT NULL, dest_id,
+    PRIMARY KEY (guild_id, kind, source_id)
+);
+CREATE TABLE IF NOT EXISTS todo_tasks (
+    guild_id TEXT NOT NULL, message_id TEXT NOT NULL,
+    title, description, status, author_id, created_at, extra TEXT,
+    PRIMARY KEY (guild_id, message_id)
+);
+CREATE TABLE IF NOT EXISTS members_settings (
+    guild_id TEXT NOT NULL, archive_forum_id, member_role_id,
+    PRIMARY KEY (guild_id)
+);
+"""
+
+TABLE_KEYS = {
+    "documents": ("store", "guild_id"),
+    "ticket_timers": ("guild_id", "channel_id"),
+    "ticket_tasks": ("guild_id", "channel_id", "message_id", "position"),
+    "ticket_profiles": ("guild_id", "user_id"),
+    "log_routes": ("guild_id", "kind", "source_id"),
+    "todo_tasks": ("guild_id", "message_id"),
+    "members_settings": ("guild_id",),
+}
+
+def _dumps(value: Any) -> str:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"), default=to_json)
+
+def _loads_extra(raw: Optional[str]) -> Dict[str, Any]:
+    return json.loads(raw) if raw else {}
+
+# ====================================================
+# Connection
+# ====================================================
+class SqliteDatabase:
+    """
+    1ファイルにつき1接続を共有します。書き込みはロックで直列化されます。
+    """
+    _instances: Dict[str, "SqliteDatabase"] = {}
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.lock = threading.Lock()
+        with self.lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.executescript(SCHEMA)
+            self.columns = {t: [r["name"] for r in self.conn.execute(f"PRAGMA table_info({t})")] for t in TABLE_KEYS}
+
+    @classmethod
+    def get(cls, path: str) -> "SqliteDatabase":
+        path = os.path.abspath(path)
+        if path not in cls._instances:
+            cls._instances[path] = cls(path)
+        return cls._instances[path]
+
+    def select(self, table: str, where: str = "", params: tuple = ()) -> List[sqlite3.Row]:
+        with self.lock:
+            return self.conn.execute(f"SELECT * FROM {table} {where}", params).fetchall()
+
+    def apply(self, ops: List[Tuple[str, RowKey, Optional[tuple]]]) -> int:
+        """ops: ("upsert"|"delete", (table, pk), row) を1トランザクションで適用"""
+        with self.lock:
+            cur = self.conn.cursor()
+            cur.execute("BEGIN")
+            try:
+                for op, (table, pk), row in ops:
+                    keys = TABLE_KEYS[table]
+                    if op == "delete":
+                        cond = " AND ".join(f"{k} = ?" for k in keys)
+                        cur.execute(f"DELETE FROM {table} WHERE {cond}", pk)
+                    else:
+                        cols = self.columns[table]
+                        placeholders = ", ".join("?" for _ in cols)
+                        updates = ", ".join(f"{c} = excluded.{c}" for c in cols if c not in keys)
+                        cur.execute(f"INSERT INTO {table} ({', '.join(cols)}) VALUES ({placeholders}) ON CONFLICT ({', '.join(keys)}) DO UPDATE SET {updates}", row)
+                cur.execute("COMMIT")
+            except BaseException:
+                cur.execute("ROLLBACK")
+                raise
+        return len(ops)
+
+# ====================================================
+# Document <-> Row Mappers
+# ====================================================
+class DocumentMapper:
+    """
+    1ギルド分のドキュメントを行に分解/復元します。
+    ギルド単位の残り (レコード以外) は documents テーブルに JSON で保存されます。
+    """
+    def __init__(self, store: str):
+        self.store = store
+
+    def records(self, gdoc: Dict[str, Any]) -> Dict[str, Any]:
+        return {}
+
+    def remainder(self, gdoc: Dict[str, Any]) -> Dict[str, Any]:
+        return gdoc
+
+    def guild_rows(self, gid: str, gdoc: Dict[str, Any]) -> Rows:
+        return {("documents", (self.store, gid)): (self.store, gid, _dumps(self.remainder(gdoc)))}
+
+    def record_rows(self, gid: str, rid: str, value: Any) -> Rows:
+        return {}
+
+    def explode(self, gid: str, gdoc: Dict[str, Any]) -> Dict[Optional[str], Rows]:
+        out = {None: self.guild_rows(gid, gdoc)}
+        for rid, value in self.records(gdoc).items():
+            out[rid] = self.record_rows(gid, rid, value)
+        return out
+
+    def explode_record(self, gid: str, rid: Optional[str], gdoc: Optional[Dict[str, Any]]) -> Rows:
+        if gdoc is None:
+            return {}
+        if rid is None:
+            return self.guild_rows(gid, gdoc)
+        value = self.records(gdoc).get(rid)
+        return self.record_rows(gid, rid, value) if value is not None else {}
+
+    def load(self, db: SqliteDatabase) -> Dict[str, Any]:
+        data = {}
+        for r in db.select("documents", "WHERE store = ?", (self.store,)):
+            data[r["guild_id"]] = json.loads(r["body"])
+        return data
+
+class TimersMapper(DocumentMapper):
+    # ticket_timers のカラムに展開するキー (型は JSON 由来のまま保持)
+    FIELDS = ("assignee_id", "creator_id", "last_message_at", "last_log_at",
+              "enabled", "reminded", "close_confirming",
+              "timeout_hours", "auto_close_enabled", "auto_close_days",
+              "mirror_thread_id", "active_tickets", "tasks")
+    BOOL_FIELDS = {"enabled", "reminded", "close_confirming", "auto_close_enabled"}
+
+    def records(self, gdoc):
+        return gdoc
+
+    def remainder(self, gdoc):
+        return {}
+
+    def record_rows(self, gid, cid, t):
+        if hasattr(t, "to_dict"):
+            t = t.to_dict()
+        present = 0
+        for i, f in enumerate(self.FIELDS):
+            if f in t:
+                present |= 1 << i
+        extra = {k: v for k, v in t.items() if k not in self.FIELDS}
+        tasks = t.get("tasks")
+        task_lists = _dumps(list(tasks.keys())) if isinstance(tasks, dict) else None
+        at = t.get("active_tickets")
+        rows = {("ticket_timers", (gid, cid)): (
+            gid, cid, t.get("assignee_id"), t.get("creator_id"), t.get("last_message_at"), t.get("last_log_at"),
+            t.get("enabled"), t.get("reminded"), t.get("close_confirming"),
+            t.get("timeout_hours"), t.get("auto_close_enabled"), t.get("auto_close_days"),
+            t.get("mirror_thread_id"), _dumps(at) if at is not None else None, task_lists,
+            present, _dumps(extra) if extra else None,
+        )}
+        if isinstance(tasks, dict):
+            for mid, items in tasks.items():
+                for pos, item in enumerate(items or []):
+                    item_extra = {k: v for k, v in item.items() if k not in ("name", "completed")}
+                    rows[("ticket_tasks", (gid, cid, mid, pos))] = (
+                        gid, cid, mid, pos, item.get("name"), item.get("completed"),
+                        _dumps(item_extra) if item_extra else None,
+                    )
+        return rows
+
+    def load(self, db):
+        data = super().load(db)
+        tasks: Dict[Tuple[str, str], Dict[str, List[Dict[str, Any]]]] = {}
+        for r in db.select("ticket_tasks", "ORDER BY guild_id, channel_id, message_id, position"):
+            item = {"name": r["name"], "completed": bool(r["completed"])}
+            item.update(_loads_extra(r["extra"]))
+            tasks.setdefault((r["guild_id"], r["channel_id"]), {}).setdefault(r["message_id"], []).append(item)
+        for r in db.select("ticket_timers"):
+            gid, cid = r["guild_id"], r["channel_id"]
+            t: Dict[str, Any] = {}
+            present = r["present"]
+            for i, f in enumerate(self.FIELDS):
+                if not present & (1 << i):
+                    continue
+                if f == "tasks":
+                    order = json.loads(r["task_lists"]) if r["task_lists"] else []
+                    found = tasks.get((gid, cid), {})
+                    t["tasks"] = {mid: found.get(mid, []) for mid in order}
+                elif f == "active_tickets":
+                    t[f] = json.loads(r[f]) if r[f] is not None else None
+                elif f in self.BOOL_FIELDS and r[f] is not None:
+                    t[f] = bool(r[f])
+                else:
+                    t[f] = r[f]
+            t.update(_loads_extra(r["extra"]))
+            data.setdefault(gid, {})[cid] = t
+        return data
+
+class TicketProfilesMapper(DocumentMapper):
+    def records(self, gdoc):
+        profiles = gdoc.get("profiles")
+        return profiles if isinstance(profiles, dict) else {}
+
+    def remainder(self, gdoc):
+        rest = dict(gdoc)
+        if isinstance(rest.get("profiles"), dict):
+            rest["profiles"] = {}
+        return rest
+
+    def record_rows(self, gid, uid, p):
+        return {("ticket_profiles", (gid, uid)): (gid, uid, _dumps(p))}
+
+    def load(self, db):
+        data = super().load(db)
+        for r in db.select("ticket_profiles"):
+            g = data.setdefault(r["guild_id"], {})
+            g.setdefault("profiles", {})[r["user_id"]] = json.loads(r["body"])
+        return data
+
+class LogSettingsMapper(DocumentMapper):
+    def remainder(self, gdoc):
+        rest = dict(gdoc)
+        routes = rest.get("routes")
+        if isinstance(routes, dict):
+            rest["routes"] = {k: ({} if isinstance(v, dict) else v) for k, v in routes.items()}
+        return rest
+
+    def guild_rows(self, gid, gdoc):
+        rows = super().guild_rows(gid, gdoc)
+        routes = gdoc.get("routes")
+        if isinstance(routes, dict):
+            for kind, mapping in routes.items():
+                if isinstance(mapping, dict):
+                    for src, dest in mapping.items():
+                        rows[("log_routes", (gid, kind, src))] = (gid, kind, src, dest)
+        return rows
+
+    def load(self, db):
+        data = super().load(db)
+        for r in db.select("log_routes"):
+            g = data.setdefault(r["guild_id"], {})
+            g.setdefault("routes", {}).setdefault(r["kind"], {})[r["source_id"]] = r["dest_id"]
+        return data
+
+class TodoMapper(DocumentMapper):
+    TASK_FIELDS = ("title", "description", "status", "author_id", "created_at")
+
+    def records(self, gdoc):
+        tasks = gdoc.get("tasks")
+        return tasks if isinstance(tasks, dict) else {}
+
+    def remainder(self, gdoc):
+        rest = dict(gdoc)
+        if isinstance(rest.get("tasks"), dict):
+            rest["tasks"] = {}
+        return rest
+
+    def record_rows(self, gid, mid, task):
+        extra = {k: v for k, v in task.items() if k not in self.TASK_FIELDS}
+        missing = [k for k in self.TASK_FIELDS if k not in task]
+        if missing:
+            extra["__missing__"] = missing
+        return {("todo_tasks", (gid, mid)): (gid, mid, *[task.get(k) for k in self.TASK_FIELDS], _dumps(extra) if extra else None)}
+
+    def load(self, db):
+        data = super().load(db)
+        for r in db.select("todo_tasks"):
+            extra = _loads_extra(r["extra"])
+            missing = set(extra.pop("__missing__", []))
+            task = {k: r[k] for k in self.TASK_FIELDS if k not in missing}
+            task.update(extra)
+            data.setdefault(r["guild_id"], {}).setdefault("tasks", {})[r["message_id"]] = task
+        return data
+
+class MembersMapper(DocumentMapper):
+    FIELDS = ("archive_forum_id", "member_role_id")
+
+    def remainder(self, gdoc):
+        return {k: v for k, v in gdoc.items() if k not in self.FIELDS}
+
+    def guild_rows(self, gid, gdoc):
+        rows = super().guild_rows(gid, gdoc)
+        if all(k in gdoc for k in self.FIELDS):
+            rows[("members_settings", (gid,))] = (gid, gdoc["archive_forum_id"], gdoc["member_role_id"])
+        else:
+            # 想定外の形は documents 側にそのまま残す
+            rows[("documents", (self.store, gid))] = (self.store, gid, _dumps(gdoc))
+        return rows
+
+    def load(self, db):
+        data = super().load(db)
+        for r in db.select("members_settings"):
+            g = data.setdefault(r["guild_id"], {})
+            g["archive_forum_id"] = r["archive_forum_id"]
+            g["member_role_id"] = r["member_role_id"]
+        return data
+
+MAPPERS = {
+    "tickets_timer": TimersMapper,
+    "tickets_profiles": TicketProfilesMapper,
+    "log_settings": LogSettingsMapper,
+    "todo_settings": TodoMapper,
+    "members_settings": MembersMapper,
+}
+
+# ====================================================
+# Handler
+# ====================================================
+class SqliteHandler:
+    """
+    JsonHandler と同じインターフェースで SQLite に保存します。
+    save() は前回保存時との差分行だけを書き込みます。keys を渡すと差分計算もその範囲に限定されます。
+    keys の要素は guild_id か (guild_id, record_id) です。
+    """
+    def __init__(self, store: str, db_path: str):
+        self.store = store
+        self.db = SqliteDatabase.get(db_path)
+        self.mapper = MAPPERS.get(store, DocumentMapper)(store)
+        self._rows: Dict[str, Dict[Optional[str], Rows]] = {}
+        self._lock: Optional[asyncio.Lock] = None
+        self.stats: Dict[str, Any] = {
+            "writes": 0, "failures": 0, "rows": 0,
+            "last_serialize_ms": 0.0, "last_write_ms": 0.0, "max_write_ms": 0.0,
+        }
+
+    def load(self, default: Dict[str, Any] = None, decode: Optional[Callable] = None) -> Dict[str, Any]:
+        if default is None:
+            default = {}
+        try:
+            data = self.mapper.load(self.db)
+        except Exception as e:
+            logger.error(f"Failed to load SQLite ({self.store}): {e}")
+            return default
+        self._rows = {gid: self.mapper.explode(gid, gdoc) for gid, gdoc in data.items()}
+        if decode is not None:
+            data = {gid: decode(gid, gdoc) for gid, gdoc in data.items()}
+        return data if data else default
+
+    def is_empty(self) -> bool:
+        return not self.mapper.load(self.db)
+
+    def _plan(self, data: Dict[str, Any], keys: Optional[Iterable] = None):
+        start = time.perf_counter()
+        scope: Dict[str, Optional[set]] = {}
+        if keys is None:
+            for gid in set(data) | set(self._rows):
+                scope[gid] = None
+        else:
+            for k in keys:
+                if not isinstance(k, tuple):
+                    k = (k,)
+                gid = k[0]
+                if len(k) == 1:
+                    scope[gid] = None
+                elif scope.setdefault(gid, set()) is not None:
+                    scope[gid].add(k[1])
+
+        ops = []
+        undo: Dict[Tuple[str, Optional[str]], Optional[Rows]] = {}
+        for gid, rids in scope.items():
+            gdoc = data.get(gid)
+            old_g = self._rows.setdefault(gid, {})
+            if rids is None:
+                new_g = self.mapper.explode(gid, gdoc) if gdoc is not None else {}
+                targets = set(old_g) | set(new_g)
+            else:
+                new_g = {rid: self.mapper.explode_record(gid, rid, gdoc) for rid in rids | {None}}
+                targets = set(new_g)
+            for rid in targets:
+                old_r = old_g.get(rid, {})
+                new_r = new_g.get(rid, {})
+                changed = False
+                for key, row in new_r.items():
+                    if old_r.get(key) != row:
+                        ops.append(("upsert", key, row))
+                        changed = True
+                for key in old_r.keys() - new_r.keys():
+                    ops.append(("delete", key, None))
+                    changed = True
+                if changed:
+                    undo[(gid, rid)] = old_g.get(rid)
+                    if new_r:
+                        old_g[rid] = new_r
+                    else:
+                        old_g.pop(rid, None)
+            if not old_g:
+                self._rows.pop(gid, None)
+        self.stats["last_serialize_ms"] = (time.perf_counter() - start) * 1000
+        return ops, undo
+
+    def _rollback(self, undo):
+        for (gid, rid), rows in undo.items():
+            g = self._rows.setdefault(gid, {})
+            if rows is None:
+                g.pop(rid, None)
+            else:
+                g[rid] = rows
+
+    def _write(self, ops):
+        start = time.perf_counter()
+        n = self.db.apply(ops)
+        elapsed = (time.perf_counter() - start) * 1000
+        self.stats["writes"] += 1
+        self.stats["rows"] = n
+        self.stats["last_write_ms"] = elapsed
+        self.stats["max_write_ms"] = max(self.stats["max_write_ms"], elapsed)
+        logger.debug(f"Saved SQLite ({self.store}): {n} rows, diff {self.stats['last_serialize_ms']:.1f}ms, write {elapsed:.1f}ms")
+
+    def save(self, data: Dict[str, Any], keys: Optional[Iterable] = None) -> bool:
+        ops, undo = self._plan(data, keys)
+        if not ops:
+            return True
+        try:
+            self._write(ops)
+            return True
+        except Exception as e:
+            self._rollback(undo)
+            self.stats["failures"] += 1
+            logger.error(f"Failed to save SQLite ({self.store}): {e}")
+            return False
+
+    async def save_async(self, data: Dict[str, Any], keys: Optional[Iterable] = None) -> bool:
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        # 差分 (=スナップショット) はループ上で確定させる
+        ops, undo = self._plan(data, keys)
+        if not ops:
+            return True
+        async with self._lock:
+            loop = asyncio.get_running_loop()
+            try:
+                await loop.run_in_executor(None, self._write, ops)
+                return True
+            except Exception as e:
+                self._rollback(undo)
+                self.stats["failures"] += 1
+                logger.error(f"Failed to save SQLite ({self.store}): {e}")
+                return False
+
+# ====================================================
+# One-shot Importer
+# ====================================================
+def import_json_files(data_dir: str, db_path: str, force: bool = False) -> Dict[str, int]:
+    """
+    data_dir 内の *.json を SQLite に取り込みます。既にデータがあるストアは force なしではスキップします。
+    """
+    from utils.storage import JsonHandler
+    result = {}
+    for path in sorted(glob.glob(os.path.join(data_dir, "*.json"))):
+        store = os.path.splitext(os.path.basename(path))[0]
+        handler = SqliteHandler(store, db_path)
+        if not force and not handler.is_empty():
+            logger.info(f"Skip import ({store}): already populated")
+            continue
+        data = JsonHandler(path).load()
+        handler.load()
+        handler.save(data)
+        result[store] = len(data)
+        logger.info(f"Imported {path} -> {store} ({len(data)} guilds)")
+    return result
+
+if __name__ == "__main__":
+    # 使い方: python -m utils.sqlite_storage [data_dir] [--force]
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(name)s: %(message)s")
+    from utils.config import SQLITE_PATH
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    data_dir = args[0] if args else "data"
+    imported = import_json_files(data_dir, SQLITE_PATH, force="--force" in sys.argv)
+    print(json.dumps(imported, ensure_ascii=False))
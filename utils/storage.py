@@ -1,30 +1,165 @@
 import json
 import os
+import time
+import asyncio
+import tempfile
 import logging
-from typing import Any, Dict
+from typing import Any, Callable, Dict, Iterable, Optional
 
 logger = logging.getLogger("utils.storage")
 
 class JsonHandler:
-    def __init__(self, filepath: str):
+    def __init__(self, filepath: str, indent: Optional[int] = 4):
         self.filepath = filepath
+        self.indent = indent
+        # 書き込みの直列化 (同一ファイルへの並行 save_async を防ぐ)
+        self._lock: Optional[asyncio.Lock] = None
+        self.stats: Dict[str, Any] = {
+            "writes": 0, "failures": 0, "bytes": 0,
+            "last_serialize_ms": 0.0, "last_write_ms": 0.0, "max_write_ms": 0.0,
+        }
 
-    def load(self, default: Dict[str, Any] = None) -> Dict[str, Any]:
+    def load(self, default: Dict[str, Any] = None, decode: Optional[Callable] = None) -> Dict[str, Any]:
+        """decode(guild_id, doc) を渡すと、ギルド単位のドキュメントごとに適用します。"""
         if default is None:
             default = {}
         if not os.path.exists(self.filepath):
             return default
         try:
             with open(self.filepath, "r", encoding="utf-8") as f:
-                return json.load(f)
+                data = json.load(f)
+            if decode is not None:
+                data = {gid: decode(gid, gdoc) for gid, gdoc in data.items()}
+            return data
         except Exception as e:
             logger.error(f"Failed to load JSON ({self.filepath}): {e}")
             return default
 
-    def save(self, data: Dict[str, Any]):
+    def save(self, data: Dict[str, Any], keys: Optional[Iterable] = None) -> bool:
+        # keys は行単位バックエンド用のヒント。JSONでは常に全体を書き込みます
         try:
-            os.makedirs(os.path.dirname(self.filepath), exist_ok=True)
-            with open(self.filepath, "w", encoding="utf-8") as f:
-                json.dump(data, f, indent=4, ensure_ascii=False)
+            payload = self._serialize(data)
+            self._write_atomic(payload)
+            return True
         except Exception as e:
+            self.stats["failures"] += 1
             logger.error(f"Failed to save JSON ({self.filepath}): {e}")
+            return False
+
+    async def save_async(self, data: Dict[str, Any], keys: Optional[Iterable] = None) -> bool:
+        """
+        イベントループ上でスナップショットを取り、ファイル書き込みはスレッドで行います。
+        成功した場合は True を返します。
+        直列化をスレッドに移すには、先にループ上で data を丸ごと複製する必要があり (各 Cog は
+        ロックを取らずに data を書き換えるため)、その複製が json.dumps とほぼ同じ時間かかるので、
+        直列化そのものをループ上で行ってできたバイト列を不変のスナップショットとして渡しています。
+        """
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        try:
+            # その時点の内容を確定させる (書式は save() と同じにする)
+            payload = self._serialize(data)
+        except Exception as e:
+            self.stats["failures"] += 1
+            logger.error(f"Failed to serialize JSON ({self.filepath}): {e}")
+            return False
+        async with self._lock:
+            loop = asyncio.get_running_loop()
+            try:
+                await loop.run_in_executor(None, self._write_atomic, payload)
+                return True
+            except Exception as e:
+                self.stats["failures"] += 1
+                logger.error(f"Failed to save JSON ({self.filepath}): {e}")
+                return False
+
+    def _serialize(self, data: Dict[str, Any]) -> bytes:
+        start = time.perf_counter()
+        payload = json.dumps(data, indent=self.indent, ensure_ascii=False, default=to_json).encode("utf-8")
+        self.stats["last_serialize_ms"] = (time.perf_counter() - start) * 1000
+        return payload
+
+    def _write_atomic(self, payload: bytes):
+        start = time.perf_counter()
+        write_atomic(self.filepath, payload)
+        elapsed = (time.perf_counter() - start) * 1000
+        self.stats["writes"] += 1
+        self.stats["bytes"] = len(payload)
+        self.stats["last_write_ms"] = elapsed
+        self.stats["max_write_ms"] = max(self.stats["max_write_ms"], elapsed)
+        logger.debug(f"Saved JSON ({self.filepath}): {len(payload)} bytes, serialize {self.stats['last_serialize_ms']:.1f}ms, write {elapsed:.1f}ms")
+
+def write_atomic(filepath: str, payload: bytes, sync_dir: bool = True):
+    """
+    一時ファイルに書き出して fsync した後、rename で置き換えます。
+    rename 自体を電源断に耐えさせるためディレクトリも fsync します。複数ファイルをまとめて書く場合は
+    sync_dir=False にして、最後に fsync_dir() を1回呼んでください。
+    """
+    dirpath = os.path.dirname(filepath) or "."
+    os.makedirs(dirpath, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", suffix=".json", dir=dirpath)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, filepath)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+    if sync_dir:
+        fsync_dir(dirpath)
+
+def fsync_dir(dirpath: str):
+    """ディレクトリのエントリ (rename / 削除) をディスクに反映します。Windows など開けない環境では何もしません。"""
+    try:
+        fd = os.open(dirpath, os.O_RDONLY | getattr(os, "O_DIRECTORY", 0))
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+def to_json(obj):
+    """json.dumps の default 用。to_dict() を持つレコードクラスを辞書に変換します。"""
+    if hasattr(obj, "to_dict"):
+        return obj.to_dict()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+def mark_dirty(data, guild_id):
+    """遅延書き込みするデータで、ギルドを退避対象から外します (通常の dict では何もしません)。"""
+    if hasattr(data, "mark_dirty"):
+        data.mark_dirty(str(guild_id))
+
+def set_summarizer(data, summarize) -> bool:
+    """遅延ロードするデータに、ギルドの要約関数 summarize(guild_id, doc) を設定します (通常の dict では False)。"""
+    if not hasattr(data, "summarize"):
+        return False
+    data.summarize = summarize
+    return True
+
+def guild_summary(data, guild_id):
+    """ギルドを読み込まずに要約を返します。保存されていない場合や通常の dict では None。"""
+    if hasattr(data, "summary"):
+        return data.summary(str(guild_id))
+    return None
+
+def open_store(filepath: str):
+    """
+    STORAGE_BACKEND に応じたハンドラを返します。ストア名はファイル名 (拡張子なし) です。
+    """
+    from utils.config import STORAGE_BACKEND, SQLITE_PATH
+    store = os.path.splitext(os.path.basename(filepath))[0]
+    if STORAGE_BACKEND == "sqlite":
+        from utils.sqlite_storage import SqliteHandler
+        return SqliteHandler(store, SQLITE_PATH)
+    if STORAGE_BACKEND == "sharded":
+        from utils.shards import ShardedJsonHandler
+        return ShardedJsonHandler(os.path.join(os.path.dirname(filepath), store), legacy_file=filepath)
+    return JsonHandler(filepath)
@@ -0,0 +1,54 @@
+import re
+import functools
+from typing import Callable, Dict, Optional, Sequence, Tuple
+
+# {creator} / {user} / {creator_name} / {assignee} / {title}、{channel:...} / {thread:...}、および "\n" (2文字)
+_TOKEN_RE = re.compile(r"\{(creator|user|creator_name|assignee|title)\}|\{(?:channel|thread):(.*?)\}|\\n")
+
+VAR = "var"
+REF = "ref"
+
+@functools.lru_cache(maxsize=256)
+def compile_template(text: str) -> Tuple:
+    """
+    テンプレートをトークン列に変換します (同じ文字列は再コンパイルしません)。
+    トークンは 文字列 / (VAR, 名前) / (REF, 小文字化した名前のタプル, 元の文字列)。
+    """
+    tokens = []
+    pos = 0
+    for m in _TOKEN_RE.finditer(text):
+        if m.start() > pos:
+            tokens.append(text[pos:m.start()])
+        if m.group(1):
+            tokens.append((VAR, m.group(1)))
+        elif m.group(2) is not None:
+            parts = tuple(pt.strip().lower() for pt in m.group(2).split(":"))
+            tokens.append((REF, parts, m.group(0)))
+        else:
+            tokens.append("\n")
+        pos = m.end()
+    if pos < len(text):
+        tokens.append(text[pos:])
+    # 連続する文字列はまとめておく
+    merged = []
+    for t in tokens:
+        if isinstance(t, str) and merged and isinstance(merged[-1], str):
+            merged[-1] += t
+        else:
+            merged.append(t)
+    return tuple(merged)
+
+def render(tokens: Sequence, values: Dict[str, str],
+           resolve: Optional[Callable[[Tuple[str, ...]], Optional[str]]] = None) -> str:
+    """values に無い変数と、resolve で解決できなかった参照は元の文字列のまま残します。"""
+    out = []
+    for t in tokens:
+        if isinstance(t, str):
+            out.append(t)
+        elif t[0] == VAR:
+            v = values.get(t[1])
+            out.append(v if v is not None else "{" + t[1] + "}")
+        else:
+            v = resolve(t[1]) if resolve is not None else None
+            out.append(v if v is not None else t[2])
+    return "".join(out)
@@ -0,0 +1,56 @@
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger("utils.thread_cache")
+
+class ThreadCache:
+    """
+    スレッドID -> discord.Thread の取得キャッシュ。
+    Gateway のキャッシュ (guild.get_thread) を優先し、無ければ REST で取得した結果を LRU で保持します。
+    アーカイブ済みのスレッドは Gateway に載らないので、主にこちらで効きます。
+    """
+    def __init__(self, max_size: Optional[int] = None):
+        if max_size is None:
+            from utils.config import THREAD_CACHE_SIZE
+            max_size = THREAD_CACHE_SIZE
+        self.max_size = max_size
+        self._threads: "OrderedDict[int, Any]" = OrderedDict()
+        self.stats: Dict[str, int] = {"gateway_hits": 0, "hits": 0, "misses": 0, "evictions": 0}
+
+    def __len__(self) -> int:
+        return len(self._threads)
+
+    async def get(self, guild, thread_id: int):
+        """スレッドを返します。REST での取得に失敗した場合は例外をそのまま送出します。"""
+        thread_id = int(thread_id)
+        thread = guild.get_thread(thread_id)
+        if thread is not None:
+            self.stats["gateway_hits"] += 1
+            return thread
+        thread = self._threads.get(thread_id)
+        if thread is not None:
+            self._threads.move_to_end(thread_id)
+            self.stats["hits"] += 1
+            return thread
+        self.stats["misses"] += 1
+        thread = await guild.fetch_channel(thread_id)
+        self.put(thread)
+        return thread
+
+    def put(self, thread):
+        self._threads[thread.id] = thread
+        self._threads.move_to_end(thread.id)
+        while len(self._threads) > self.max_size:
+            self._threads.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def invalidate(self, thread_id: int):
+        self._threads.pop(int(thread_id), None)
+
+    def report(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = dict(self.stats)
+        total = out["gateway_hits"] + out["hits"] + out["misses"]
+        out["size"] = len(self._threads)
+        out["hit_rate"] = (out["gateway_hits"] + out["hits"]) / total if total else 0.0
+        return out
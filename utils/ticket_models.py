@@ -0,0 +1,543 @@
+import sys
+import time
+import datetime
+from typing import Any, Dict, List, Optional
+
+def parse_ts(value: Any) -> Optional[float]:
+    """ISO 形式の日時文字列 (datetime.now().isoformat()) を epoch 秒に変換します。"""
+    if value is None:
+        return None
+    return datetime.datetime.fromisoformat(value).timestamp()
+
+def format_ts(ts: Optional[float]) -> Optional[str]:
+    if ts is None:
+        return None
+    return datetime.datetime.fromtimestamp(ts).isoformat()
+
+def _int_or_none(value: Any) -> Optional[int]:
+    return int(value) if value is not None else None
+
+class TaskItem:
+    """タスクリストの1項目。ディスク上の形式は {"name": str, "completed": bool}。"""
+    __slots__ = ("name", "completed", "extra")
+
+    def __init__(self, name: str, completed: bool = False, extra: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.completed = completed
+        self.extra = extra
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "TaskItem":
+        extra = {k: v for k, v in d.items() if k not in ("name", "completed")} if len(d) > 2 else None
+        name = d.get("name")
+        # 同じタスク名 (既定リスト) が大量に並ぶので共有する
+        if isinstance(name, str):
+            name = sys.intern(name)
+        return cls(name, bool(d.get("completed", False)), extra or None)
+
+    def to_dict(self) -> Dict[str, Any]:
+        d = {"name": self.name, "completed": self.completed}
+        if self.extra:
+            d.update(self.extra)
+        return d
+
+    def __repr__(self):
+        return f"TaskItem({self.name!r}, completed={self.completed})"
+
+class TicketCard:
+    """
+    チケットメッセージの Embed 1件分の内容。メッセージを読み直さずに編集後の Embed を組み立てるために持ちます。
+    ディスク上の形式は {"title", "description", "color", "timestamp", "fields": [[name, value, inline], ...]}。
+    color は int、timestamp は epoch 秒です。
+    """
+    __slots__ = ("title", "description", "color", "timestamp", "fields")
+
+    def __init__(self, title: Optional[str] = None, description: Optional[str] = None, color: Optional[int] = None,
+                 timestamp: Optional[float] = None, fields: Optional[List[List[Any]]] = None):
+        self.title = title
+        self.description = description
+        self.color = color
+        self.timestamp = timestamp
+        self.fields = fields if fields is not None else []
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "TicketCard":
+        return cls(d.get("title"), d.get("description"), d.get("color"), d.get("timestamp"),
+                   [[f[0], f[1], bool(f[2])] for f in d.get("fields") or []])
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"title": self.title, "description": self.description, "color": self.color,
+                "timestamp": self.timestamp, "fields": [list(f) for f in self.fields]}
+
+    def copy(self) -> "TicketCard":
+        return TicketCard.from_dict(self.to_dict())
+
+    def add_field(self, name: str, value: str, inline: bool = True):
+        self.fields.append([name, value, inline])
+
+    def find_field(self, keyword: str) -> Optional[int]:
+        """名前に keyword を含む最初のフィールドの位置。"""
+        return next((i for i, f in enumerate(self.fields) if keyword in f[0]), None)
+
+    def set_field(self, keyword: str, name: str, value: str, inline: bool = True, position: Optional[int] = None):
+        """名前に keyword を含むフィールドを置き換えます。無ければ position (省略時は末尾) に挿入します。"""
+        i = self.find_field(keyword)
+        if i is not None:
+            self.fields[i] = [name, value, inline]
+        elif position is None:
+            self.add_field(name, value, inline)
+        else:
+            self.fields.insert(position, [name, value, inline])
+
+    def remove_fields(self, keyword: str):
+        self.fields = [f for f in self.fields if keyword not in f[0]]
+
+    def __eq__(self, other):
+        if not isinstance(other, TicketCard):
+            return NotImplemented
+        return self.to_dict() == other.to_dict()
+
+    def __repr__(self):
+        return f"TicketCard({self.title!r}, fields={len(self.fields)})"
+
+class TicketTimer:
+    """
+    チケット (チャンネル) 1件分のタイマー情報。
+    ID は int、日時は epoch 秒 (float) で保持し、to_dict() で従来の JSON 形式に戻します。
+    読み込み時に無かったキーは、値が初期値のままなら書き出しません。
+    """
+    # (属性名, キーが無い時の値)。順序はディスク上のキー順
+    FIELDS = (
+        ("last_message_at", None), ("enabled", True), ("timeout_hours", None),
+        ("assignee_id", None), ("creator_id", None), ("active_tickets", None),
+        ("auto_close_enabled", True), ("auto_close_days", None),
+        ("mirror_thread_id", None), ("last_log_at", None), ("tasks", None),
+        ("reminded", False), ("close_confirming", False), ("embeds", None),
+    )
+    BITS = {f: 1 << i for i, (f, _) in enumerate(FIELDS)}
+    # 新規作成時に書き出すキー (reminded / close_confirming / embeds は必要になるまで省略)
+    NEW_PRESENT = sum(b for f, b in BITS.items() if f not in ("reminded", "close_confirming", "embeds"))
+    # __weakref__ はシャードの退避後も外から参照されているかを追うため (utils/shards.py)
+    __slots__ = tuple(f for f, _ in FIELDS) + ("present", "extra", "__weakref__")
+
+    def __init__(self, assignee_id: Optional[int] = None, creator_id: Optional[int] = None, *,
+                 last_message_at: Optional[float] = None, enabled: bool = True,
+                 timeout_hours: Optional[int] = None, active_tickets: Optional[List[int]] = None,
+                 auto_close_enabled: bool = True, auto_close_days: Optional[int] = None,
+                 mirror_thread_id: Optional[int] = None, last_log_at: Optional[float] = None,
+                 tasks: Optional[Dict[int, List[TaskItem]]] = None,
+                 reminded: bool = False, close_confirming: bool = False,
+                 embeds: Optional[Dict[int, TicketCard]] = None):
+        self.assignee_id = assignee_id
+        self.creator_id = creator_id
+        self.last_message_at = time.time() if last_message_at is None else last_message_at
+        self.enabled = enabled
+        self.timeout_hours = timeout_hours
+        self.active_tickets = active_tickets if active_tickets is not None else []
+        self.auto_close_enabled = auto_close_enabled
+        self.auto_close_days = auto_close_days
+        self.mirror_thread_id = mirror_thread_id
+        self.last_log_at = last_log_at
+        self.tasks = tasks if tasks is not None else {}
+        self.reminded = reminded
+        self.close_confirming = close_confirming
+        # msg_id -> チケットメッセージの Embed の内容
+        self.embeds = embeds if embeds is not None else {}
+        self.present = self.NEW_PRESENT
+        self.extra: Optional[Dict[str, Any]] = None
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "TicketTimer":
+        t = cls.__new__(cls)
+        extra = None
+        present = 0
+        bits = cls.BITS
+        for k in d:
+            b = bits.get(k)
+            if b is None:
+                extra = extra or {}
+                extra[k] = d[k]
+            else:
+                present |= b
+        get = d.get
+        t.last_message_at = t.last_log_at = None
+        for k in ("last_message_at", "last_log_at"):
+            v = get(k)
+            try:
+                setattr(t, k, parse_ts(v))
+            except (TypeError, ValueError):
+                # 解釈できない値は元の文字列のまま書き戻す
+                extra = extra or {}
+                extra[k] = v
+        t.enabled = get("enabled", True)
+        t.timeout_hours = get("timeout_hours")
+        t.assignee_id = _int_or_none(get("assignee_id"))
+        t.creator_id = _int_or_none(get("creator_id"))
+        t.mirror_thread_id = _int_or_none(get("mirror_thread_id"))
+        at = get("active_tickets", [])
+        t.active_tickets = [int(m) for m in at] if at is not None else None
+        tasks = get("tasks", {})
+        if tasks is not None:
+            from_item = TaskItem.from_dict
+            tasks = {int(mid): [from_item(i) for i in (items or [])] for mid, items in tasks.items()}
+        t.tasks = tasks
+        embeds = get("embeds", {})
+        if embeds is not None:
+            embeds = {int(mid): TicketCard.from_dict(c) for mid, c in embeds.items()}
+        t.embeds = embeds
+        t.auto_close_enabled = get("auto_close_enabled", True)
+        t.auto_close_days = get("auto_close_days")
+        t.reminded = get("reminded", False)
+        t.close_confirming = get("close_confirming", False)
+        t.present = present
+        t.extra = extra
+        return t
+
+    def to_dict(self) -> Dict[str, Any]:
+        d: Dict[str, Any] = {}
+        present = self.present
+        bits = self.BITS
+        for f, default in self.FIELDS:
+            v = getattr(self, f)
+            if not present & bits[f]:
+                if f == "active_tickets" or f == "tasks" or f == "embeds":
+                    if not v:
+                        continue
+                elif v == default:
+                    continue
+            if f == "last_message_at" or f == "last_log_at":
+                v = format_ts(v)
+            elif f == "active_tickets":
+                v = list(v) if v is not None else None
+            elif f == "tasks":
+                v = {str(mid): [i.to_dict() for i in items] for mid, items in v.items()} if v is not None else None
+            elif f == "embeds":
+                v = {str(mid): c.to_dict() for mid, c in v.items()} if v is not None else None
+            d[f] = v
+        if self.extra:
+            d.update(self.extra)
+        return d
+
+    # --- よく使う操作 ---
+    def touch(self, now: Optional[float] = None):
+        """最終メッセージ時刻を更新します。"""
+        self.last_message_at = time.time() if now is None else now
+
+    def task_list(self, msg_id) -> List[TaskItem]:
+        if not self.tasks:
+            return []
+        return self.tasks.get(int(msg_id), [])
+
+    def card(self, msg_id) -> Optional[TicketCard]:
+        if not self.embeds:
+            return None
+        return self.embeds.get(int(msg_id))
+
+    def active_count(self) -> int:
+        return len(self.active_tickets) if self.active_tickets else 0
+
+    def __repr__(self):
+        return f"TicketTimer(assignee_id={self.assignee_id}, creator_id={self.creator_id}, active={self.active_tickets})"
+
+def decode_timers(gdoc: Dict[str, Any]) -> Dict[str, Any]:
+    """1ギルド分の timers ({channel_id: dict}) をその場で TicketTimer に変換します。"""
+    for cid, value in gdoc.items():
+        if isinstance(value, dict):
+            gdoc[cid] = TicketTimer.from_dict(value)
+    return gdoc
+
+class ActiveTicketIndex:
+    """
+    1ギルド分の稼働チケット数の集計。
+    担当者別 / (担当者, 依頼者) 別の件数と、(担当者, 依頼者) ごとのチャンネル一覧を持ち、
+    チャンネル単位の update() で差分更新します。
+    """
+    __slots__ = ("by_assignee", "by_pair", "channels", "contrib")
+
+    def __init__(self):
+        self.by_assignee: Dict[Optional[int], int] = {}
+        self.by_pair: Dict[tuple, int] = {}
+        # (assignee_id, creator_id) -> {channel_id: None} (挿入順を保つ集合として使う)
+        self.channels: Dict[tuple, Dict[str, None]] = {}
+        # channel_id -> (assignee_id, creator_id, 稼働数)
+        self.contrib: Dict[str, tuple] = {}
+
+    @classmethod
+    def build(cls, guild_timers: Dict[str, "TicketTimer"]) -> "ActiveTicketIndex":
+        idx = cls()
+        for cid, t in guild_timers.items():
+            idx.update(cid, t)
+        return idx
+
+    @staticmethod
+    def _bump(counter: Dict, key, n: int):
+        v = counter.get(key, 0) + n
+        if v:
+            counter[key] = v
+        else:
+            counter.pop(key, None)
+
+    def update(self, cid: str, t: Optional["TicketTimer"]):
+        """チャンネル cid の最新状態 (削除時は None) を反映します。"""
+        old = self.contrib.get(cid)
+        new = (t.assignee_id, t.creator_id, t.active_count()) if t is not None else None
+        if old == new:
+            return
+        if old is not None:
+            a, c, n = old
+            self._bump(self.by_assignee, a, -n)
+            self._bump(self.by_pair, (a, c), -n)
+            if new is None or new[:2] != old[:2]:
+                chans = self.channels.get((a, c))
+                if chans is not None:
+                    chans.pop(cid, None)
+                    if not chans:
+                        del self.channels[(a, c)]
+        if new is None:
+            self.contrib.pop(cid, None)
+            return
+        a, c, n = new
+        self._bump(self.by_assignee, a, n)
+        self._bump(self.by_pair, (a, c), n)
+        self.channels.setdefault((a, c), {})[cid] = None
+        self.contrib[cid] = new
+
+    def active_for(self, assignee_id: int, creator_id: Optional[int] = None) -> int:
+        if creator_id is None:
+            return self.by_assignee.get(assignee_id, 0)
+        return self.by_pair.get((assignee_id, creator_id), 0)
+
+    def channels_for(self, assignee_id: int, creator_id: int) -> List[str]:
+        return list(self.channels.get((assignee_id, creator_id), ()))
+
+    def __eq__(self, other):
+        if not isinstance(other, ActiveTicketIndex):
+            return NotImplemented
+        return (self.by_assignee == other.by_assignee and self.by_pair == other.by_pair
+                and self.contrib == other.contrib
+                and {k: set(v) for k, v in self.channels.items()} == {k: set(v) for k, v in other.channels.items()})
+
+class EffectiveProfile:
+    """
+    (ギルド, 担当者) ごとの実効設定。個人設定 → ギルド設定 → 既定値 の順に解決済みの値を持ちます。
+    設定を変更したら作り直すこと (TicketDataManager.save_profiles で破棄されます)。
+    """
+    # 個人設定が None ならギルド設定を使う項目
+    SCALARS = ("reuse_channel", "notify_enabled", "timeout_hours", "auto_close_enabled", "auto_close_days", "cooldown",
+               "mirror_messages", "archive_transcripts")
+    # 個人設定が空 (None / 0 / "") ならギルド設定を使う項目
+    FALLBACKS = ("category_id", "name_format", "template", "transcript_id", "max_slots")
+    __slots__ = SCALARS + FALLBACKS + ("mention_roles", "log_roles", "ignore_roles", "log_role_ids", "log_mentions")
+
+    def __init__(self, profile: Dict[str, Any], guild_conf: Dict[str, Any], defaults: Dict[str, Any]):
+        for k in self.SCALARS:
+            v = profile.get(k)
+            setattr(self, k, v if v is not None else guild_conf.get(k, defaults.get(k)))
+        for k in self.FALLBACKS:
+            setattr(self, k, profile.get(k) or guild_conf.get(k, defaults.get(k)))
+        # メンション系は個人設定が空ならギルド設定を使い、除外ロールは両方を合わせる
+        self.mention_roles = tuple(profile.get("mention_roles") or guild_conf.get("mention_roles") or ())
+        self.log_roles = tuple(profile.get("log_roles") or guild_conf.get("log_roles") or ())
+        self.ignore_roles = frozenset((guild_conf.get("ignore_roles") or [])) | frozenset(profile.get("ignore_roles") or [])
+        self.log_role_ids = frozenset(self.mention_roles) | frozenset(self.log_roles)
+        self.log_mentions = " ".join(f"<@&{rid}>" for rid in self.log_role_ids)
+
+    def __repr__(self):
+        return f"EffectiveProfile(mention_roles={self.mention_roles}, ignore_roles={set(self.ignore_roles)})"
+
+class ActivityTable:
+    """
+    チケットごとの最終発言時刻 (epoch 秒) の表。
+    発言のたびに変わる last_message_at はここで受け、保存 (ジャーナルへの追記) は同じチケットにつき interval 秒に1回までにまとめます。
+    latest は起動後に記録した値 ({guild_id: {channel_id: ts}}) で、シャードの再読み込み時に上書きするのにも使います。
+    """
+    __slots__ = ("interval", "latest", "pending", "written", "stats")
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.latest: Dict[str, Dict[str, float]] = {}
+        # (guild_id, channel_id) -> 未保存の時刻 / 最後に保存した時刻
+        self.pending: Dict[tuple, float] = {}
+        self.written: Dict[tuple, float] = {}
+        self.stats: Dict[str, int] = {"bumps": 0, "writes": 0}
+
+    def bump(self, gid: str, cid: str, ts: float, prev: Optional[float]) -> bool:
+        """時刻を記録します。今すぐ保存すべきなら True を返します。"""
+        self.stats["bumps"] += 1
+        self.latest.setdefault(gid, {})[cid] = ts
+        key = (gid, cid)
+        last = self.written.setdefault(key, prev or 0.0)
+        if ts - last >= self.interval:
+            self.saved(gid, cid, ts)
+            return True
+        self.pending[key] = ts
+        return False
+
+    def saved(self, gid: str, cid: str, ts: float):
+        """ts までの値が (ジャーナルかタイマー本体として) 保存されたことを記録します。"""
+        key = (gid, cid)
+        self.latest.setdefault(gid, {})[cid] = ts
+        self.written[key] = ts
+        self.pending.pop(key, None)
+        self.stats["writes"] += 1
+
+    def due(self, now: float, everything: bool = False) -> List[tuple]:
+        """保存する時期が来た (everything なら全ての) 未保存分を [(gid, cid, ts)] で返し、保存済みにします。"""
+        out = [(g, c, ts) for (g, c), ts in self.pending.items()
+               if everything or now - self.written.get((g, c), 0.0) >= self.interval]
+        for g, c, ts in out:
+            self.saved(g, c, ts)
+        return out
+
+    def overlay(self, gid: str, guild_timers: Dict[str, Any]) -> Dict[str, Any]:
+        """読み込んだタイマーに、より新しい記録済みの時刻を反映します。"""
+        for cid, ts in self.latest.get(gid, {}).items():
+            t = guild_timers.get(cid)
+            if isinstance(t, TicketTimer) and isinstance(ts, (int, float)) and (t.last_message_at or 0) < ts:
+                t.last_message_at = ts
+        return guild_timers
+
+    def forget(self, gid: str, cid: str):
+        chans = self.latest.get(gid)
+        if chans is not None:
+            chans.pop(cid, None)
+            if not chans:
+                del self.latest[gid]
+        self.pending.pop((gid, cid), None)
+        self.written.pop((gid, cid), None)
+
+class ColdTimers:
+    """
+    稼働中のメッセージが無くなったチケットの置き場 (コールド層)。
+    ファイルは初めて参照した時に読み込み、通常の巡回や集計からは見えません。
+    退避したばかりの分は staged に置き (ジャーナルにも "cold" として記録)、コンパクション時にまとめてファイルへ書きます。
+    """
+    def __init__(self, handler):
+        self.handler = handler
+        self.data: Optional[Dict[str, Any]] = None
+        # {guild_id: {channel_id: TicketTimer (ジャーナル再生直後は dict)}}
+        self.staged: Dict[str, Dict[str, Any]] = {}
+        # 戻した / 削除したチケット。次の保存でファイルから消す
+        self.removed: set = set()
+        # 保存に失敗したギルド (ファイル側のデータには反映済み)
+        self._unsaved: set = set()
+        # guild_id -> {(assignee_id, creator_id): {channel_id: None}}。reuse_channel 用に必要になったら作る
+        self._pairs: Dict[str, Dict[tuple, Dict[str, None]]] = {}
+        # guild_id -> {mirror_thread_id: channel_id}。スレッドからの逆引き用に必要になったら作る
+        self._threads: Dict[str, Dict[int, str]] = {}
+
+    def _loaded(self) -> Dict[str, Any]:
+        if self.data is None:
+            self.data = self.handler.load(decode=lambda gid, gdoc: decode_timers(gdoc))
+            # staged / removed はファイルより新しい
+            for gid, cid in self.removed:
+                g = self.data.get(gid)
+                if g is not None:
+                    g.pop(cid, None)
+        return self.data
+
+    def get(self, gid: str, cid: str) -> Optional[TicketTimer]:
+        g = self.staged.get(gid)
+        t = g.get(cid) if g else None
+        if t is None:
+            if (gid, cid) in self.removed:
+                return None
+            g = self._loaded().get(gid)
+            t = g.get(cid) if g else None
+        if isinstance(t, dict):
+            t = self.staged[gid][cid] = TicketTimer.from_dict(t)
+        return t
+
+    def put(self, gid: str, cid: str, t: TicketTimer):
+        self.staged.setdefault(gid, {})[cid] = t
+        self.removed.discard((gid, cid))
+        pairs = self._pairs.get(gid)
+        if pairs is not None:
+            pairs.setdefault((t.assignee_id, t.creator_id), {})[cid] = None
+        threads = self._threads.get(gid)
+        if threads is not None and t.mirror_thread_id:
+            threads[t.mirror_thread_id] = cid
+
+    def pop(self, gid: str, cid: str) -> Optional[TicketTimer]:
+        t = self.get(gid, cid)
+        self.discard(gid, cid, t)
+        return t
+
+    def discard(self, gid: str, cid: str, t: Optional[TicketTimer] = None):
+        """ファイルを読まずに取り除きます (ファイル側は次の保存で消す)。"""
+        g = self.staged.get(gid)
+        if g is not None and g.pop(cid, None) is not None and not g:
+            del self.staged[gid]
+        self.removed.add((gid, cid))
+        pairs = self._pairs.get(gid)
+        if pairs is not None:
+            for chans in pairs.values():
+                chans.pop(cid, None)
+        threads = self._threads.get(gid)
+        if threads is not None:
+            if t is not None:
+                if threads.get(t.mirror_thread_id) == cid:
+                    del threads[t.mirror_thread_id]
+            else:
+                for tid in [tid for tid, c in threads.items() if c == cid]:
+                    del threads[tid]
+
+    def _each(self, gid: str):
+        merged = dict(self._loaded().get(gid) or {})
+        merged.update(self.staged.get(gid) or {})
+        for cid, t in merged.items():
+            if (gid, cid) in self.removed:
+                continue
+            yield cid, (self.get(gid, cid) if isinstance(t, dict) else t)
+
+    def channels_for(self, gid: str, assignee_id: int, creator_id: int) -> List[str]:
+        pairs = self._pairs.get(gid)
+        if pairs is None:
+            pairs = self._pairs[gid] = {}
+            for cid, t in self._each(gid):
+                pairs.setdefault((t.assignee_id, t.creator_id), {})[cid] = None
+        return list(pairs.get((assignee_id, creator_id), ()))
+
+    def find_by_thread(self, gid: str, thread_id: int) -> Optional[str]:
+        threads = self._threads.get(gid)
+        if threads is None:
+            threads = self._threads[gid] = {t.mirror_thread_id: cid for cid, t in self._each(gid) if t.mirror_thread_id}
+        return threads.get(thread_id)
+
+    def dirty(self) -> bool:
+        return bool(self.staged or self.removed or self._unsaved)
+
+    def _take(self) -> List[str]:
+        """staged / removed をファイル側のデータに反映し、保存するギルドを返します。"""
+        data = self._loaded()
+        gids = set(self.staged) | {gid for gid, _ in self.removed} | self._unsaved
+        for gid, cid in self.removed:
+            g = data.get(gid)
+            if g is not None:
+                g.pop(cid, None)
+        for gid, chans in self.staged.items():
+            g = data.setdefault(gid, {})
+            for cid, t in chans.items():
+                g[cid] = TicketTimer.from_dict(t) if isinstance(t, dict) else t
+        for gid in [gid for gid in gids if gid in data and not data[gid]]:
+            del data[gid]
+        self.staged, self.removed, self._unsaved = {}, set(), set()
+        return list(gids)
+
+    def save(self) -> bool:
+        if not self.dirty():
+            return True
+        gids = self._take()
+        ok = self.handler.save(self.data, keys=gids)
+        if not ok:
+            self._unsaved.update(gids)
+        return ok
+
+    async def save_async(self) -> bool:
+        if not self.dirty():
+            return True
+        gids = self._take()
+        ok = await self.handler.save_async(self.data, keys=gids)
+        if not ok:
+            self._unsaved.update(gids)
+        return ok
@@ -0,0 +1,127 @@
+import os
+import gzip
+import html
+import json
+import shutil
+import asyncio
+import logging
+import tempfile
+from typing import Any, Dict, List, Optional
+import discord
+
+logger = logging.getLogger("utils.transcripts")
+
+# この件数ごとにまとめてファイルへ書き出す (圧縮はスレッドで行う)
+WRITE_BATCH = 200
+
+HTML_HEAD = """<!DOCTYPE html>
+<html lang="ja"><head><meta charset="utf-8"><title>{title}</title>
+<style>
+body{{font-family:sans-serif;background:#313338;color:#dbdee1;margin:0;padding:16px}}
+h1{{font-size:18px}} .m{{padding:6px 0;border-bottom:1px solid #3f4147}}
+.a{{font-weight:bold;color:#f2f3f5}} .t{{color:#949ba4;font-size:12px;margin-left:8px}}
+.c{{white-space:pre-wrap;margin-top:2px}} .e{{border-left:4px solid #5865f2;background:#2b2d31;padding:6px 10px;margin-top:4px}}
+a{{color:#00a8fc}}
+</style></head><body><h1>{title}</h1>
+"""
+HTML_FOOT = "<p class=\"t\">{count} messages</p></body></html>\n"
+
+def message_record(msg) -> Dict[str, Any]:
+    return {
+        "id": msg.id,
+        "author_id": msg.author.id,
+        "author": msg.author.display_name,
+        "bot": msg.author.bot,
+        "created_at": msg.created_at.isoformat(),
+        "edited_at": msg.edited_at.isoformat() if msg.edited_at else None,
+        "content": msg.content,
+        "attachments": [{"filename": a.filename, "url": a.url, "size": a.size} for a in msg.attachments],
+        "embeds": [e.to_dict() for e in msg.embeds],
+        "reference": msg.reference.message_id if msg.reference else None,
+    }
+
+def render_html(rec: Dict[str, Any]) -> str:
+    esc = html.escape
+    parts = [f'<div class="m" id="m{rec["id"]}"><span class="a">{esc(rec["author"])}</span>'
+             f'<span class="t">{esc(rec["created_at"][:19].replace("T", " "))}</span>']
+    if rec["content"]:
+        parts.append(f'<div class="c">{esc(rec["content"])}</div>')
+    for e in rec["embeds"]:
+        title = esc(e.get("title") or "")
+        desc = esc(e.get("description") or "")
+        fields = "".join(f'<div><b>{esc(str(f.get("name", "")))}</b>: {esc(str(f.get("value", "")))}</div>' for f in e.get("fields", []))
+        parts.append(f'<div class="e"><b>{title}</b><div class="c">{desc}</div>{fields}</div>')
+    for a in rec["attachments"]:
+        parts.append(f'<div>📎 <a href="{esc(a["url"])}">{esc(a["filename"])}</a> ({a["size"]} bytes)</div>')
+    parts.append("</div>\n")
+    return "".join(parts)
+
+class TranscriptArchive:
+    """チャンネル履歴の書き出し結果 (一時ディレクトリ内のファイル)。送信後に cleanup() で消してください。"""
+    def __init__(self, directory: str, name: str):
+        self.directory = directory
+        self.jsonl_path = os.path.join(directory, f"{name}.jsonl.gz")
+        self.html_path: Optional[str] = None
+        self.count = 0
+
+    def paths(self) -> List[str]:
+        return [p for p in (self.jsonl_path, self.html_path) if p]
+
+    def size(self) -> int:
+        return sum(os.path.getsize(p) for p in self.paths())
+
+    def to_files(self, limit_bytes: Optional[int] = None) -> List[discord.File]:
+        """アップロード上限に収まる分だけ File にします (HTML から先に諦めます)。"""
+        paths = self.paths()
+        while paths and limit_bytes is not None and sum(os.path.getsize(p) for p in paths) > limit_bytes:
+            paths.pop()
+        return [discord.File(p, filename=os.path.basename(p)) for p in paths]
+
+    def cleanup(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+async def export_transcript(channel, with_html: bool = True) -> TranscriptArchive:
+    """
+    チャンネルの履歴を古い順にページングしながら、gzip 圧縮の JSONL (と任意で HTML) に書き出します。
+    履歴全体はメモリに載せず、WRITE_BATCH 件ごとにファイルへ追記します。
+    """
+    archive = TranscriptArchive(tempfile.mkdtemp(prefix="transcript-"), f"{channel.name}-{channel.id}")
+    gz = gzip.open(archive.jsonl_path, "wt", encoding="utf-8")
+    page = None
+    if with_html:
+        archive.html_path = os.path.join(archive.directory, f"{channel.name}-{channel.id}.html")
+        page = open(archive.html_path, "w", encoding="utf-8")
+        page.write(HTML_HEAD.format(title=html.escape(f"#{channel.name}")))
+
+    def write(lines: List[str], blocks: List[str]):
+        gz.write("".join(lines))
+        if page is not None:
+            page.write("".join(blocks))
+
+    try:
+        lines: List[str] = []
+        blocks: List[str] = []
+        async for msg in channel.history(limit=None, oldest_first=True):
+            rec = message_record(msg)
+            lines.append(json.dumps(rec, ensure_ascii=False) + "\n")
+            if page is not None:
+                blocks.append(render_html(rec))
+            archive.count += 1
+            if len(lines) >= WRITE_BATCH:
+                await asyncio.to_thread(write, lines, blocks)
+                lines, blocks = [], []
+        if lines:
+            await asyncio.to_thread(write, lines, blocks)
+        if page is not None:
+            page.write(HTML_FOOT.format(count=archive.count))
+    except BaseException:
+        gz.close()
+        if page is not None:
+            page.close()
+        archive.cleanup()
+        raise
+    gz.close()
+    if page is not None:
+        page.close()
+    logger.info(f"Exported {archive.count} messages from #{channel.name} ({archive.size()} bytes)")
+    return archive